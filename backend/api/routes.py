@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
-from typing import List
+from fastapi import APIRouter, HTTPException, UploadFile, File, Header
+from fastapi.responses import FileResponse, JSONResponse, Response
+from datetime import datetime
+from typing import Dict, List, Optional
 import tempfile
 import os
 import subprocess
@@ -11,16 +12,97 @@ from models import (
     ProxyStatus, HTTPMethod, FileDownloadConfig,
     FileDownloadCreateRequest, FileDownloadUpdateRequest,
     RequestMappingConfig, RequestMappingCreateRequest, RequestMappingUpdateRequest,
-    CapturedFlow
+    CapturedFlow, RuleHitStats, APIConfigWithHits, FileDownloadConfigWithHits,
+    RequestMappingConfigWithHits, ConfigChange, BatchOp, BatchRequest, BatchResponse
 )
 from services.mitmproxy_service import MitmProxyService
 from services.config_service import ConfigService
 from services.capture_service import get_capture_service
+from services.rule_hits_service import get_rule_hits_service
+from services.rule_list_service import RuleListService
 
 router = APIRouter()
 mitmproxy_service = MitmProxyService()
 config_service = ConfigService()
 capture_service = get_capture_service()
+rule_hits_service = get_rule_hits_service()
+rule_list_service = RuleListService(config_service, rule_hits_service)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含当前ETag（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+
+def list_rules(kind: str, if_none_match: Optional[str], **params) -> Response:
+    """查询规则列表，配置和命中统计都没有变化时返回304
+
+    分页时下一页的游标在 X-Next-Cursor 响应头中，过滤后的总数在 X-Total-Count 中。
+    Cache-Control: no-cache 让浏览器每次用ETag重新验证，列表没有变化时不再重新下载。
+    """
+    etag = rule_list_service.etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        page = rule_list_service.query(kind, **params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers["ETag"] = page.etag
+    headers["X-Total-Count"] = str(page.total)
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+    return JSONResponse(content=page.items, headers=headers)
+
+
+# 批量操作中各规则类型的创建请求模型和配置模型
+BATCH_MODELS = {
+    "apis": (APICreateRequest, APIConfig),
+    "file_downloads": (FileDownloadCreateRequest, FileDownloadConfig),
+    "request_mappings": (RequestMappingCreateRequest, RequestMappingConfig),
+}
+
+
+def run_batch(kind: str, request: BatchRequest) -> BatchResponse:
+    """校验整批操作的内容后在一个事务中执行，任何一项无效时整批不执行并返回400"""
+    create_model, config_model = BATCH_MODELS[kind]
+    operations = []
+    results = []
+    for i, operation in enumerate(request.operations):
+        item = None
+        item_id = operation.id
+        error = None
+        try:
+            if operation.op in (BatchOp.CREATE, BatchOp.UPSERT):
+                if operation.data is None:
+                    raise ValueError("缺少data")
+                fields = create_model(**operation.data).dict(exclude_none=True)
+                if item_id is not None:
+                    fields["id"] = item_id
+                if operation.enabled is not None:
+                    fields["enabled"] = operation.enabled
+                # 没有指定ID时 item_id 保持为None，规则使用模型生成的ID
+                item = config_model(**fields).dict()
+            elif item_id is None:
+                raise ValueError("缺少id")
+        except Exception as e:
+            error = str(e)
+        operations.append((operation.op.value, item_id, item, operation.enabled))
+        results.append({"index": i, "op": operation.op, "id": item_id, "success": error is None, "error": error})
+
+    if not any(result["error"] for result in results):
+        applied, results = config_service.apply_batch(kind, operations)
+    else:
+        applied = False
+    response = BatchResponse(success=applied, applied=len(operations) if applied else 0, results=results)
+    if not applied:
+        raise HTTPException(status_code=400, detail=response.dict())
+    return response
 
 
 # MitmProxy 控制相关API
@@ -31,9 +113,11 @@ async def get_proxy_status():
 
 
 @router.post("/proxy/start")
-async def start_proxy():
-    """启动代理"""
-    success = mitmproxy_service.start()
+async def start_proxy(workers: Optional[int] = None):
+    """启动代理，workers大于1时启动多个mitmdump worker"""
+    if workers is not None and workers < 1:
+        raise HTTPException(status_code=400, detail="workers必须大于0")
+    success = mitmproxy_service.start(workers)
     if success:
         return {"message": "代理启动成功", "success": True}
     else:
@@ -81,10 +165,14 @@ async def stop_proxy():
 
 
 # API配置管理相关API
-@router.get("/apis", response_model=List[APIConfig])
-async def get_all_apis():
-    """获取所有API配置"""
-    return config_service.get_all_apis()
+@router.get("/apis", response_model=List[APIConfigWithHits])
+async def get_all_apis(q: Optional[str] = None, method: Optional[str] = None, enabled: Optional[bool] = None,
+                       sort: Optional[str] = None, min_hits: Optional[int] = None, max_hits: Optional[int] = None,
+                       limit: Optional[int] = None, cursor: Optional[str] = None, view: str = "full",
+                       if_none_match: Optional[str] = Header(None)):
+    """获取API配置及命中统计，支持搜索名称和URL、按方法和状态过滤、排序、游标分页和摘要视图"""
+    return list_rules("apis", if_none_match, q=q, method=method, enabled=enabled, sort=sort,
+                      min_hits=min_hits, max_hits=max_hits, limit=limit, cursor=cursor, view=view)
 
 
 @router.get("/apis/{api_id}", response_model=APIConfig)
@@ -103,6 +191,8 @@ async def create_api(api_request: APICreateRequest):
         name=api_request.name,
         url=api_request.url,
         method=api_request.method,
+        body_match=api_request.body_match,
+        network=api_request.network,
         response=api_request.response or ResponseData()
     )
 
@@ -164,6 +254,12 @@ async def batch_toggle_apis(request: dict):
         raise HTTPException(status_code=500, detail="批量操作失败")
 
 
+@router.post("/apis/batch", response_model=BatchResponse)
+async def batch_apis(request: BatchRequest):
+    """批量创建、更新、删除和切换API配置，整批校验后一次写入"""
+    return run_batch("apis", request)
+
+
 # 配置导入导出相关API
 @router.get("/config/export")
 async def export_config():
@@ -202,7 +298,34 @@ async def import_config(file: UploadFile = File(...)):
         os.unlink(temp_file.name)
 
 
+@router.get("/config/history", response_model=List[ConfigChange])
+def get_config_history(limit: int = 100):
+    """获取最近的配置修改记录（从新到旧）
+
+    先写入尚未保存的修改（可能阻塞在推送配置上），用普通函数在线程池中执行，不阻塞事件循环
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit必须大于0")
+    return config_service.get_history(limit)
+
+
+@router.post("/config/restore")
+def restore_config(at: datetime):
+    """把配置恢复到指定时间点（ISO时间或Unix时间戳），同样在线程池中执行"""
+    try:
+        config_service.restore(at.timestamp())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "配置已恢复", "success": True}
+
+
 # 获取HTTP方法列表
+@router.get("/rule-hits", response_model=Dict[str, Dict[str, RuleHitStats]])
+async def get_rule_hits():
+    """获取所有规则的命中统计（按规则类型和规则ID）"""
+    return rule_hits_service.load_hits()
+
+
 @router.get("/methods")
 async def get_http_methods():
     """获取支持的HTTP方法列表"""
@@ -210,10 +333,15 @@ async def get_http_methods():
 
 
 # 文件下载管理相关API
-@router.get("/file-downloads", response_model=List[FileDownloadConfig])
-async def get_all_file_downloads():
-    """获取所有文件下载配置"""
-    return config_service.get_all_file_downloads()
+@router.get("/file-downloads", response_model=List[FileDownloadConfigWithHits])
+async def get_all_file_downloads(q: Optional[str] = None, enabled: Optional[bool] = None,
+                                 sort: Optional[str] = None, min_hits: Optional[int] = None,
+                                 max_hits: Optional[int] = None, limit: Optional[int] = None,
+                                 cursor: Optional[str] = None, view: str = "full",
+                                 if_none_match: Optional[str] = Header(None)):
+    """获取文件下载配置及命中统计，支持搜索、过滤、排序、游标分页和摘要视图"""
+    return list_rules("file_downloads", if_none_match, q=q, enabled=enabled, sort=sort,
+                      min_hits=min_hits, max_hits=max_hits, limit=limit, cursor=cursor, view=view)
 
 
 @router.get("/file-downloads/{download_id}", response_model=FileDownloadConfig)
@@ -232,7 +360,8 @@ async def create_file_download(download_request: FileDownloadCreateRequest):
         name=download_request.name,
         url_pattern=download_request.url_pattern,
         local_file_path=download_request.local_file_path,
-        content_type=download_request.content_type
+        content_type=download_request.content_type,
+        network=download_request.network
     )
 
     success = config_service.add_file_download(download)
@@ -281,11 +410,22 @@ async def toggle_file_download_status(download_id: str):
         raise HTTPException(status_code=404, detail="文件下载配置不存在")
 
 
+@router.post("/file-downloads/batch", response_model=BatchResponse)
+async def batch_file_downloads(request: BatchRequest):
+    """批量创建、更新、删除和切换文件下载配置，整批校验后一次写入"""
+    return run_batch("file_downloads", request)
+
+
 # 请求映射管理相关API
-@router.get("/request-mappings", response_model=List[RequestMappingConfig])
-async def get_all_request_mappings():
-    """获取所有请求映射配置"""
-    return config_service.get_all_request_mappings()
+@router.get("/request-mappings", response_model=List[RequestMappingConfigWithHits])
+async def get_all_request_mappings(q: Optional[str] = None, method: Optional[str] = None,
+                                   enabled: Optional[bool] = None, sort: Optional[str] = None,
+                                   min_hits: Optional[int] = None, max_hits: Optional[int] = None,
+                                   limit: Optional[int] = None, cursor: Optional[str] = None,
+                                   view: str = "full", if_none_match: Optional[str] = Header(None)):
+    """获取请求映射配置及命中统计，支持搜索、按方法和状态过滤、排序、游标分页和摘要视图"""
+    return list_rules("request_mappings", if_none_match, q=q, method=method, enabled=enabled, sort=sort,
+                      min_hits=min_hits, max_hits=max_hits, limit=limit, cursor=cursor, view=view)
 
 
 @router.get("/request-mappings/{mapping_id}", response_model=RequestMappingConfig)
@@ -305,7 +445,8 @@ async def create_request_mapping(mapping_request: RequestMappingCreateRequest):
         url_pattern=mapping_request.url_pattern,
         target_host=mapping_request.target_host,
         target_port=mapping_request.target_port,
-        methods=mapping_request.methods
+        methods=mapping_request.methods,
+        network=mapping_request.network
     )
 
     success = config_service.add_request_mapping(mapping)
@@ -354,6 +495,12 @@ async def toggle_request_mapping_status(mapping_id: str):
         raise HTTPException(status_code=404, detail="请求映射配置不存在")
 
 
+@router.post("/request-mappings/batch", response_model=BatchResponse)
+async def batch_request_mappings(request: BatchRequest):
+    """批量创建、更新、删除和切换请求映射配置，整批校验后一次写入"""
+    return run_batch("request_mappings", request)
+
+
 # ADB设备管理相关API
 @router.get("/adb/devices")
 async def get_adb_devices():
@@ -476,6 +623,21 @@ async def search_captures(q: str, limit: int = 100):
     return capture_service.search_flows(q, limit=limit)
 
 
+@router.get("/captures/segments")
+async def list_capture_segments():
+    """获取已封存的抓包分段列表"""
+    return capture_service.list_segments()
+
+
+@router.get("/captures/segments/{segment_name}", response_model=List[CapturedFlow])
+async def get_capture_segment(segment_name: str, limit: int = 100, offset: int = 0):
+    """读取已封存分段中的抓包数据"""
+    try:
+        return capture_service.read_segment(segment_name, limit=limit, offset=offset)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="抓包分段不存在")
+
+
 @router.get("/captures/{flow_id}", response_model=CapturedFlow)
 async def get_capture(flow_id: str):
     """获取指定抓包数据详情"""
@@ -1,13 +1,15 @@
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 import os
 import asyncio
 import json
-from typing import List
+from typing import Dict, List
 
-from api.routes import router as api_router
+from api.routes import router as api_router, config_service
+from services.capture_service import get_capture_service
+from services.metrics_service import get_metrics_service
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -20,8 +22,9 @@ app = FastAPI(
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
-        self.capture_file = "./data/realtime_capture.json"
-        self.last_position = 0  # 记录上次读取的文件位置
+        self.capture_service = get_capture_service()
+        # 正在跟踪的抓包文件：路径 -> [文件句柄, 尚未读到换行符的不完整行]
+        self._tails: Dict[str, list] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -37,34 +40,72 @@ class ConnectionManager:
             except:
                 pass
 
+    def _read_new_lines(self) -> List[bytes]:
+        """读取各个抓包文件新增的完整行
+
+        多worker模式下每个worker写自己的抓包文件，分别跟踪。
+        """
+        lines = []
+        active_files = self.capture_service.get_active_capture_files()
+        for active_file in active_files:
+            lines.extend(self._read_file_lines(active_file))
+
+        # 不再使用的文件（如worker数量减少后）关闭句柄
+        for stale_file in set(self._tails) - set(active_files):
+            self._tails.pop(stale_file)[0].close()
+        return lines
+
+    def _read_file_lines(self, active_file: str) -> List[bytes]:
+        """读取一个抓包文件新增的完整行
+
+        保持文件句柄打开，活动文件被轮转（移动到分段目录）后先读完旧文件
+        剩余的内容，再切换到清单中新的活动文件。
+        """
+        tail = self._tails.get(active_file)
+        if tail is None:
+            try:
+                tail = self._tails[active_file] = [open(active_file, 'rb'), b'']
+            except FileNotFoundError:
+                return []
+        tail_file = tail[0]
+
+        # 文件被清空或重建，重置位置
+        if os.fstat(tail_file.fileno()).st_size < tail_file.tell():
+            tail_file.seek(0)
+            tail[1] = b''
+
+        # 先判断是否已轮转再读取：轮转时写入方已关闭旧文件，此时读到文件末尾就是
+        # 旧文件的全部内容，不会漏掉读取之后、轮转之前写入的行
+        try:
+            rotated = os.stat(active_file).st_ino != os.fstat(tail_file.fileno()).st_ino
+        except FileNotFoundError:
+            # 旧文件已移走、新文件还没创建
+            rotated = True
+
+        data = tail[1] + tail_file.read()
+        lines = data.split(b'\n')
+        tail[1] = lines.pop()
+
+        # 活动文件已轮转，输出旧文件剩余的内容后关闭，下次从新文件开头读取
+        if rotated:
+            if tail[1]:
+                lines.append(tail[1])
+            tail_file.close()
+            del self._tails[active_file]
+        return lines
+
     async def monitor_captures(self):
         """监控抓包文件变化（JSONL格式）"""
         while True:
             try:
-                if os.path.exists(self.capture_file):
-                    current_size = os.path.getsize(self.capture_file)
-
-                    # 如果文件大小变化，说明有新数据
-                    if current_size > self.last_position:
-                        with open(self.capture_file, 'r', encoding='utf-8') as f:
-                            # 移动到上次读取的位置
-                            f.seek(self.last_position)
-
-                            # 读取新增的行
-                            for line in f:
-                                line = line.strip()
-                                if line:  # 跳过空行
-                                    try:
-                                        data = json.loads(line)
-                                        await self.broadcast({"type": "new_capture", "data": data})
-                                    except json.JSONDecodeError as e:
-                                        print(f"解析JSON行失败: {e}, 行内容: {line[:100]}")
-
-                            # 更新位置
-                            self.last_position = f.tell()
-                    elif current_size < self.last_position:
-                        # 文件被清空或重建，重置位置
-                        self.last_position = 0
+                for line in self._read_new_lines():
+                    line = line.strip()
+                    if line:  # 跳过空行
+                        try:
+                            data = json.loads(line)
+                            await self.broadcast({"type": "new_capture", "data": data})
+                        except json.JSONDecodeError as e:
+                            print(f"解析JSON行失败: {e}, 行内容: {line[:100]}")
             except Exception as e:
                 print(f"监控抓包文件错误: {e}")
                 import traceback
@@ -92,6 +133,12 @@ async def health_check():
     """健康检查"""
     return {"status": "ok", "message": "MitmProxy Manager is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """代理指标（Prometheus文本格式）"""
+    content = get_metrics_service().render_prometheus()
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.websocket("/ws/captures")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket端点，用于实时推送抓包数据"""
@@ -108,6 +155,11 @@ async def startup_event():
     """应用启动时启动监控任务"""
     asyncio.create_task(manager.monitor_captures())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用退出前写入尚未保存的配置修改"""
+    config_service.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
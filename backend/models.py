@@ -16,6 +16,23 @@ class ResponseData(BaseModel):
     status: int = Field(default=200, ge=100, le=599)
     headers: Dict[str, str] = Field(default_factory=lambda: {"Content-Type": "application/json"})
     body: Any = Field(default_factory=dict)
+    template: bool = False  # 响应体中的字符串按Jinja2模板渲染
+
+class BodyMatchType(str, Enum):
+    GRAPHQL_OPERATION = "graphql_operation"  # GraphQL的operationName
+    JSON_POINTER = "json_pointer"  # JSON指针指向的值
+    BODY = "body"  # 规范化后的请求体与value相同
+    BODY_HASH = "body_hash"  # 规范化请求体的SHA-256
+
+class BodyMatch(BaseModel):
+    type: BodyMatchType
+    pointer: Optional[str] = None  # json_pointer 使用，如 /method 或 /params/0/id
+    value: Any = None
+
+class NetworkCondition(BaseModel):
+    latency_ms: float = Field(default=0, ge=0)  # 返回响应前的固定延迟（毫秒）
+    jitter_ms: float = Field(default=0, ge=0)  # 延迟的随机抖动范围（毫秒）
+    bandwidth_kbps: float = Field(default=0, ge=0)  # 响应体发送速率上限（千比特/秒），0表示不限速
 
 class FileDownloadConfig(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -23,35 +40,97 @@ class FileDownloadConfig(BaseModel):
     url_pattern: str = Field(..., min_length=1)
     local_file_path: str = Field(..., min_length=1)
     content_type: Optional[str] = None
+    network: Optional[NetworkCondition] = None
     enabled: bool = True
 
 class APIConfig(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str = Field(..., min_length=1, max_length=100)
-    url: str = Field(..., min_length=1)
+    url: str = Field(..., min_length=1)  # 支持路径模板 /users/{id}、通配 * / ** 和查询条件 ??type=admin
     method: HTTPMethod = HTTPMethod.GET
+    body_match: Optional[BodyMatch] = None  # 按请求体区分同一URL下的多个Mock
+    network: Optional[NetworkCondition] = None
     enabled: bool = True
     response: ResponseData = Field(default_factory=ResponseData)
 
+class RuleHitStats(BaseModel):
+    hits: int = 0  # 代理命中该规则的次数
+    last_hit: Optional[float] = None  # 最后命中时间（Unix时间戳）
+
+class APIConfigWithHits(APIConfig, RuleHitStats):
+    pass
+
+class FileDownloadConfigWithHits(FileDownloadConfig, RuleHitStats):
+    pass
+
 class APIConfigList(BaseModel):
     apis: List[APIConfig] = Field(default_factory=list)
 
+class BatchOp(str, Enum):
+    CREATE = "create"
+    UPSERT = "upsert"
+    DELETE = "delete"
+    TOGGLE = "toggle"
+
+class BatchOperation(BaseModel):
+    op: BatchOp
+    id: Optional[str] = None  # upsert/delete/toggle 的规则ID，create 时可指定新规则的ID
+    data: Optional[Dict[str, Any]] = None  # create/upsert 的规则内容，字段与创建接口相同
+    enabled: Optional[bool] = None  # toggle 时省略则取反；create/upsert 时省略则为启用或保留原状态
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=10000)
+
+class BatchItemResult(BaseModel):
+    index: int
+    op: BatchOp
+    id: Optional[str] = None
+    success: bool
+    status: Optional[str] = None  # created / updated / deleted / toggled
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    success: bool
+    applied: int  # 执行的操作数，校验失败时为0
+    results: List[BatchItemResult]
+
+class ConfigChange(BaseModel):
+    ts: float  # 修改时间（Unix时间戳）
+    version: int  # 写入该修改的配置版本
+    op: str  # create / update / delete / toggle
+    kind: str  # apis / file_downloads / request_mappings
+    id: str
+    name: Optional[str] = None  # create / update 时的规则名称
+    enabled: Optional[bool] = None  # toggle 后的启用状态
+    front: bool = False  # 新增的规则是否放在列表最前面
+
+class WorkerStatus(BaseModel):
+    id: str = ""  # 单进程模式为空
+    port: int
+    pid: Optional[int] = None
+    running: bool = False
+
 class ProxyStatus(BaseModel):
     running: bool
     ip: Optional[str] = None
     port: int = 8080
-    pid: Optional[int] = None
+    pid: Optional[int] = None  # 多worker模式下为分发器的PID
+    workers: List[WorkerStatus] = Field(default_factory=list)
 
 class APICreateRequest(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     url: str = Field(..., min_length=1)
     method: HTTPMethod = HTTPMethod.GET
+    body_match: Optional[BodyMatch] = None
+    network: Optional[NetworkCondition] = None
     response: Optional[ResponseData] = None
 
 class APIUpdateRequest(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     url: Optional[str] = Field(None, min_length=1)
     method: Optional[HTTPMethod] = None
+    body_match: Optional[BodyMatch] = None
+    network: Optional[NetworkCondition] = None
     enabled: Optional[bool] = None
     response: Optional[ResponseData] = None
 
@@ -60,12 +139,14 @@ class FileDownloadCreateRequest(BaseModel):
     url_pattern: str = Field(..., min_length=1)
     local_file_path: str = Field(..., min_length=1)
     content_type: Optional[str] = None
+    network: Optional[NetworkCondition] = None
 
 class FileDownloadUpdateRequest(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     url_pattern: Optional[str] = Field(None, min_length=1)
     local_file_path: Optional[str] = Field(None, min_length=1)
     content_type: Optional[str] = None
+    network: Optional[NetworkCondition] = None
     enabled: Optional[bool] = None
 
 class RequestMappingConfig(BaseModel):
@@ -75,14 +156,19 @@ class RequestMappingConfig(BaseModel):
     target_host: str = Field(default="localhost")
     target_port: int = Field(..., ge=1, le=65535)
     methods: List[HTTPMethod] = Field(default_factory=lambda: [HTTPMethod.GET, HTTPMethod.POST])
+    network: Optional[NetworkCondition] = None
     enabled: bool = True
 
+class RequestMappingConfigWithHits(RequestMappingConfig, RuleHitStats):
+    pass
+
 class RequestMappingCreateRequest(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     url_pattern: str = Field(..., min_length=1)
     target_host: str = Field(default="localhost")
     target_port: int = Field(..., ge=1, le=65535)
     methods: List[HTTPMethod] = Field(default_factory=lambda: [HTTPMethod.GET, HTTPMethod.POST])
+    network: Optional[NetworkCondition] = None
 
 class RequestMappingUpdateRequest(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
@@ -90,6 +176,7 @@ class RequestMappingUpdateRequest(BaseModel):
     target_host: Optional[str] = None
     target_port: Optional[int] = Field(None, ge=1, le=65535)
     methods: Optional[List[HTTPMethod]] = None
+    network: Optional[NetworkCondition] = None
     enabled: Optional[bool] = None
 
 class CapturedRequest(BaseModel):
@@ -103,6 +190,7 @@ class CapturedRequest(BaseModel):
     headers: Dict[str, str]
     query_params: str = ""
     request_body: str = ""
+    request_body_info: Optional[Dict[str, Any]] = None  # 记录方式（完整/截断/二进制/哈希/省略）
     request_size: int = 0
 
 class CapturedResponse(BaseModel):
@@ -110,6 +198,7 @@ class CapturedResponse(BaseModel):
     status_code: int
     headers: Dict[str, str]
     response_body: str = ""
+    response_body_info: Optional[Dict[str, Any]] = None  # 记录方式（完整/截断/二进制/哈希/省略）
     response_size: int = 0
     duration: float = 0  # 响应时间（毫秒）
 
@@ -118,4 +207,6 @@ class CapturedFlow(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     timestamp: float
     request: CapturedRequest
-    response: Optional[CapturedResponse] = None
\ No newline at end of file
+    response: Optional[CapturedResponse] = None
+    error: Optional[str] = None  # 请求失败时的错误信息
+    timings: Optional[Dict[str, float]] = None  # 各阶段耗时（毫秒）
\ No newline at end of file
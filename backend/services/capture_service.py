@@ -1,10 +1,18 @@
+import glob
+import gzip
 import json
 import os
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from collections import deque
 from models import CapturedFlow
 import time
 
+# mitmproxy插件实时写入的抓包文件及其分段清单
+REALTIME_CAPTURE_FILE = "./data/realtime_capture.json"
+REALTIME_MANIFEST_FILE = "./data/realtime_capture.manifest.json"
+# 多worker模式下各worker的清单，如 ./data/realtime_capture.w1.manifest.json
+REALTIME_MANIFEST_PATTERN = "./data/realtime_capture*.manifest.json"
+
 
 class CaptureService:
     """抓包数据管理服务"""
@@ -79,6 +87,78 @@ class CaptureService:
             return result[:limit]
         return result
 
+    def load_manifests(self) -> List[dict]:
+        """读取实时抓包的分段清单
+
+        多worker模式下每个worker有自己的清单（如 realtime_capture.w1.manifest.json），
+        默认清单不存在时返回只有活动文件的清单。
+        """
+        manifest_files = glob.glob(REALTIME_MANIFEST_PATTERN)
+        if REALTIME_MANIFEST_FILE not in manifest_files:
+            manifest_files.insert(0, REALTIME_MANIFEST_FILE)
+
+        manifests = []
+        for manifest_file in sorted(manifest_files):
+            try:
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+            except (OSError, ValueError):
+                if manifest_file == REALTIME_MANIFEST_FILE:
+                    manifests.append({'active': os.path.basename(REALTIME_CAPTURE_FILE), 'segments': []})
+        return manifests
+
+    def _resolve_manifest_path(self, relative_path: str) -> str:
+        return os.path.join(os.path.dirname(REALTIME_MANIFEST_FILE), relative_path)
+
+    def get_active_capture_files(self) -> List[str]:
+        """获取当前正在写入的抓包文件路径（每个worker一个）"""
+        return [
+            self._resolve_manifest_path(manifest.get('active') or os.path.basename(REALTIME_CAPTURE_FILE))
+            for manifest in self.load_manifests()
+        ]
+
+    def _all_segments(self) -> List[dict]:
+        return [segment for manifest in self.load_manifests() for segment in manifest.get('segments', [])]
+
+    def list_segments(self) -> List[dict]:
+        """列出已封存的抓包分段（最新的在前面）"""
+        segments = []
+        for segment in self._all_segments():
+            if os.path.exists(self._resolve_manifest_path(segment['file'])):
+                segments.append(dict(segment, name=os.path.basename(segment['file'])))
+        segments.sort(key=lambda segment: segment.get('sealed_at', 0), reverse=True)
+        return segments
+
+    def iter_segment_records(self, name: str) -> Iterator[dict]:
+        """逐行读取指定分段中的抓包记录（支持gzip压缩的分段）"""
+        for segment in self._all_segments():
+            if os.path.basename(segment['file']) != name:
+                continue
+            path = self._resolve_manifest_path(segment['file'])
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+            return
+        raise FileNotFoundError(name)
+
+    def read_segment(self, name: str, limit: Optional[int] = None, offset: int = 0) -> List[CapturedFlow]:
+        """读取已封存分段中的抓包数据（支持分页）"""
+        flows = []
+        for index, record in enumerate(self.iter_segment_records(name)):
+            if index < offset:
+                continue
+            if limit and len(flows) >= limit:
+                break
+            flows.append(CapturedFlow(**record))
+        return flows
+
     def get_flow_by_id(self, flow_id: str) -> Optional[CapturedFlow]:
         """根据ID获取抓包数据"""
         for flow in self.flows:
@@ -94,12 +174,18 @@ class CaptureService:
             if os.path.exists(self.capture_file):
                 os.remove(self.capture_file)
 
+            # 删除已封存的分段，插件下次更新清单时会移除它们
+            for segment in self._all_segments():
+                segment_path = self._resolve_manifest_path(segment['file'])
+                if os.path.exists(segment_path):
+                    os.remove(segment_path)
+
             # 清空实时抓包文件
-            realtime_file = "./data/realtime_capture.json"
-            if os.path.exists(realtime_file):
-                # 清空文件内容（而不是删除文件）
-                with open(realtime_file, 'w', encoding='utf-8') as f:
-                    f.write('')
+            for realtime_file in self.get_active_capture_files():
+                if os.path.exists(realtime_file):
+                    # 清空文件内容（而不是删除文件）
+                    with open(realtime_file, 'w', encoding='utf-8') as f:
+                        f.write('')
         except Exception as e:
             print(f"清空抓包数据失败: {e}")
 
@@ -0,0 +1,224 @@
+import glob
+import json
+import os
+import re
+import threading
+from typing import Callable, List, Optional, Tuple
+
+# 变更日志目录：snapshot.{版本}.json 为完整配置快照，journal.{版本}.jsonl 为该快照之后的逐条修改
+JOURNAL_DIR = "data/config_journal"
+
+# 日志段超过该大小（且不小于快照大小）时压缩为新的快照
+MIN_COMPACT_BYTES = 1024 * 1024
+
+# 保留的快照（及其后的日志段）个数，决定可以恢复到多早的时间点
+JOURNAL_RETENTION = 5
+
+# 修改类型
+OP_CREATE = "create"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+OP_TOGGLE = "toggle"
+
+_FILE_RE = re.compile(r"^(snapshot|journal)\.(\d+)\.(json|jsonl)$")
+_SNAPSHOT_TS_RE = re.compile(r'\{"ts":([-+.\deE]+),')
+
+
+def make_entry(ts: float, op: str, kind: str, item_id: str, item: Optional[dict] = None,
+               enabled: Optional[bool] = None, front: bool = False) -> dict:
+    """构建一条修改记录，create/update 带完整规则，toggle 只带新的启用状态"""
+    entry = {"ts": ts, "op": op, "kind": kind, "id": item_id}
+    if item is not None:
+        entry["item"] = item
+    if enabled is not None:
+        entry["enabled"] = enabled
+    if front:
+        entry["front"] = True
+    return entry
+
+
+def apply_entry(config: dict, entry: dict):
+    """把一条修改记录应用到配置字典上（用于按时间点恢复）"""
+    items = config.setdefault(entry["kind"], [])
+    item_id = entry["id"]
+    op = entry["op"]
+    if op == OP_CREATE:
+        # 覆盖同一规则时（如添加相同URL和方法的API）先移除原来的
+        items[:] = [item for item in items if item.get("id") != item_id]
+        if entry.get("front"):
+            items.insert(0, entry["item"])
+        else:
+            items.append(entry["item"])
+    elif op == OP_DELETE:
+        items[:] = [item for item in items if item.get("id") != item_id]
+    else:
+        for i, item in enumerate(items):
+            if item.get("id") != item_id:
+                continue
+            if op == OP_UPDATE:
+                items[i] = entry["item"]
+            elif op == OP_TOGGLE:
+                item["enabled"] = entry["enabled"]
+            break
+
+
+class ConfigJournal:
+    """只追加的配置变更日志
+
+    每次写入只追加本次的修改记录，写入量与修改大小成正比。日志段超过
+    max(MIN_COMPACT_BYTES, 快照大小) 时把当前完整配置写成新快照并开始新的日志段，
+    压缩的开销摊到之前追加的记录上。按时间点恢复时从该时间点之前最近的快照开始
+    重放日志。
+    """
+
+    def __init__(self, journal_dir: str = JOURNAL_DIR, min_compact_bytes: int = MIN_COMPACT_BYTES,
+                 retention: int = JOURNAL_RETENTION):
+        self.journal_dir = journal_dir
+        self.min_compact_bytes = min_compact_bytes
+        self.retention = max(1, retention)
+        self._lock = threading.Lock()
+        self._segment = None
+        self._segment_bytes = 0
+        self._snapshot_bytes = 0
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def _path(self, prefix: str, version: int) -> str:
+        ext = "json" if prefix == "snapshot" else "jsonl"
+        return os.path.join(self.journal_dir, f"{prefix}.{version:010d}.{ext}")
+
+    def _list(self, prefix: str) -> List[Tuple[int, str]]:
+        """按版本从旧到新列出快照或日志段"""
+        files = []
+        for path in glob.glob(os.path.join(self.journal_dir, f"{prefix}.*")):
+            match = _FILE_RE.match(os.path.basename(path))
+            if match and match.group(1) == prefix:
+                files.append((int(match.group(2)), path))
+        files.sort()
+        return files
+
+    def open(self, config_data: Callable[[], str], version: int, ts: float):
+        """打开最新的日志段，还没有快照时先用当前配置（config_data() 的返回值）写一个"""
+        with self._lock:
+            snapshots = self._list("snapshot")
+            if not snapshots:
+                self._write_snapshot(config_data(), version, ts)
+                return
+            snapshot_version, snapshot_path = snapshots[-1]
+            self._snapshot_bytes = os.path.getsize(snapshot_path)
+            self._open_segment(snapshot_version)
+
+    def _open_segment(self, version: int):
+        if self._segment is not None:
+            self._segment.close()
+        path = self._path("journal", version)
+        self._segment = open(path, 'a', encoding='utf-8')
+        self._segment_bytes = self._segment.tell()
+
+    def append(self, entries: List[dict], version: int):
+        """追加一批修改记录（同一次写入的记录使用相同的配置版本）"""
+        if not entries:
+            return
+        lines = "".join(
+            json.dumps({**entry, "version": version}, ensure_ascii=False, separators=(',', ':')) + "\n"
+            for entry in entries
+        )
+        with self._lock:
+            self._segment.write(lines)
+            self._segment.flush()
+            self._segment_bytes += len(lines.encode('utf-8'))
+
+    def should_compact(self) -> bool:
+        with self._lock:
+            return self._segment_bytes >= max(self.min_compact_bytes, self._snapshot_bytes)
+
+    def compact(self, config_data: str, version: int, ts: float):
+        """把当前完整配置写成新快照，之后的修改写入新的日志段"""
+        with self._lock:
+            self._write_snapshot(config_data, version, ts)
+
+    def _write_snapshot(self, config_data: str, version: int, ts: float):
+        path = self._path("snapshot", version)
+        content = '{"ts":' + json.dumps(ts) + ',"version":' + str(version) + ',"config":' + config_data + '}'
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_file, path)
+        self._snapshot_bytes = len(content.encode('utf-8'))
+        self._open_segment(version)
+        self._cleanup()
+
+    def _cleanup(self):
+        """只保留最近 retention 个快照，以及它们之后的日志段"""
+        snapshots = self._list("snapshot")
+        if len(snapshots) <= self.retention:
+            return
+        oldest_kept = snapshots[-self.retention][0]
+        for prefix in ("snapshot", "journal"):
+            for version, path in self._list(prefix):
+                if version < oldest_kept:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        print(f"清理变更日志失败: {e}")
+
+    def _read_segment(self, path: str):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # 进程中断时最后一行可能不完整
+                        continue
+        except FileNotFoundError:
+            return
+
+    def config_at(self, ts: float) -> dict:
+        """重建指定时间点（Unix时间戳）的配置，早于保留的最早快照时抛出 ValueError"""
+        with self._lock:
+            snapshots = self._list("snapshot")
+        snapshot = None
+        for version, path in reversed(snapshots):
+            # 快照以 {"ts":时间戳, 开头，只读开头判断时间，不解析整个快照
+            with open(path, 'r', encoding='utf-8') as f:
+                match = _SNAPSHOT_TS_RE.match(f.read(64))
+            if match and float(match.group(1)) <= ts:
+                snapshot = (version, path)
+                break
+        if snapshot is None:
+            raise ValueError("变更日志中没有该时间点之前的快照")
+
+        version, path = snapshot
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)["config"]
+        for entry in self._read_segment(self._path("journal", version)):
+            if entry["ts"] > ts:
+                break
+            apply_entry(config, entry)
+        return config
+
+    def history(self, limit: int = 100) -> List[dict]:
+        """最近的修改记录（从新到旧），不包含规则内容"""
+        with self._lock:
+            segments = self._list("journal")
+        result: List[dict] = []
+        for _, path in reversed(segments):
+            entries = []
+            for entry in self._read_segment(path):
+                item = entry.pop("item", None)
+                if item is not None:
+                    entry["name"] = item.get("name")
+                entries.append(entry)
+            result.extend(reversed(entries))
+            if len(result) >= limit:
+                break
+        return result[:limit]
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
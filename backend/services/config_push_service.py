@@ -0,0 +1,114 @@
+import glob
+import json
+import os
+import socket
+import threading
+from typing import List, Optional, Tuple
+
+import psutil
+
+# mitmproxy插件写入的推送通道地址（多worker模式下为 mock_control.w1.json 等）
+CONTROL_FILE_PATTERN = "./data/mock_control*.json"
+
+PUSH_TIMEOUT = 10.0
+
+
+class ConfigPushService:
+    """把配置快照推送给正在运行的mitmproxy插件
+
+    每个插件进程（多worker模式下每个worker）在本机监听一个端口，地址和令牌
+    写在控制文件中。推送失败不影响保存，插件仍会通过监听配置文件拿到新配置。
+
+    submit 把配置交给后台线程推送，保存配置时不等待各进程的回复（每个进程最多
+    PUSH_TIMEOUT 秒）；只保留最新的一份待推送配置，还没发送的旧版本被直接替换。
+    """
+
+    def __init__(self, control_pattern: str = CONTROL_FILE_PATTERN):
+        self.control_pattern = control_pattern
+        self._lock = threading.Lock()
+        self._pending: Optional[Tuple[bytes, int]] = None
+        self._wake_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, config_bytes: bytes, version: int):
+        """在后台推送已序列化的配置，立即返回"""
+        with self._lock:
+            self._pending = (config_bytes, version)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="config-pusher", daemon=True)
+                self._thread.start()
+        self._wake_event.set()
+
+    def _run(self):
+        while True:
+            self._wake_event.wait()
+            self._wake_event.clear()
+            with self._lock:
+                pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+            try:
+                self.push(*pending)
+            except Exception as e:
+                print(f"推送配置失败: {e}")
+
+    def _load_targets(self) -> List[dict]:
+        targets = []
+        for control_file in glob.glob(self.control_pattern):
+            try:
+                with open(control_file, 'r', encoding='utf-8') as f:
+                    target = json.load(f)
+            except (OSError, ValueError):
+                continue
+            # 进程已退出（如被强制结束）时清理残留的控制文件
+            if not psutil.pid_exists(target.get('pid', 0)):
+                try:
+                    os.remove(control_file)
+                except OSError:
+                    pass
+                continue
+            targets.append(target)
+        return targets
+
+    def _send(self, target: dict, payload: bytes) -> dict:
+        with socket.create_connection((target['host'], target['port']), timeout=PUSH_TIMEOUT) as sock:
+            sock.sendall(payload)
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile('rb') as reader:
+                return json.loads(reader.readline())
+
+    def push(self, config_bytes: bytes, version: int) -> int:
+        """推送已序列化的配置，返回已确认使用该版本（或更新版本）的插件进程数
+
+        config_bytes 为不含换行的紧凑JSON，各进程的消息只有令牌不同。
+        """
+        targets = self._load_targets()
+        if not targets:
+            return 0
+
+        confirmed = 0
+        for target in targets:
+            token = json.dumps(str(target.get('token', ''))).encode('utf-8')
+            payload = b'{"token":' + token + b',"config":' + config_bytes + b'}\n'
+            try:
+                result = self._send(target, payload)
+            except (OSError, ValueError) as e:
+                print(f"推送配置到代理进程 {target.get('pid')} 失败: {e}")
+                continue
+            if result.get('ok') and result.get('version', 0) >= version:
+                confirmed += 1
+            else:
+                print(f"代理进程 {target.get('pid')} 未应用配置版本 {version}: {result.get('error', result)}")
+        return confirmed
+
+
+# 全局单例
+_config_push_service = None
+
+
+def get_config_push_service() -> ConfigPushService:
+    """获取配置推送服务单例"""
+    global _config_push_service
+    if _config_push_service is None:
+        _config_push_service = ConfigPushService()
+    return _config_push_service
@@ -1,155 +1,521 @@
+import atexit
 import json
-import os
-import shutil
-from typing import List, Optional
-from datetime import datetime
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
 from models import APIConfig, APIConfigList, FileDownloadConfig, RequestMappingConfig
+from services.config_journal import OP_CREATE, OP_DELETE, OP_TOGGLE, OP_UPDATE, ConfigJournal, make_entry
+from services.config_push_service import get_config_push_service
+from services.config_store import RULE_KINDS, ChangeSet, create_config_store
 
 
-class ConfigService:
-    def __init__(self, config_file: str = "data/config.json"):
-        self.config_file = config_file
-        self.ensure_data_dir()
+def _api_key(api: dict) -> Tuple[str, str, str]:
+    """API规则的去重键：URL、方法和请求体条件（枚举按值序列化）"""
+    return (
+        api["url"],
+        json.dumps(api["method"]),
+        json.dumps(api.get("body_match"), sort_keys=True, ensure_ascii=False),
+    )
 
-    def ensure_data_dir(self):
-        """确保数据目录存在"""
-        os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
 
-    def load_config(self) -> dict:
-        """加载配置文件"""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if "file_downloads" not in data:
-                        data["file_downloads"] = []
-                    if "request_mappings" not in data:
-                        data["request_mappings"] = []
-                    return data
+class ConfigService:
+    """配置管理服务
+
+    启动时从存储（JSON文件或SQLite，见 config_store.py）读取一次配置，之后以内存中的
+    配置为准，并按ID建立索引，读取不再访问磁盘。修改后延迟写入：连续的修改在
+    write_delay 秒内没有新修改（或距第一次未保存的修改已超过 max_write_delay 秒）时
+    合并为一次写入，写入后把新版本推送给运行中的代理。每条修改同时追加到变更日志
+    （见 config_journal.py），用于查看历史和按时间点恢复。
+    """
+
+    def __init__(self, store=None, journal: Optional[ConfigJournal] = None,
+                 write_delay: float = 0.2, max_write_delay: float = 2.0):
+        self.store = store if store is not None else create_config_store()
+        self.write_delay = write_delay
+        self.max_write_delay = max_write_delay
+        self.push_service = get_config_push_service()
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        # 规则在列表中的顺序与排序位置一致，SQLite存储按位置恢复顺序
+        self._config, self._positions = self.store.load()
+        # 配置版本，每次写入加1，代理据此忽略过期的推送和文件
+        self.version = self._config.get("version", 0)
+        self._by_id: Dict[str, Dict[str, dict]] = {}
+        self._api_keys: Dict[Tuple[str, str, str], str] = {}
+        self._rebuild_indexes()
+        # 内存配置的修改代数，每次修改加1（不等写入），与实例ID一起用作列表接口的ETag
+        self.generation = 0
+        self.instance_id = uuid.uuid4().hex[:8]
+
+        self.journal = journal if journal is not None else ConfigJournal()
+        self.journal.open(self._serialize, self.version, time.time())
+
+        # 尚未写入的修改
+        self._changed: Dict[str, Set[str]] = {kind: set() for kind in RULE_KINDS}
+        self._deleted: Dict[str, Set[str]] = {kind: set() for kind in RULE_KINDS}
+        self._replace_all = False
+        self._journal_entries: List[dict] = []
+        self._journal_snapshot = False
+        self._dirty = False
+        self._dirty_since: Optional[float] = None
+        self._last_change_at = 0.0
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _rebuild_indexes(self):
+        with self._lock:
+            self._by_id = {kind: {item["id"]: item for item in self._config[kind]} for kind in RULE_KINDS}
+            self._api_keys = {_api_key(api): api["id"] for api in self._config["apis"]}
+
+    def _serialize(self) -> str:
+        with self._lock:
+            return json.dumps(self._config, ensure_ascii=False, separators=(',', ':'))
+
+    def _record(self, op: str, kind: str, item_id: str, item: Optional[dict] = None,
+                enabled: Optional[bool] = None, front: bool = False):
+        """记录一条变更日志（调用方持有锁），规则内容复制一份，之后的原位修改不影响记录"""
+        self._journal_entries.append(
+            make_entry(time.time(), op, kind, item_id, dict(item) if item is not None else None, enabled, front)
+        )
+
+    def snapshot_rules(self, kind: str) -> Tuple[int, List[dict], Dict[str, float]]:
+        """返回 (修改代数, 规则字典的副本列表, 规则ID -> 排序位置)，用于列表查询"""
+        with self._lock:
+            return self.generation, [dict(item) for item in self._config[kind]], dict(self._positions[kind])
+
+    def _next_position(self, kind: str, front: bool = False) -> float:
+        positions = self._positions[kind]
+        if not positions:
+            return 0.0
+        return min(positions.values()) - 1 if front else max(positions.values()) + 1
+
+    # 延迟写入
+    def _mark_dirty(self, kind: Optional[str] = None, changed: Tuple[str, ...] = (),
+                    deleted: Tuple[str, ...] = ()):
+        """记录一次修改，由后台线程合并写入"""
+        now = time.monotonic()
+        with self._lock:
+            if kind is not None:
+                self._changed[kind].update(changed)
+                self._changed[kind].difference_update(deleted)
+                self._deleted[kind].update(deleted)
+            self._dirty = True
+            self.generation += 1
+            self._last_change_at = now
+            if self._dirty_since is None:
+                self._dirty_since = now
+        self._start_writer()
+        self._wake_event.set()
+
+    def _flush_delay(self) -> float:
+        with self._lock:
+            if not self._dirty:
+                return 0.0
+            due = min(self._last_change_at + self.write_delay, self._dirty_since + self.max_write_delay)
+        return max(0.0, due - time.monotonic())
+
+    def _start_writer(self):
+        # 加锁检查，并发的首次修改只启动一个写入线程
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="config-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait()
+            self._wake_event.clear()
+            delay = self._flush_delay()
+            while delay > 0 and not self._stop_event.wait(delay):
+                delay = self._flush_delay()
+            self.flush()
+
+    def _stamp_revisions(self, version: int):
+        """给本次修改的规则写入 rev（最后修改它的配置版本，调用方持有锁）
+
+        插件按 (规则ID, rev) 复用已序列化的Mock响应，rev 不变时不再序列化响应体。
+        """
+        for kind in RULE_KINDS:
+            index = self._by_id[kind]
+            item_ids = list(index) if self._replace_all else self._changed[kind]
+            for item_id in item_ids:
+                item = index.get(item_id)
+                if item is not None:
+                    item["rev"] = version
+
+    def _take_changes(self, version: int) -> ChangeSet:
+        """收集并清空尚未写入的修改（调用方持有锁）"""
+        changes = ChangeSet(version, replace_all=self._replace_all)
+        for kind in RULE_KINDS:
+            positions = self._positions[kind]
+            if self._replace_all:
+                for item in self._config[kind]:
+                    changes.upsert(kind, item, positions[item["id"]])
             else:
-                return {"apis": [], "file_downloads": [], "request_mappings": []}
-        except Exception as e:
-            print(f"加载配置文件失败: {e}")
-            return {"apis": [], "file_downloads": [], "request_mappings": []}
-
-    def save_config(self, config: dict) -> bool:
-        """保存配置文件"""
-        try:
-            # 创建备份
-            self.create_backup()
-
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+                for item_id in self._changed[kind]:
+                    item = self._by_id[kind].get(item_id)
+                    if item is not None:
+                        changes.upsert(kind, item, positions[item_id])
+                for item_id in self._deleted[kind]:
+                    changes.delete(kind, item_id)
+            self._changed[kind] = set()
+            self._deleted[kind] = set()
+        self._replace_all = False
+        return changes
+
+    def flush(self) -> bool:
+        """立即把未保存的修改写入存储，并交给后台线程推送给运行中的代理"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return True
+                version = self.version + 1
+                self._config["version"] = version
+                self._stamp_revisions(version)
+                data = self._serialize()
+                changes = self._take_changes(version)
+                entries, self._journal_entries = self._journal_entries, []
+                snapshot, self._journal_snapshot = self._journal_snapshot, False
+                ts = time.time()
+                self._dirty = False
+                self._dirty_since = None
+
+            self._write_journal(entries, snapshot, data, version, ts)
+
+            try:
+                self.store.save(data, changes)
+            except Exception as e:
+                print(f"保存配置失败: {e}")
+                # 写入失败时下一次整体重写，保证存储与内存一致
+                with self._lock:
+                    self._replace_all = True
+                    self._dirty = True
+                    if self._dirty_since is None:
+                        self._dirty_since = time.monotonic()
+                return False
+            self.version = version
+
+            # 推送在后台线程中进行，不在持有写入锁时等待各代理进程的回复；
+            # 在锁内提交保证待推送的版本按顺序递增
+            self.push_service.submit(data.encode('utf-8'), version)
             return True
-        except Exception as e:
-            print(f"保存配置文件失败: {e}")
-            return False
 
-    def create_backup(self) -> bool:
-        """创建配置文件备份"""
+    def _write_journal(self, entries: List[dict], snapshot: bool, data: str, version: int, ts: float):
+        """追加变更日志，整体替换配置后或日志段足够大时写入新快照"""
         try:
-            if os.path.exists(self.config_file):
-                backup_name = f"{self.config_file}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                shutil.copy2(self.config_file, backup_name)
-
-                # 只保留最近5个备份文件
-                self.cleanup_backups()
-            return True
+            self.journal.append(entries, version)
+            if snapshot or self.journal.should_compact():
+                self.journal.compact(data, version, ts)
         except Exception as e:
-            print(f"创建备份失败: {e}")
-            return False
+            print(f"写入变更日志失败: {e}")
+            # 下次写入时重试
+            with self._lock:
+                self._journal_entries[:0] = entries
+                self._journal_snapshot = self._journal_snapshot or snapshot
+
+    def close(self):
+        """停止后台写入线程，写入尚未保存的修改并关闭存储"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+        self.journal.close()
+        self.store.close()
+
+    def get_history(self, limit: int = 100) -> List[dict]:
+        """最近的配置修改记录（从新到旧）"""
+        self.flush()
+        return self.journal.history(limit)
+
+    def restore(self, ts: float) -> bool:
+        """把配置恢复到指定时间点（Unix时间戳），超出变更日志保留范围时抛出 ValueError"""
+        self.flush()
+        return self.save_config(self.journal.config_at(ts))
 
-    def cleanup_backups(self):
-        """清理旧的备份文件"""
-        try:
-            backup_dir = os.path.dirname(self.config_file)
-            backup_files = [f for f in os.listdir(backup_dir) if f.startswith(os.path.basename(self.config_file) + ".backup.")]
-            backup_files.sort(reverse=True)
-
-            # 删除超过5个的备份文件
-            for backup_file in backup_files[5:]:
-                os.remove(os.path.join(backup_dir, backup_file))
-        except Exception as e:
-            print(f"清理备份文件失败: {e}")
+    def save_config(self, config: dict) -> bool:
+        """用新的完整配置替换当前配置（如导入），延迟写入"""
+        with self._lock:
+            self._config = config
+            self._positions = {
+                kind: {item["id"]: float(i) for i, item in enumerate(config[kind])} for kind in RULE_KINDS
+            }
+            self._rebuild_indexes()
+            self._replace_all = True
+            # 整体替换不逐条记录，下次写入时直接生成新快照
+            self._journal_snapshot = True
+        self._mark_dirty()
+        return True
+
+    @staticmethod
+    def validate_config(data: dict) -> dict:
+        """校验导入的配置并补全默认字段（如缺少的ID），无效时抛出 ValueError"""
+        if not isinstance(data, dict):
+            raise ValueError("配置必须是JSON对象")
+        for key, model in (("apis", APIConfig), ("file_downloads", FileDownloadConfig),
+                           ("request_mappings", RequestMappingConfig)):
+            items = data.get(key, [])
+            if not isinstance(items, list):
+                raise ValueError(f"{key} 必须是列表")
+            normalized = []
+            for i, item in enumerate(items):
+                try:
+                    normalized.append(model(**item).dict())
+                except Exception as e:
+                    raise ValueError(f"{key}[{i}] 无效: {e}")
+            data[key] = normalized
+        return data
+
+    # 通用的规则操作
+    def _get_item(self, kind: str, item_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._by_id[kind].get(item_id)
+
+    def _append_item(self, kind: str, item: dict) -> bool:
+        with self._lock:
+            self._positions[kind][item["id"]] = self._next_position(kind)
+            self._config[kind].append(item)
+            self._by_id[kind][item["id"]] = item
+            self._record(OP_CREATE, kind, item["id"], item)
+        self._mark_dirty(kind, changed=(item["id"],))
+        return True
+
+    def _replace_item(self, kind: str, item_id: str, new_item: dict) -> bool:
+        """原位替换规则内容，保持列表顺序"""
+        with self._lock:
+            item = self._by_id[kind].get(item_id)
+            if item is None:
+                return False
+            if kind == "apis":
+                self._forget_api_key(item)
+            item.clear()
+            item.update(new_item)
+            item["id"] = item_id
+            if kind == "apis":
+                self._api_keys[_api_key(item)] = item_id
+            self._record(OP_UPDATE, kind, item_id, item)
+        self._mark_dirty(kind, changed=(item_id,))
+        return True
+
+    def _delete_item(self, kind: str, item_id: str) -> bool:
+        return bool(self._delete_items(kind, [item_id]))
+
+    def _delete_items(self, kind: str, item_ids: List[str]) -> List[str]:
+        """删除多条规则（只重建一次列表），返回实际删除的ID"""
+        with self._lock:
+            deleted = []
+            for item_id in item_ids:
+                item = self._by_id[kind].pop(item_id, None)
+                if item is None:
+                    continue
+                if kind == "apis":
+                    self._forget_api_key(item)
+                self._positions[kind].pop(item_id, None)
+                self._record(OP_DELETE, kind, item_id)
+                deleted.append(item_id)
+            if deleted:
+                index = self._by_id[kind]
+                self._config[kind] = [item for item in self._config[kind] if index.get(item["id"]) is item]
+        if deleted:
+            self._mark_dirty(kind, deleted=tuple(deleted))
+        return deleted
+
+    def _toggle_item(self, kind: str, item_id: str, enabled: Optional[bool] = None) -> bool:
+        """切换启用状态，enabled 不为 None 时设置为指定状态"""
+        with self._lock:
+            item = self._by_id[kind].get(item_id)
+            if item is None:
+                return False
+            item["enabled"] = not item.get("enabled", True) if enabled is None else enabled
+            self._record(OP_TOGGLE, kind, item_id, enabled=item["enabled"])
+        self._mark_dirty(kind, changed=(item_id,))
+        return True
+
+    def _forget_api_key(self, api: dict):
+        key = _api_key(api)
+        if self._api_keys.get(key) == api["id"]:
+            del self._api_keys[key]
 
     def get_all_apis(self) -> List[APIConfig]:
         """获取所有API配置"""
-        config = self.load_config()
-        return [APIConfig(**api) for api in config.get("apis", [])]
+        with self._lock:
+            apis = list(self._config["apis"])
+        return [APIConfig(**api) for api in apis]
 
     def get_api_by_id(self, api_id: str) -> Optional[APIConfig]:
         """根据ID获取API配置"""
-        apis = self.get_all_apis()
-        for api in apis:
-            if api.id == api_id:
-                return api
-        return None
+        api = self._get_item("apis", api_id)
+        return APIConfig(**api) if api is not None else None
 
     def add_api(self, api: APIConfig) -> bool:
         """添加API配置"""
-        config = self.load_config()
-
-        # 检查是否存在相同的URL和方法，如果存在则覆盖并移到最前面
-        found_index = -1
-        for i, existing_api in enumerate(config["apis"]):
-            if existing_api["url"] == api.url and existing_api["method"] == api.method:
+        new_api = api.dict()
+        self._insert_api(new_api)
+        api.id = new_api["id"]
+        api.enabled = new_api["enabled"]
+        return True
+
+    def _insert_api(self, new_api: dict) -> bool:
+        """把API添加到列表最前面，已有相同URL、方法和请求体条件的API时覆盖它，返回是否覆盖"""
+        with self._lock:
+            # 检查是否存在相同的URL、方法和请求体条件，如果存在则覆盖并移到最前面
+            existing_id = self._api_keys.get(_api_key(new_api))
+            existing_api = self._by_id["apis"].get(existing_id) if existing_id else None
+            if existing_api is not None:
                 # 保留原来的ID和enabled状态
-                api.id = existing_api["id"]
-                api.enabled = existing_api.get("enabled", True)
-                found_index = i
-                break
-
-        if found_index >= 0:
-            # 删除原有位置的配置
-            config["apis"].pop(found_index)
-        # 添加到列表最前面
-        config["apis"].insert(0, api.dict())
-
-        return self.save_config(config)
+                new_api["id"] = existing_api["id"]
+                new_api["enabled"] = existing_api.get("enabled", True)
+                self._config["apis"] = [item for item in self._config["apis"] if item is not existing_api]
+
+            # 添加到列表最前面
+            self._positions["apis"][new_api["id"]] = self._next_position("apis", front=True)
+            self._config["apis"].insert(0, new_api)
+            self._by_id["apis"][new_api["id"]] = new_api
+            self._api_keys[_api_key(new_api)] = new_api["id"]
+            self._record(OP_CREATE, "apis", new_api["id"], new_api, front=True)
+        self._mark_dirty("apis", changed=(new_api["id"],))
+        return existing_api is not None
 
     def update_api(self, api_id: str, updated_api: APIConfig) -> bool:
         """更新API配置"""
-        config = self.load_config()
-        for i, api in enumerate(config["apis"]):
-            if api["id"] == api_id:
-                config["apis"][i] = updated_api.dict()
-                return self.save_config(config)
-        return False
+        return self._replace_item("apis", api_id, updated_api.dict())
 
     def delete_api(self, api_id: str) -> bool:
         """删除API配置"""
-        config = self.load_config()
-        config["apis"] = [api for api in config["apis"] if api["id"] != api_id]
-        return self.save_config(config)
+        return self._delete_item("apis", api_id)
 
     def toggle_api_status(self, api_id: str) -> bool:
         """切换API启用状态"""
-        config = self.load_config()
-        for api in config["apis"]:
-            if api["id"] == api_id:
-                api["enabled"] = not api["enabled"]
-                return self.save_config(config)
-        return False
+        return self._toggle_item("apis", api_id)
 
     def batch_toggle_apis(self, api_ids: List[str], enabled: bool) -> bool:
         """批量切换API状态"""
-        config = self.load_config()
         updated = False
-        for api in config["apis"]:
-            if api["id"] in api_ids:
-                api["enabled"] = enabled
-                updated = True
-
-        if updated:
-            return self.save_config(config)
-        return False
+        with self._lock:
+            for api_id in api_ids:
+                updated = self._toggle_item("apis", api_id, enabled) or updated
+        return updated
+
+    def apply_batch(self, kind: str, operations: List[Tuple[str, Optional[str], Optional[dict], Optional[bool]]]
+                    ) -> Tuple[bool, List[dict]]:
+        """在一个事务中执行一批操作，返回 (是否执行, 每项的结果)
+
+        operations 为 (操作, 规则ID, 规则内容, 启用状态) 的列表，操作为 create / upsert /
+        delete / toggle，规则内容已按数据模型校验；create / upsert 没有指定ID时规则ID为None
+        （规则内容中是生成的ID）。先按顺序检查所有操作（同一批中前面的新增和删除对后面的
+        操作可见），任何一项不能执行时整批不修改；全部执行完成后才释放锁，延迟写入只产生
+        一次写入。
+        """
+        with self._lock:
+            index = self._by_id[kind]
+            results = []
+            created: Set[str] = set()
+            deleted: Set[str] = set()
+            # 本批中改变的API去重键（值为None表示已释放）和规则当前的去重键
+            batch_keys: Dict[Tuple[str, str, str], Optional[str]] = {}
+            batch_item_keys: Dict[str, Tuple[str, str, str]] = {}
+
+            def current_key(api_id: str) -> Optional[Tuple[str, str, str]]:
+                if api_id in batch_item_keys:
+                    return batch_item_keys[api_id]
+                if api_id in index and api_id not in deleted:
+                    return _api_key(index[api_id])
+                return None
+
+            def release_key(api_id: str):
+                key = current_key(api_id)
+                batch_item_keys.pop(api_id, None)
+                if key is not None and batch_keys.get(key, self._api_keys.get(key)) == api_id:
+                    batch_keys[key] = None
+
+            for i, (op, item_id, item, enabled) in enumerate(operations):
+                exists = item_id is not None and item_id not in deleted and (item_id in index or item_id in created)
+                error = None
+                if op == "create" and exists:
+                    error = "规则ID已存在"
+                elif op in ("delete", "toggle") and not exists:
+                    error = "规则不存在"
+                elif kind == "apis" and op != "toggle" and item_id is not None:
+                    if op == "delete":
+                        release_key(item_id)
+                    else:
+                        # 指定了ID的规则不能与其他规则的URL、方法和请求体条件相同，否则会被合并到那条规则上
+                        key = _api_key(item)
+                        owner = batch_keys[key] if key in batch_keys else self._api_keys.get(key)
+                        if owner is not None and owner != item_id:
+                            error = f"已有相同URL、方法和请求体条件的规则: {owner}"
+                        else:
+                            release_key(item_id)
+                            batch_keys[key] = item_id
+                            batch_item_keys[item_id] = key
+                if error is None:
+                    if op == "delete":
+                        deleted.add(item_id)
+                    elif item_id is not None:
+                        created.add(item_id)
+                        deleted.discard(item_id)
+                results.append({"index": i, "op": op, "id": item_id, "success": error is None, "error": error})
+            if any(result["error"] for result in results):
+                return False, results
+
+            pending_deletes: List[Tuple[dict, str]] = []
+
+            def run_deletes():
+                removed = set(self._delete_items(kind, [item_id for _, item_id in pending_deletes]))
+                for delete_result, item_id in pending_deletes:
+                    if item_id not in removed:
+                        delete_result.update(success=False, status=None, error="规则不存在")
+                pending_deletes.clear()
+
+            for result, (op, item_id, item, enabled) in zip(results, operations):
+                if pending_deletes and op != "delete" and (
+                        (kind == "apis" and op != "toggle")
+                        or any(item_id == pending_id for _, pending_id in pending_deletes)):
+                    # 删除后又重新使用同一ID（或新的API与被删除的规则去重键相同）时，先执行前面的删除
+                    run_deletes()
+                if op == "delete":
+                    pending_deletes.append((result, item_id))
+                    result["status"] = "deleted"
+                    continue
+                if op == "toggle":
+                    done = self._toggle_item(kind, item_id, enabled)
+                    status = "toggled"
+                elif op == "upsert" and item_id in index:
+                    if enabled is None:
+                        # 没有指定启用状态时保留原来的
+                        item["enabled"] = index[item_id].get("enabled", True)
+                    done = self._replace_item(kind, item_id, item)
+                    status = "updated"
+                elif kind == "apis":
+                    # 校验时已排除指定ID与其他规则去重键相同的情况，只有未指定ID时才会覆盖已有规则
+                    replaced = self._insert_api(item)
+                    result["id"] = item["id"]
+                    done = True
+                    status = "updated" if replaced else "created"
+                else:
+                    done = self._append_item(kind, item)
+                    result["id"] = item["id"]
+                    status = "created"
+                if done:
+                    result["status"] = status
+                else:
+                    result.update(success=False, error="规则不存在")
+            run_deletes()
+        return True, results
 
     def export_config(self, export_path: str) -> bool:
         """导出配置到指定路径"""
         try:
-            config = self.load_config()
+            with self._lock:
+                data = json.dumps(self._config, ensure_ascii=False, indent=2)
             with open(export_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+                f.write(data)
             return True
         except Exception as e:
             print(f"导出配置失败: {e}")
@@ -164,7 +530,7 @@ class ConfigService:
                     data["file_downloads"] = []
                 if "request_mappings" not in data:
                     data["request_mappings"] = []
-                return self.save_config(data)
+            return self.save_config(self.validate_config(data))
         except Exception as e:
             print(f"导入配置失败: {e}")
             return False
@@ -172,87 +538,55 @@ class ConfigService:
     # File download related methods
     def get_all_file_downloads(self) -> List[FileDownloadConfig]:
         """获取所有文件下载配置"""
-        config = self.load_config()
-        return [FileDownloadConfig(**fd) for fd in config.get("file_downloads", [])]
+        with self._lock:
+            downloads = list(self._config["file_downloads"])
+        return [FileDownloadConfig(**fd) for fd in downloads]
 
     def get_file_download_by_id(self, download_id: str) -> Optional[FileDownloadConfig]:
         """根据ID获取文件下载配置"""
-        downloads = self.get_all_file_downloads()
-        for download in downloads:
-            if download.id == download_id:
-                return download
-        return None
+        download = self._get_item("file_downloads", download_id)
+        return FileDownloadConfig(**download) if download is not None else None
 
     def add_file_download(self, download: FileDownloadConfig) -> bool:
         """添加文件下载配置"""
-        config = self.load_config()
-        config["file_downloads"].append(download.dict())
-        return self.save_config(config)
+        return self._append_item("file_downloads", download.dict())
 
     def update_file_download(self, download_id: str, updated_download: FileDownloadConfig) -> bool:
         """更新文件下载配置"""
-        config = self.load_config()
-        for i, download in enumerate(config["file_downloads"]):
-            if download["id"] == download_id:
-                config["file_downloads"][i] = updated_download.dict()
-                return self.save_config(config)
-        return False
+        return self._replace_item("file_downloads", download_id, updated_download.dict())
 
     def delete_file_download(self, download_id: str) -> bool:
         """删除文件下载配置"""
-        config = self.load_config()
-        config["file_downloads"] = [download for download in config["file_downloads"] if download["id"] != download_id]
-        return self.save_config(config)
+        return self._delete_item("file_downloads", download_id)
 
     def toggle_file_download_status(self, download_id: str) -> bool:
         """切换文件下载启用状态"""
-        config = self.load_config()
-        for download in config["file_downloads"]:
-            if download["id"] == download_id:
-                download["enabled"] = not download["enabled"]
-                return self.save_config(config)
-        return False
+        return self._toggle_item("file_downloads", download_id)
 
     # Request mapping related methods
     def get_all_request_mappings(self) -> List[RequestMappingConfig]:
         """获取所有请求映射配置"""
-        config = self.load_config()
-        return [RequestMappingConfig(**rm) for rm in config.get("request_mappings", [])]
+        with self._lock:
+            mappings = list(self._config["request_mappings"])
+        return [RequestMappingConfig(**rm) for rm in mappings]
 
     def get_request_mapping_by_id(self, mapping_id: str) -> Optional[RequestMappingConfig]:
         """根据ID获取请求映射配置"""
-        mappings = self.get_all_request_mappings()
-        for mapping in mappings:
-            if mapping.id == mapping_id:
-                return mapping
-        return None
+        mapping = self._get_item("request_mappings", mapping_id)
+        return RequestMappingConfig(**mapping) if mapping is not None else None
 
     def add_request_mapping(self, mapping: RequestMappingConfig) -> bool:
         """添加请求映射配置"""
-        config = self.load_config()
-        config["request_mappings"].append(mapping.dict())
-        return self.save_config(config)
+        return self._append_item("request_mappings", mapping.dict())
 
     def update_request_mapping(self, mapping_id: str, updated_mapping: RequestMappingConfig) -> bool:
         """更新请求映射配置"""
-        config = self.load_config()
-        for i, mapping in enumerate(config["request_mappings"]):
-            if mapping["id"] == mapping_id:
-                config["request_mappings"][i] = updated_mapping.dict()
-                return self.save_config(config)
-        return False
+        return self._replace_item("request_mappings", mapping_id, updated_mapping.dict())
 
     def delete_request_mapping(self, mapping_id: str) -> bool:
         """删除请求映射配置"""
-        config = self.load_config()
-        config["request_mappings"] = [mapping for mapping in config["request_mappings"] if mapping["id"] != mapping_id]
-        return self.save_config(config)
+        return self._delete_item("request_mappings", mapping_id)
 
     def toggle_request_mapping_status(self, mapping_id: str) -> bool:
         """切换请求映射启用状态"""
-        config = self.load_config()
-        for mapping in config["request_mappings"]:
-            if mapping["id"] == mapping_id:
-                mapping["enabled"] = not mapping["enabled"]
-                return self.save_config(config)
-        return False
\ No newline at end of file
+        return self._toggle_item("request_mappings", mapping_id)
@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional, Tuple
+
+# 配置存储引擎，通过环境变量 CONFIG_STORE 选择：json（默认）或 sqlite
+CONFIG_STORE = os.environ.get("CONFIG_STORE", "json").lower()
+JSON_CONFIG_FILE = "data/config.json"
+SQLITE_CONFIG_FILE = "data/config.db"
+
+# 配置中的规则列表
+RULE_KINDS = ("apis", "file_downloads", "request_mappings")
+
+# 规则类型 -> 规则ID -> 排序位置
+Positions = Dict[str, Dict[str, float]]
+
+
+def empty_config() -> dict:
+    return {"apis": [], "file_downloads": [], "request_mappings": []}
+
+
+class ChangeSet:
+    """一次写入包含的修改
+
+    upserts 为 规则类型 -> 规则ID -> (排序位置, 方法, URL, 规则JSON)，deletes 为被删除的规则ID；
+    replace_all 为 True 时（如导入配置）upserts 包含全部规则。
+    """
+
+    __slots__ = ('version', 'replace_all', 'upserts', 'deletes')
+
+    def __init__(self, version: int, replace_all: bool = False):
+        self.version = version
+        self.replace_all = replace_all
+        self.upserts: Dict[str, Dict[str, tuple]] = {kind: {} for kind in RULE_KINDS}
+        self.deletes: Dict[str, set] = {kind: set() for kind in RULE_KINDS}
+
+    def upsert(self, kind: str, item: dict, position: float):
+        """记录新增或修改的规则，文件下载和请求映射的URL为url_pattern，没有方法"""
+        if kind == "apis":
+            method, url = item.get("method"), item.get("url")
+        else:
+            method, url = None, item.get("url_pattern")
+        self.upserts[kind][item["id"]] = (position, method, url, json.dumps(item, ensure_ascii=False))
+        self.deletes[kind].discard(item["id"])
+
+    def delete(self, kind: str, rule_id: str):
+        self.upserts[kind].pop(rule_id, None)
+        self.deletes[kind].add(rule_id)
+
+
+class JsonConfigStore:
+    """把整个配置写成一个JSON文件（历史版本见 config_journal.py）"""
+
+    def __init__(self, config_file: str = JSON_CONFIG_FILE):
+        self.config_file = config_file
+        os.makedirs(os.path.dirname(config_file) or '.', exist_ok=True)
+
+    def load(self) -> Tuple[dict, Positions]:
+        """加载配置文件，规则按文件中的顺序编号"""
+        try:
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    if "file_downloads" not in data:
+                        data["file_downloads"] = []
+                    if "request_mappings" not in data:
+                        data["request_mappings"] = []
+            else:
+                data = empty_config()
+        except Exception as e:
+            print(f"加载配置文件失败: {e}")
+            data = empty_config()
+        positions = {kind: {item["id"]: float(i) for i, item in enumerate(data[kind])} for kind in RULE_KINDS}
+        return data, positions
+
+    def save(self, data: str, changes: ChangeSet):
+        """先写临时文件再原子替换，代理监听文件时不会读到写了一半的内容"""
+        tmp_file = f"{self.config_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_file, self.config_file)
+
+    def close(self):
+        pass
+
+
+class SqliteConfigStore:
+    """每条规则一行的SQLite存储
+
+    写入只涉及本次修改的行，并在一个事务中完成；主键 (kind, id) 和
+    (kind, method, url) 索引支持按ID和按方法+URL查找。使用默认的回滚日志模式，
+    每次提交都会更新数据库文件本身，代理监听文件变化的方式不需要改变。
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS rules (
+            kind TEXT NOT NULL,
+            id TEXT NOT NULL,
+            position REAL NOT NULL,
+            method TEXT,
+            url TEXT,
+            data TEXT NOT NULL,
+            PRIMARY KEY (kind, id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_rules_method_url ON rules (kind, method, url)",
+        "CREATE INDEX IF NOT EXISTS idx_rules_position ON rules (kind, position)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    )
+
+    def __init__(self, db_file: str = SQLITE_CONFIG_FILE, legacy_json_file: Optional[str] = JSON_CONFIG_FILE):
+        self.db_file = db_file
+        self.legacy_json_file = legacy_json_file
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self._conn:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    def load(self) -> Tuple[dict, Positions]:
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, id, position, data FROM rules ORDER BY kind, position").fetchall()
+            version = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+
+        # 数据库为空时从原来的JSON配置迁移
+        if not rows and version is None and self.legacy_json_file and os.path.exists(self.legacy_json_file):
+            data, positions = JsonConfigStore(self.legacy_json_file).load()
+            changes = ChangeSet(data.get("version", 0), replace_all=True)
+            for kind in RULE_KINDS:
+                for item in data[kind]:
+                    changes.upsert(kind, item, positions[kind][item["id"]])
+            self.save("", changes)
+            print(f"已从 {self.legacy_json_file} 导入 {sum(len(data[kind]) for kind in RULE_KINDS)} 条规则到 {self.db_file}")
+            return data, positions
+
+        data = empty_config()
+        positions: Positions = {kind: {} for kind in RULE_KINDS}
+        for kind, rule_id, position, item in rows:
+            if kind not in data:
+                continue
+            data[kind].append(json.loads(item))
+            positions[kind][rule_id] = position
+        if version is not None:
+            data["version"] = int(version[0])
+        return data, positions
+
+    def save(self, data: str, changes: ChangeSet):
+        """在一个事务中写入本次修改（data 为完整配置JSON，SQLite存储不使用）"""
+        with self._lock, self._conn:
+            if changes.replace_all:
+                self._conn.execute("DELETE FROM rules")
+            for kind in RULE_KINDS:
+                deletes = changes.deletes[kind]
+                if deletes:
+                    self._conn.executemany(
+                        "DELETE FROM rules WHERE kind = ? AND id = ?", [(kind, rule_id) for rule_id in deletes]
+                    )
+                upserts = changes.upserts[kind]
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO rules (kind, id, position, method, url, data) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(kind, rule_id) + row for rule_id, row in upserts.items()],
+                    )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(changes.version),)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_config_store(engine: str = CONFIG_STORE):
+    """按引擎名称创建配置存储"""
+    if engine == "sqlite":
+        return SqliteConfigStore()
+    return JsonConfigStore()
+
+
+def config_store_path(engine: str = CONFIG_STORE) -> str:
+    """代理冷启动和监听变化使用的配置文件"""
+    return SQLITE_CONFIG_FILE if engine == "sqlite" else JSON_CONFIG_FILE
@@ -0,0 +1,193 @@
+import glob
+import json
+import time
+from typing import Dict, List, Optional
+
+# mitmproxy插件定期写入的指标文件（多worker模式下为 proxy_metrics.w1.json 等）
+PROXY_METRICS_FILE = "./data/proxy_metrics.json"
+PROXY_METRICS_PATTERN = "./data/proxy_metrics*.json"
+
+# 指标文件超过该时间（秒）未更新时认为代理已停止
+STALE_AFTER_SECONDS = 10.0
+
+METRIC_PREFIX = "mock_proxy"
+
+# 计数器名称 -> 说明
+COUNTER_HELP = {
+    'requests': "代理收到的请求总数",
+    'responses': "代理返回的响应总数",
+    'mock_hits': "命中API Mock的请求数",
+    'download_hits': "命中文件下载拦截的请求数",
+    'mapping_forwards': "通过请求映射转发的请求数",
+    'replay_hits': "由回放录制响应返回的请求数",
+    'capture_written': "已写入文件的抓包记录数",
+    'capture_dropped': "因队列满被丢弃的抓包记录数",
+    'log_dropped': "因日志队列满被丢弃的日志条数",
+    'config_reloads': "配置重新加载次数",
+}
+
+# 即时值名称 -> 说明
+GAUGE_HELP = {
+    'capture_queue_depth': "抓包写入队列中等待写入的记录数",
+    'file_cache_bytes': "拦截文件内容缓存占用的字节数",
+}
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class MetricsService:
+    """把mitmproxy插件写入的指标文件转换为Prometheus文本格式"""
+
+    def __init__(self, metrics_pattern: str = PROXY_METRICS_PATTERN):
+        self.metrics_pattern = metrics_pattern
+
+    def _load_file(self, metrics_file: str) -> Optional[dict]:
+        try:
+            with open(metrics_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"读取代理指标失败: {e}")
+            return None
+
+    def load_metrics(self) -> Optional[dict]:
+        """读取插件最近一次写入的指标，多worker时合并各worker的指标
+
+        只合并仍在更新的worker；全部停止时合并所有文件，便于查看最后的数值。
+        文件都不存在时返回None。
+        """
+        snapshots = []
+        for metrics_file in glob.glob(self.metrics_pattern):
+            data = self._load_file(metrics_file)
+            if data is not None and 'updated_at' in data:
+                snapshots.append(data)
+        if not snapshots:
+            return None
+
+        now = time.time()
+        fresh = [data for data in snapshots if now - data['updated_at'] <= STALE_AFTER_SECONDS]
+        merged = self._merge(fresh or snapshots)
+        merged['workers_up'] = len(fresh)
+        return merged
+
+    @staticmethod
+    def _merge(snapshots: List[dict]) -> dict:
+        """计数器、即时值和直方图按worker求和"""
+        merged = {
+            'started_at': min(data.get('started_at', 0) for data in snapshots),
+            'updated_at': max(data['updated_at'] for data in snapshots),
+            'buckets': snapshots[0].get('buckets', []),
+            'counters': {},
+            'errors': {},
+            'gauges': {},
+            'latency_by_rule': {},
+            'latency_by_host': {},
+        }
+        for data in snapshots:
+            for section in ('counters', 'errors', 'gauges'):
+                target = merged[section]
+                for key, value in data.get(section, {}).items():
+                    target[key] = target.get(key, 0) + value
+            for section in ('latency_by_rule', 'latency_by_host'):
+                target = merged[section]
+                for key, histogram in data.get(section, {}).items():
+                    existing = target.get(key)
+                    if existing is None:
+                        target[key] = {'counts': list(histogram['counts']),
+                                       'sum': histogram['sum'], 'count': histogram['count']}
+                    else:
+                        existing['counts'] = [a + b for a, b in zip(existing['counts'], histogram['counts'])]
+                        existing['sum'] += histogram['sum']
+                        existing['count'] += histogram['count']
+        return merged
+
+    def _render_histograms(self, lines: List[str], name: str, help_text: str, label: str,
+                           histograms: Dict[str, dict], buckets: List[float]):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for label_value, histogram in sorted(histograms.items()):
+            label_str = f'{label}="{_escape_label(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(buckets, histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_str},le="{_format_value(bound / 1000)}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label_str},le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{name}_sum{{{label_str}}} {_format_value(histogram["sum"] / 1000)}')
+            lines.append(f'{name}_count{{{label_str}}} {histogram["count"]}')
+
+    def render_prometheus(self) -> str:
+        """生成Prometheus文本格式（text/plain; version=0.0.4）"""
+        data = self.load_metrics()
+        lines: List[str] = []
+
+        age = time.time() - data['updated_at'] if data else None
+        up = 1 if age is not None and age <= STALE_AFTER_SECONDS else 0
+        lines.append(f"# HELP {METRIC_PREFIX}_up 代理进程是否在持续更新指标")
+        lines.append(f"# TYPE {METRIC_PREFIX}_up gauge")
+        lines.append(f"{METRIC_PREFIX}_up {up}")
+        if data is None:
+            return '\n'.join(lines) + '\n'
+
+        lines.append(f"# HELP {METRIC_PREFIX}_workers_up 仍在更新指标的worker数量")
+        lines.append(f"# TYPE {METRIC_PREFIX}_workers_up gauge")
+        lines.append(f"{METRIC_PREFIX}_workers_up {data['workers_up']}")
+        lines.append(f"# HELP {METRIC_PREFIX}_metrics_age_seconds 指标文件距上次更新的时间")
+        lines.append(f"# TYPE {METRIC_PREFIX}_metrics_age_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_metrics_age_seconds {round(age, 3)}")
+        lines.append(f"# HELP {METRIC_PREFIX}_start_time_seconds 代理进程启动时间")
+        lines.append(f"# TYPE {METRIC_PREFIX}_start_time_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_start_time_seconds {data['started_at']}")
+
+        counters = data.get('counters', {})
+        for key, help_text in COUNTER_HELP.items():
+            name = f"{METRIC_PREFIX}_{key}_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {counters.get(key, 0)}")
+
+        name = f"{METRIC_PREFIX}_errors_total"
+        lines.append(f"# HELP {name} 按类型统计的错误数")
+        lines.append(f"# TYPE {name} counter")
+        for kind, count in sorted(data.get('errors', {}).items()):
+            lines.append(f'{name}{{kind="{_escape_label(kind)}"}} {count}')
+
+        gauges = data.get('gauges', {})
+        for key, help_text in GAUGE_HELP.items():
+            if key not in gauges:
+                continue
+            name = f"{METRIC_PREFIX}_{key}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(gauges[key])}")
+
+        buckets = data.get('buckets', [])
+        self._render_histograms(
+            lines, f"{METRIC_PREFIX}_request_duration_seconds", "按处理方式统计的请求总延迟",
+            "rule", data.get('latency_by_rule', {}), buckets,
+        )
+        self._render_histograms(
+            lines, f"{METRIC_PREFIX}_host_request_duration_seconds", "按主机统计的请求总延迟",
+            "host", data.get('latency_by_host', {}), buckets,
+        )
+        return '\n'.join(lines) + '\n'
+
+
+# 全局单例
+_metrics_service = None
+
+
+def get_metrics_service() -> MetricsService:
+    """获取指标服务单例"""
+    global _metrics_service
+    if _metrics_service is None:
+        _metrics_service = MetricsService()
+    return _metrics_service
@@ -1,18 +1,32 @@
+import json
 import subprocess
+import sys
 import psutil
 import socket
 import os
 import signal
 import time
-from typing import Optional
-from models import ProxyStatus
+from typing import List, Optional
+from models import ProxyStatus, WorkerStatus
+from services.config_store import CONFIG_STORE, config_store_path
+
+
+# 多worker模式下各进程的信息（分发器和各worker的PID、端口）
+POOL_FILE = "./data/mitmdump_pool.json"
+# 旧版本单进程模式的PID文件
+LEGACY_PID_FILE = "./data/mitmdump.pid"
 
 
 class MitmProxyService:
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None):
         self.process: Optional[subprocess.Popen] = None
         self.port = 8080
-        self.pid_file = "./data/mitmdump.pid"
+        # worker数量，大于1时启动多个mitmdump并在代理端口前放一个分发器
+        self.workers = workers or int(os.environ.get("MITMPROXY_WORKERS", "1"))
+        self.worker_base_port = 18080  # worker i 监听 127.0.0.1:(worker_base_port + i)
+        self.pool_file = POOL_FILE
+        self.pid_file = LEGACY_PID_FILE
+        self.scripts_dir = os.path.join(os.path.dirname(__file__), "..", "..", "scripts")
 
     def get_local_ip(self) -> str:
         """获取本地IP地址"""
@@ -33,155 +47,230 @@ class MitmProxyService:
             return True
 
         # 方法2: 通过端口检查
-        return self._check_port_in_use()
-    
-    def _reconnect_to_process(self, pid: int):
-        """重新建立到现有进程的连接"""
-        try:
-            # 注意：这里不能直接从PID创建Popen对象
-            # 但可以用于后续的停止操作
-            self.process = None  # 暂时设为None，通过PID文件管理
-        except Exception:
-            pass
-    
-    def _check_port_in_use(self) -> bool:
+        return self._check_port_in_use(self.port)
+
+    def _check_port_in_use(self, port: int) -> bool:
         """检查端口是否被占用"""
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                result = s.connect_ex(('127.0.0.1', self.port))
+                result = s.connect_ex(('127.0.0.1', port))
                 return result == 0
         except Exception:
             return False
 
+    @staticmethod
+    def _pid_alive(pid: Optional[int]) -> bool:
+        if not pid:
+            return False
+        try:
+            return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+
+    def _load_pool(self) -> dict:
+        """读取进程池信息，兼容旧版本的单个PID文件"""
+        try:
+            with open(self.pool_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        try:
+            with open(self.pid_file, 'r') as f:
+                pid = int(f.read().strip())
+            return {'distributor': None, 'workers': [{'id': '', 'port': self.port, 'pid': pid}]}
+        except (ValueError, OSError):
+            return {'distributor': None, 'workers': []}
+
+    def _save_pool(self, pool: dict):
+        os.makedirs(os.path.dirname(self.pool_file), exist_ok=True)
+        temp_file = self.pool_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(pool, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.pool_file)
+
+    def _clear_pool(self):
+        for path in (self.pool_file, self.pid_file):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
     def get_status(self) -> ProxyStatus:
-        """获取代理状态"""
+        """获取代理状态（多worker模式下包含每个worker的状态）"""
         running = self.is_running()
-        
-        # 获取PID
+        pool = self._load_pool()
+
+        workers = [
+            WorkerStatus(
+                id=str(worker.get('id', '')),
+                port=worker['port'],
+                pid=worker.get('pid'),
+                running=self._pid_alive(worker.get('pid')),
+            )
+            for worker in pool.get('workers', [])
+        ]
+
+        # 对外的PID：多worker模式为分发器，单进程模式为mitmdump
         pid = None
         if running:
-            if self.process:
+            distributor = pool.get('distributor')
+            if distributor:
+                pid = distributor.get('pid')
+            elif self.process:
                 pid = self.process.pid
-            elif os.path.exists(self.pid_file):
-                try:
-                    with open(self.pid_file, 'r') as f:
-                        pid = int(f.read().strip())
-                except (ValueError, FileNotFoundError):
-                    pass
-        
+            elif workers:
+                pid = workers[0].pid
+
         return ProxyStatus(
             running=running,
             ip=self.get_local_ip() if running else None,
             port=self.port,
-            pid=pid
+            pid=pid,
+            workers=workers if running else [],
+        )
+
+    def _build_env(self) -> dict:
+        # 设置环境变量解决中文编码问题
+        env = os.environ.copy()
+        env['PYTHONIOENCODING'] = 'utf-8'
+        env['PYTHONUNBUFFERED'] = '1'
+
+        # 根据系统设置合适的locale
+        import platform
+        if platform.system() == 'Darwin':  # macOS
+            env['LC_ALL'] = 'en_US.UTF-8'
+            env['LANG'] = 'en_US.UTF-8'
+        else:  # Linux
+            env['LC_ALL'] = 'C.UTF-8'
+            env['LANG'] = 'C.UTF-8'
+        return env
+
+    def _build_worker_cmd(self, port: int, worker_id: str = "", listen_host: Optional[str] = None) -> List[str]:
+        """构建mitmproxy命令"""
+        addon_path = os.path.join(self.scripts_dir, "mitmproxy_addon.py")
+        cmd = ["mitmdump"]
+        if listen_host:
+            cmd += ["--listen-host", listen_host]
+        cmd += [
+            "-p", str(port),
+            "-s", addon_path,
+            "--set", "confdir=./data",
+            "--set", "flow_detail=4",
+            "--set", "console_default_contentview=raw",
+            "--set", "console_eventlog_verbosity=info",
+            "--set", "dumper_default_contentview=raw"
+        ]
+        if CONFIG_STORE != "json":
+            # 后端使用SQLite存储时，插件冷启动和监听变化读取数据库文件
+            cmd += ["--set", f"mock_config_file={config_store_path()}"]
+        if worker_id:
+            # 每个worker使用独立的抓包文件和指标文件
+            cmd += ["--set", f"mock_worker_id={worker_id}"]
+        return cmd
+
+    def _spawn(self, cmd: List[str], log_path: str, env: dict) -> subprocess.Popen:
+        """启动进程，输出到日志文件"""
+        log_file = open(log_path, "a", encoding="utf-8")
+        return subprocess.Popen(
+            cmd,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            env=env,
+            preexec_fn=os.setsid if os.name != 'nt' else None
         )
 
-    def start(self) -> bool:
-        """启动mitmproxy"""
+    def start(self, workers: Optional[int] = None) -> bool:
+        """启动mitmproxy，workers大于1时启动worker池和分发器"""
         if self.is_running():
             return True
 
+        workers = workers or self.workers
+        env = self._build_env()
+        pool = {'distributor': None, 'workers': []}
         try:
-            # 构建mitmproxy命令
-            addon_path = os.path.join(os.path.dirname(__file__), "..", "..", "scripts", "mitmproxy_addon.py")
-            cmd = [
-                "mitmdump",
-                "-p", str(self.port),
-                "-s", addon_path,
-                "--set", "confdir=./data",
-                "--set", "flow_detail=4",
-                "--set", "console_default_contentview=raw",
-                "--set", "console_eventlog_verbosity=info",
-                "--set", "dumper_default_contentview=raw"
-            ]
-
-            # 设置环境变量解决中文编码问题
-            env = os.environ.copy()
-            env['PYTHONIOENCODING'] = 'utf-8'
-            env['PYTHONUNBUFFERED'] = '1'
-            
-            # 根据系统设置合适的locale
-            import platform
-            if platform.system() == 'Darwin':  # macOS
-                env['LC_ALL'] = 'en_US.UTF-8'
-                env['LANG'] = 'en_US.UTF-8'
-            else:  # Linux
-                env['LC_ALL'] = 'C.UTF-8'
-                env['LANG'] = 'C.UTF-8'
-
-            # 启动进程，输出到日志文件
-            log_file = open("./data/mitmdump.log", "a", encoding="utf-8")
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=log_file,
-                stderr=subprocess.STDOUT,
-                env=env,
-                preexec_fn=os.setsid if os.name != 'nt' else None
-            )
+            os.makedirs("./data", exist_ok=True)
+            if workers <= 1:
+                self.process = self._spawn(self._build_worker_cmd(self.port), "./data/mitmdump.log", env)
+                pool['workers'].append({'id': '', 'port': self.port, 'pid': self.process.pid})
+            else:
+                backends = []
+                for index in range(1, workers + 1):
+                    worker_id = str(index)
+                    port = self.worker_base_port + index
+                    process = self._spawn(
+                        self._build_worker_cmd(port, worker_id, listen_host="127.0.0.1"),
+                        f"./data/mitmdump.w{worker_id}.log", env
+                    )
+                    pool['workers'].append({'id': worker_id, 'port': port, 'pid': process.pid})
+                    backends += ["--backend", f"127.0.0.1:{port}"]
+
+                self.process = self._spawn(
+                    [sys.executable, os.path.join(self.scripts_dir, "proxy_distributor.py"),
+                     "--listen", f"0.0.0.0:{self.port}"] + backends,
+                    "./data/mitmdump.log", env
+                )
+                pool['distributor'] = {'port': self.port, 'pid': self.process.pid}
 
-            # 保存PID到文件
-            with open(self.pid_file, 'w') as f:
-                f.write(str(self.process.pid))
+            # 保存各进程的PID
+            self._save_pool(pool)
 
             # 等待一小段时间确保启动成功
             time.sleep(2)
 
-            if self.is_running():
+            if self.is_running() and all(self._pid_alive(worker['pid']) for worker in pool['workers']):
                 return True
-            else:
-                self.process = None
-                return False
+            self._stop_pool(pool)
+            return False
 
         except Exception as e:
             print(f"启动mitmproxy失败: {e}")
-            self.process = None
+            self._stop_pool(pool)
             return False
 
-    def stop(self) -> bool:
-        """停止mitmproxy"""
-        if not self.is_running():
-            return True
-
-        pid = None
-        
-        # 尝试从PID文件获取进程ID
-        if os.path.exists(self.pid_file):
-            try:
-                with open(self.pid_file, 'r') as f:
-                    pid = int(f.read().strip())
-            except (ValueError, FileNotFoundError):
-                pid = None
-
-        # 如果没有PID文件但有process对象，使用process.pid
-        if not pid and self.process:
-            pid = self.process.pid
+    def _stop_pool(self, pool: dict):
+        """先停止分发器再停止各worker，超时后强制结束"""
+        groups = []
+        if pool.get('distributor'):
+            groups.append([pool['distributor']])
+        groups.append(pool.get('workers', []))
 
-        if pid:
-            try:
-                # 使用psutil停止进程
-                proc = psutil.Process(pid)
-                if proc.is_running():
+        for group in groups:
+            procs = []
+            for entry in group:
+                try:
+                    proc = psutil.Process(entry['pid'])
                     proc.terminate()
-                    # 等待进程结束
-                    proc.wait(timeout=10)
-                
-                # 清理资源
-                self.process = None
-                return True
-                
-            except psutil.TimeoutExpired:
+                    procs.append(proc)
+                except psutil.NoSuchProcess:
+                    # 进程已经不存在
+                    pass
+                except Exception as e:
+                    print(f"停止mitmproxy进程 {entry.get('pid')} 失败: {e}")
+
+            _, alive = psutil.wait_procs(procs, timeout=10)
+            for proc in alive:
                 # 超时后强制杀死
                 try:
                     proc.kill()
-                    proc.wait(timeout=5)
-                except:
+                except psutil.NoSuchProcess:
                     pass
-            except psutil.NoSuchProcess:
-                # 进程已经不存在
-                pass
-            except Exception as e:
-                print(f"停止mitmproxy失败: {e}")
+            psutil.wait_procs(alive, timeout=5)
 
         # 清理资源
         self.process = None
-        return True
\ No newline at end of file
+        self._clear_pool()
+
+    def stop(self) -> bool:
+        """停止mitmproxy（多worker模式下停止整个进程池）"""
+        pool = self._load_pool()
+        if not self.is_running() and not any(self._pid_alive(w.get('pid')) for w in pool.get('workers', [])):
+            self._clear_pool()
+            return True
+
+        # 没有进程池信息但有process对象，使用process.pid
+        if not pool.get('workers') and not pool.get('distributor') and self.process:
+            pool = {'distributor': None, 'workers': [{'id': '', 'port': self.port, 'pid': self.process.pid}]}
+
+        self._stop_pool(pool)
+        return True
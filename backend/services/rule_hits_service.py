@@ -0,0 +1,73 @@
+import glob
+import json
+import os
+import zlib
+from typing import Dict
+
+# mitmproxy插件定期写入的规则命中统计（多worker模式下为 rule_hits.w1.json 等）
+RULE_HITS_PATTERN = "./data/rule_hits*.json"
+
+# 规则类型，与 config.json 中的列表名一致
+RULE_KINDS = ("apis", "file_downloads", "request_mappings")
+
+# 按命中统计排序的方式，"-" 前缀表示降序（列表接口的全部排序方式见 rule_list_service.py）
+HIT_SORT_KEYS = ("hits", "-hits", "last_hit", "-last_hit")
+
+
+class RuleHitsService:
+    """读取插件写入的规则命中统计，多worker时合并各worker的文件"""
+
+    def __init__(self, hits_pattern: str = RULE_HITS_PATTERN):
+        self.hits_pattern = hits_pattern
+
+    def load_hits(self) -> Dict[str, Dict[str, dict]]:
+        """返回 {规则类型: {规则ID: {'hits': 命中次数, 'last_hit': 最后命中时间}}}"""
+        merged: Dict[str, Dict[str, dict]] = {kind: {} for kind in RULE_KINDS}
+        for hits_file in glob.glob(self.hits_pattern):
+            try:
+                with open(hits_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                print(f"读取规则命中统计失败: {e}")
+                continue
+
+            for kind in RULE_KINDS:
+                target = merged[kind]
+                for rule_id, stats in (data.get(kind) or {}).items():
+                    existing = target.get(rule_id)
+                    if existing is None:
+                        target[rule_id] = {'hits': stats.get('hits', 0), 'last_hit': stats.get('last_hit')}
+                        continue
+                    existing['hits'] += stats.get('hits', 0)
+                    last_hit = stats.get('last_hit')
+                    if last_hit is not None and (existing['last_hit'] is None or last_hit > existing['last_hit']):
+                        existing['last_hit'] = last_hit
+        return merged
+
+    def signature(self) -> str:
+        """命中统计文件的签名（文件名、修改时间和大小），文件变化时改变"""
+        parts = []
+        for hits_file in sorted(glob.glob(self.hits_pattern)):
+            try:
+                st = os.stat(hits_file)
+            except OSError:
+                continue
+            parts.append(f"{hits_file}:{st.st_mtime_ns}:{st.st_size}")
+        return f"{zlib.crc32('|'.join(parts).encode('utf-8')):08x}"
+
+    def get_hits(self, kind: str) -> Dict[str, dict]:
+        return self.load_hits().get(kind, {})
+
+
+# 全局单例
+_rule_hits_service = None
+
+
+def get_rule_hits_service() -> RuleHitsService:
+    """获取规则命中统计服务单例"""
+    global _rule_hits_service
+    if _rule_hits_service is None:
+        _rule_hits_service = RuleHitsService()
+    return _rule_hits_service
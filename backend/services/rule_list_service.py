@@ -0,0 +1,172 @@
+import base64
+import bisect
+import json
+from typing import List, Optional
+
+from services.rule_hits_service import HIT_SORT_KEYS, get_rule_hits_service
+
+# 列表接口支持的排序方式，"-" 前缀表示降序；不指定时按配置中的顺序
+LIST_SORT_KEYS = ("name", "-name", "url", "-url") + HIT_SORT_KEYS
+
+# 列表接口的视图：full 为完整规则，summary 不含响应内容等大字段
+LIST_VIEWS = ("full", "summary")
+
+# 每种规则的URL字段和摘要视图保留的字段
+URL_FIELDS = {"apis": "url", "file_downloads": "url_pattern", "request_mappings": "url_pattern"}
+SUMMARY_FIELDS = {
+    "apis": ("id", "name", "url", "method", "enabled"),
+    "file_downloads": ("id", "name", "url_pattern", "local_file_path", "content_type", "enabled"),
+    "request_mappings": ("id", "name", "url_pattern", "target_host", "target_port", "methods", "enabled"),
+}
+
+MAX_PAGE_SIZE = 1000
+
+# 排序值为数字的字段，其余字段（name、url）的排序值为字符串
+NUMERIC_SORT_FIELDS = ("position", "hits", "last_hit")
+
+
+class RulePage:
+    """一页查询结果"""
+
+    __slots__ = ('items', 'total', 'next_cursor', 'etag')
+
+    def __init__(self, items: List[dict], total: int, next_cursor: Optional[str], etag: str):
+        self.items = items
+        self.total = total
+        self.next_cursor = next_cursor
+        self.etag = etag
+
+
+def _method_value(method) -> str:
+    return getattr(method, "value", method)
+
+
+def encode_cursor(sort: str, key: tuple) -> str:
+    raw = json.dumps([sort, list(key)], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """解析游标，得到上一页最后一条规则的排序键，游标无效或与排序方式不符时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, key = json.loads(raw)
+    except Exception:
+        raise ValueError("cursor无效")
+    if cursor_sort != sort or not isinstance(key, list) or len(key) != 2:
+        raise ValueError("cursor与当前排序方式不符")
+    # 排序值类型必须与排序字段一致，否则与规则的排序键比较时会出错
+    value, item_id = key
+    if sort.lstrip('-') in NUMERIC_SORT_FIELDS:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, str)
+    if not valid or not isinstance(item_id, str):
+        raise ValueError("cursor无效")
+    return value, item_id
+
+
+class RuleListService:
+    """规则列表的服务端查询：搜索、过滤、排序、游标分页和摘要视图
+
+    游标记录上一页最后一条规则的 (排序值, 规则ID)，下一页从排序在它之后的规则开始，
+    翻页期间新增或删除规则不会导致重复或遗漏。ETag 由配置的修改代数和命中统计文件的
+    签名组成，二者都没有变化时列表内容不变。
+    """
+
+    def __init__(self, config_service, hits_service=None):
+        self.config_service = config_service
+        self.hits_service = hits_service or get_rule_hits_service()
+
+    def etag(self, generation: Optional[int] = None) -> str:
+        if generation is None:
+            generation = self.config_service.generation
+        return f'W/"{self.config_service.instance_id}-{generation}-{self.hits_service.signature()}"'
+
+    def query(self, kind: str, q: Optional[str] = None, method: Optional[str] = None,
+              enabled: Optional[bool] = None, sort: Optional[str] = None, min_hits: Optional[int] = None,
+              max_hits: Optional[int] = None, limit: Optional[int] = None, cursor: Optional[str] = None,
+              view: str = "full") -> RulePage:
+        """查询规则列表，参数无效时抛出 ValueError"""
+        if sort is not None and sort not in LIST_SORT_KEYS:
+            raise ValueError(f"sort只支持: {', '.join(LIST_SORT_KEYS)}")
+        if view not in LIST_VIEWS:
+            raise ValueError(f"view只支持: {', '.join(LIST_VIEWS)}")
+        if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit必须在1到{MAX_PAGE_SIZE}之间")
+        sort_name = sort or "position"
+        after = decode_cursor(cursor, sort_name) if cursor else None
+
+        generation, items, positions = self.config_service.snapshot_rules(kind)
+        etag = self.etag(generation)
+        hits = self.hits_service.get_hits(kind)
+        url_field = URL_FIELDS[kind]
+        needle = q.lower() if q else None
+        method = method.upper() if method else None
+
+        matched = []
+        for item in items:
+            if enabled is not None and item.get("enabled", True) != enabled:
+                continue
+            if method is not None:
+                if kind == "apis" and _method_value(item.get("method")) != method:
+                    continue
+                if kind == "request_mappings" and method not in [_method_value(m) for m in item.get("methods", [])]:
+                    continue
+            if needle and needle not in f"{item.get('name', '')} {item.get(url_field, '')}".lower():
+                continue
+            stats = hits.get(item["id"])
+            count = stats['hits'] if stats else 0
+            if min_hits is not None and count < min_hits:
+                continue
+            if max_hits is not None and count > max_hits:
+                continue
+            item["hits"] = count
+            item["last_hit"] = stats['last_hit'] if stats else None
+            matched.append(item)
+
+        field = sort_name.lstrip('-')
+        descending = sort_name.startswith('-')
+        if field == "position":
+            key_of = lambda item: (positions.get(item["id"], 0.0), item["id"])
+        elif field == "url":
+            key_of = lambda item: (item.get(url_field) or "", item["id"])
+        elif field in ("hits", "last_hit"):
+            key_of = lambda item: (item[field] or 0, item["id"])
+        else:
+            key_of = lambda item: ((item.get(field) or "").lower(), item["id"])
+        keyed = sorted(((key_of(item), item) for item in matched), key=lambda pair: pair[0], reverse=descending)
+
+        start = 0
+        if after is not None:
+            keys = [key for key, _ in keyed]
+            if descending:
+                # 降序时找第一个小于游标的位置
+                lo, hi = 0, len(keys)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if keys[mid] < after:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                start = lo
+            else:
+                start = bisect.bisect_right(keys, after)
+
+        page = keyed[start:start + limit] if limit is not None else keyed[start:]
+        next_cursor = None
+        if limit is not None and start + limit < len(keyed):
+            next_cursor = encode_cursor(sort_name, page[-1][0])
+
+        result = []
+        for _, item in page:
+            if view == "summary":
+                summary = {name: item.get(name) for name in SUMMARY_FIELDS[kind]}
+                if kind == "apis":
+                    summary["status"] = (item.get("response") or {}).get("status")
+                summary["hits"] = item["hits"]
+                summary["last_hit"] = item["last_hit"]
+                item = summary
+            result.append(item)
+        return RulePage(result, len(keyed), next_cursor, etag)
+
@@ -0,0 +1,150 @@
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+LOG_PROFILES = ("production", "debug")
+
+# 各日志配置档的默认行为
+_PROFILE_SETTINGS = {
+    # 生产环境：只输出汇总、警告和错误，不输出响应内容
+    "production": {'level': logging.INFO, 'include_bodies': False},
+    # 调试：输出每个请求的处理结果和响应内容
+    "debug": {'level': logging.DEBUG, 'include_bodies': True},
+}
+
+
+class _TokenBucket:
+    """按消息类型限流的令牌桶"""
+
+    __slots__ = ('tokens', 'updated_at', 'suppressed', 'seen')
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.suppressed = 0
+        self.seen = 0
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时直接丢弃日志，不阻塞代理"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AddonLogger:
+    """mitmproxy插件的日志
+
+    - 每种消息类型（kind）独立限流：每秒 rate 条，允许 burst 条突发，
+      被限流的条数在下一条输出时一并报告
+    - sample > 1 时每种类型只输出每 sample 条中的1条（警告和错误不采样）
+    - 日志先进入有界队列，由后台线程写到标准输出，避免控制台I/O拖慢代理
+    """
+
+    def __init__(self, name: str = "mock_addon", profile: str = "production",
+                 rate: float = 5.0, burst: float = 20.0, sample: int = 1, queue_size: int = 10000):
+        self._logger = logging.getLogger(name)
+        self._logger.propagate = False
+        self._logger.setLevel(logging.DEBUG)
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._handler = _DroppingQueueHandler(self._queue)
+        self._logger.addHandler(self._handler)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.configure(profile, rate, burst, sample)
+
+    def configure(self, profile: str, rate: float, burst: float, sample: int):
+        settings = _PROFILE_SETTINGS.get(profile, _PROFILE_SETTINGS["production"])
+        self.profile = profile if profile in _PROFILE_SETTINGS else "production"
+        self.level = settings['level']
+        self.include_bodies = settings['include_bodies']
+        self.rate = max(0.0, rate)
+        self.burst = max(1.0, burst)
+        self.sample = max(1, sample)
+
+    def start(self):
+        """启动后台输出线程"""
+        if self._listener is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        self._listener = logging.handlers.QueueListener(self._queue, stream_handler)
+        self._listener.start()
+
+    def stop(self):
+        """停止后台输出线程，输出队列中剩余的日志"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    @property
+    def dropped(self) -> int:
+        return self._handler.dropped
+
+    def enabled_for(self, level: int) -> bool:
+        return level >= self.level
+
+    def _allow(self, kind: str, level: int) -> Optional[int]:
+        """限流判断，允许输出时返回此前被省略的条数，否则返回None"""
+        with self._lock:
+            bucket = self._buckets.get(kind)
+            if bucket is None:
+                bucket = self._buckets[kind] = _TokenBucket(self.burst)
+            bucket.seen += 1
+
+            if self.sample > 1 and level < logging.WARNING and bucket.seen % self.sample != 0:
+                bucket.suppressed += 1
+                return None
+
+            if self.rate > 0:
+                now = time.monotonic()
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+                bucket.updated_at = now
+                if bucket.tokens < 1:
+                    bucket.suppressed += 1
+                    return None
+                bucket.tokens -= 1
+
+            suppressed = bucket.suppressed
+            bucket.suppressed = 0
+            return suppressed
+
+    def log(self, level: int, kind: str, message: str, body: Optional[str] = None, exc_info=False):
+        if level < self.level:
+            return
+        suppressed = self._allow(kind, level)
+        if suppressed is None:
+            return
+        if suppressed:
+            message = f"{message} (此前省略 {suppressed} 条 {kind} 日志)"
+        if body is not None and self.include_bodies:
+            message = f"{message}\n{body}"
+        self._logger.log(level, f"[{kind}] {message}", exc_info=exc_info)
+
+    def debug(self, kind: str, message: str, body: Optional[str] = None):
+        self.log(logging.DEBUG, kind, message, body)
+
+    def info(self, kind: str, message: str, body: Optional[str] = None):
+        self.log(logging.INFO, kind, message, body)
+
+    def warning(self, kind: str, message: str):
+        self.log(logging.WARNING, kind, message)
+
+    def error(self, kind: str, message: str, exc_info=False):
+        self.log(logging.ERROR, kind, message, exc_info=exc_info)
+
+
+# 插件各模块共用的日志实例
+logger = AddonLogger()
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# API规则的 body_match 类型
+MATCH_GRAPHQL_OPERATION = "graphql_operation"  # GraphQL的operationName
+MATCH_JSON_POINTER = "json_pointer"  # JSON指针指向的值（RFC 6901）
+MATCH_BODY = "body"  # 规范化后的请求体与value完全相同
+MATCH_BODY_HASH = "body_hash"  # 规范化请求体的SHA-256
+
+_MISSING = object()
+_GRAPHQL_OPERATION_RE = re.compile(r'\b(?:query|mutation|subscription)\s+([_A-Za-z][_0-9A-Za-z]*)')
+
+
+def canonical_json(value: Any) -> str:
+    """键排序、无空白的JSON，用于比较和计算哈希"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def body_digest(value: Any) -> str:
+    """计算规则中期望请求体的哈希，JSON内容按规范化形式计算"""
+    if isinstance(value, (bytes, str)):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return _sha256(value if isinstance(value, bytes) else value.encode('utf-8'))
+    return _sha256(canonical_json(value).encode('utf-8'))
+
+
+def parse_json_pointer(pointer: str) -> Tuple[str, ...]:
+    if pointer == "":
+        return ()
+    if not pointer.startswith('/'):
+        raise ValueError(f"JSON指针必须以 / 开头: {pointer}")
+    return tuple(token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/'))
+
+
+def resolve_json_pointer(document: Any, tokens: Tuple[str, ...]) -> Any:
+    """按JSON指针取值，不存在时返回 _MISSING"""
+    current = document
+    for token in tokens:
+        if isinstance(current, dict):
+            current = current.get(token, _MISSING)
+        elif isinstance(current, list) and token.isdigit() and int(token) < len(current):
+            current = current[int(token)]
+        else:
+            return _MISSING
+        if current is _MISSING:
+            return _MISSING
+    return current
+
+
+class RequestBody:
+    """请求体的延迟解析视图，同一请求内各特征只计算一次"""
+
+    __slots__ = ('content', '_json', '_digest', '_operation', '_pointer_values')
+
+    def __init__(self, content: Optional[bytes]):
+        self.content = content or b""
+        self._json = None
+        self._digest = None
+        self._operation = _MISSING
+        self._pointer_values: Dict[Tuple[str, ...], Optional[str]] = {}
+
+    @property
+    def json(self) -> Any:
+        """解析后的JSON，不是JSON时为 _MISSING"""
+        if self._json is None:
+            self._json = _MISSING
+            stripped = self.content.lstrip()
+            if stripped[:1] in (b'{', b'['):
+                try:
+                    self._json = json.loads(self.content)
+                except ValueError:
+                    pass
+        return self._json
+
+    @property
+    def json_or_none(self) -> Any:
+        """解析后的JSON，不是JSON时为None"""
+        document = self.json
+        return None if document is _MISSING else document
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            document = self.json
+            if document is _MISSING:
+                self._digest = _sha256(self.content)
+            else:
+                self._digest = _sha256(canonical_json(document).encode('utf-8'))
+        return self._digest
+
+    @property
+    def operation_name(self) -> Optional[str]:
+        """GraphQL操作名，优先使用operationName字段，否则取query中的第一个命名操作"""
+        if self._operation is _MISSING:
+            self._operation = None
+            document = self.json
+            if isinstance(document, dict):
+                name = document.get('operationName')
+                if isinstance(name, str) and name:
+                    self._operation = name
+                elif isinstance(document.get('query'), str):
+                    found = _GRAPHQL_OPERATION_RE.search(document['query'])
+                    if found:
+                        self._operation = found.group(1)
+        return self._operation
+
+    def pointer_value(self, tokens: Tuple[str, ...]) -> Optional[str]:
+        """JSON指针处值的规范化JSON，不存在时返回None"""
+        if tokens not in self._pointer_values:
+            document = self.json
+            value = _MISSING if document is _MISSING else resolve_json_pointer(document, tokens)
+            self._pointer_values[tokens] = None if value is _MISSING else canonical_json(value)
+        return self._pointer_values[tokens]
+
+    def select(self, index: 'BodyIndex') -> Any:
+        return index.select(self)
+
+
+class BodyIndex:
+    """同一URL规则下按请求体区分的响应
+
+    加载配置时把各类条件放入哈希表，请求时每类只做一次查找：
+    请求体哈希 > GraphQL操作名 > JSON指针（按首次出现的指针顺序）> 不带body_match的规则。
+    同一条件重复出现时以后加入的为准。
+    """
+
+    __slots__ = ('default', 'by_digest', 'by_operation', 'by_pointer')
+
+    def __init__(self):
+        self.default = None
+        self.by_digest: Dict[str, Any] = {}
+        self.by_operation: Dict[str, Any] = {}
+        self.by_pointer: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    def add(self, body_match: Optional[dict], payload: Any):
+        if not body_match:
+            self.default = payload
+            return
+
+        match_type = body_match.get('type')
+        value = body_match.get('value')
+        if match_type == MATCH_GRAPHQL_OPERATION:
+            if not isinstance(value, str) or not value:
+                raise ValueError("graphql_operation 需要操作名")
+            self.by_operation[value] = payload
+        elif match_type == MATCH_JSON_POINTER:
+            tokens = parse_json_pointer(body_match.get('pointer') or "")
+            self.by_pointer.setdefault(tokens, {})[canonical_json(value)] = payload
+        elif match_type == MATCH_BODY:
+            self.by_digest[body_digest(value)] = payload
+        elif match_type == MATCH_BODY_HASH:
+            if not isinstance(value, str) or not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+                raise ValueError("body_hash 需要SHA-256十六进制字符串")
+            self.by_digest[value.lower()] = payload
+        else:
+            raise ValueError(f"未知的body_match类型: {match_type}")
+
+    def select(self, body: RequestBody) -> Any:
+        if self.by_digest:
+            payload = self.by_digest.get(body.digest)
+            if payload is not None:
+                return payload
+        if self.by_operation:
+            name = body.operation_name
+            if name is not None:
+                payload = self.by_operation.get(name)
+                if payload is not None:
+                    return payload
+        for tokens, values in self.by_pointer.items():
+            value = body.pointer_value(tokens)
+            if value is not None:
+                payload = values.get(value)
+                if payload is not None:
+                    return payload
+        return self.default
@@ -0,0 +1,153 @@
+import hashlib
+from typing import Iterable, Optional, Tuple
+
+from body_matcher import RequestBody
+
+# 按前缀判断为文本的内容类型
+TEXT_CONTENT_TYPES = (
+    "text/",
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/x-javascript",
+    "application/ecmascript",
+    "application/x-www-form-urlencoded",
+    "application/graphql",
+    "application/x-ndjson",
+)
+
+# 按前缀判断为二进制的内容类型
+BINARY_CONTENT_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/",
+    "application/octet-stream",
+    "application/x-protobuf",
+    "application/protobuf",
+    "application/vnd.google.protobuf",
+    "application/grpc",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/pdf",
+    "application/vnd.android.package-archive",
+    "application/wasm",
+    "multipart/byteranges",
+)
+
+BODY_FULL = "full"
+BODY_TRUNCATED = "truncated"
+BODY_BINARY = "binary"
+BODY_HASH = "hash"
+BODY_OMITTED = "omitted"
+
+
+def _normalize_host(host: str) -> str:
+    host = host.lower()
+    if host.startswith('['):
+        return host.split(']')[0] + ']'
+    return host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+
+
+class CapturePolicy:
+    """抓包请求体/响应体的记录策略
+
+    - max_body_bytes：每个body最多记录的字节数，超出部分截断并加标记，0表示不限制
+    - 二进制内容（按Content-Type判断，无类型时尝试UTF-8解码）只记录大小
+    - hash_only_hosts：只记录body的SHA-256和大小
+    - metadata_only_hosts：完全不记录body，只保留大小
+    主机支持精确匹配和 *.example.com 形式的后缀匹配。
+    """
+
+    def __init__(self, max_body_bytes: int = 1024 * 1024,
+                 hash_only_hosts: Iterable[str] = (),
+                 metadata_only_hosts: Iterable[str] = (),
+                 binary_content_types: Iterable[str] = ()):
+        self.max_body_bytes = max_body_bytes
+        self.binary_content_types = BINARY_CONTENT_TYPES + tuple(t.lower() for t in binary_content_types)
+        self._hash_only = self._compile_hosts(hash_only_hosts)
+        self._metadata_only = self._compile_hosts(metadata_only_hosts)
+
+    @staticmethod
+    def _compile_hosts(hosts: Iterable[str]) -> Tuple[frozenset, Tuple[str, ...]]:
+        exact = set()
+        suffixes = []
+        for host in hosts:
+            host = host.strip().lower()
+            if not host:
+                continue
+            if host.startswith('*.'):
+                suffixes.append(host[1:])
+            else:
+                exact.add(host)
+        return frozenset(exact), tuple(suffixes)
+
+    @staticmethod
+    def _host_matches(host: str, rules: Tuple[frozenset, Tuple[str, ...]]) -> bool:
+        exact, suffixes = rules
+        if not exact and not suffixes:
+            return False
+        host = _normalize_host(host)
+        return host in exact or (bool(suffixes) and host.endswith(suffixes))
+
+    def body_mode_for_host(self, host: str) -> Optional[str]:
+        """返回主机强制使用的记录方式，没有特殊规则时返回None"""
+        if self._host_matches(host, self._metadata_only):
+            return BODY_OMITTED
+        if self._host_matches(host, self._hash_only):
+            return BODY_HASH
+        return None
+
+    def is_binary_type(self, content_type: str) -> Optional[bool]:
+        """按Content-Type判断是否为二进制，无法判断时返回None"""
+        content_type = (content_type or "").split(';', 1)[0].strip().lower()
+        if not content_type:
+            return None
+        if content_type.startswith(TEXT_CONTENT_TYPES) or content_type.endswith(('+json', '+xml')):
+            return False
+        if content_type.startswith(self.binary_content_types):
+            return True
+        return None
+
+    def capture_body(self, content: Optional[bytes], content_type: str, host_mode: Optional[str],
+                     match_digest: bool = False) -> Tuple[str, dict]:
+        """按策略生成要记录的body文本和描述信息
+
+        match_digest 为True时（请求体），只记录哈希的body还会记录回放匹配用的摘要
+        （JSON按规范化后的内容计算，与回放查找时的请求体摘要一致）。
+        """
+        size = len(content) if content else 0
+        if not size:
+            return "", {'mode': BODY_FULL, 'size': 0}
+
+        if host_mode == BODY_OMITTED:
+            return f"<body omitted, {size} bytes>", {'mode': BODY_OMITTED, 'size': size}
+
+        if host_mode == BODY_HASH:
+            digest = hashlib.sha256(content).hexdigest()
+            info = {'mode': BODY_HASH, 'size': size, 'sha256': digest}
+            if match_digest:
+                info['match_digest'] = RequestBody(content).digest
+            return f"<sha256:{digest}, {size} bytes>", info
+
+        limit = self.max_body_bytes if self.max_body_bytes > 0 else size
+        head = content[:limit] if size > limit else content
+
+        binary = self.is_binary_type(content_type)
+        if binary is None:
+            # 没有可靠的Content-Type时，按能否以UTF-8解码判断（截断处可能切断多字节字符）
+            try:
+                head.decode('utf-8')
+                binary = False
+            except UnicodeDecodeError as e:
+                binary = not (size > limit and e.start >= len(head) - 3)
+        if binary:
+            content_type = (content_type or "unknown").split(';', 1)[0].strip()
+            return f"<binary data, {size} bytes, {content_type}>", {'mode': BODY_BINARY, 'size': size}
+
+        text = head.decode('utf-8', errors='replace')
+        if size > limit:
+            text += f"\n<truncated: captured {limit} of {size} bytes>"
+            return text, {'mode': BODY_TRUNCATED, 'size': size, 'captured': limit}
+        return text, {'mode': BODY_FULL, 'size': size}
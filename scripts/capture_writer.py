@@ -0,0 +1,358 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from addon_logging import logger
+
+OVERFLOW_POLICIES = ("drop_oldest", "block", "sample")
+
+SEGMENT_DIR_NAME = "capture_segments"
+
+
+def _on_event_loop() -> bool:
+    """当前线程是否正在运行asyncio事件循环（代理的事件循环不能被阻塞）"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def manifest_path_for(capture_file: str) -> str:
+    """抓包文件对应的分段清单路径，如 data/realtime_capture.manifest.json"""
+    return os.path.splitext(capture_file)[0] + ".manifest.json"
+
+
+class CaptureSegments:
+    """抓包文件的分段轮转
+
+    活动文件超过 rotate_bytes 或存在时间超过 rotate_seconds 后被封存：
+    移动到 capture_segments 目录并用gzip压缩，超过 retention 个的旧分段被删除。
+    清单文件记录活动文件和所有已封存分段（路径相对清单所在目录），
+    供后端的 CaptureService 和 WebSocket 推送读取。
+    """
+
+    def __init__(self, capture_file: str, rotate_bytes: int = 64 * 1024 * 1024,
+                 rotate_seconds: float = 0, retention: int = 20):
+        self.capture_file = capture_file
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.retention = retention
+        self.base_dir = os.path.dirname(capture_file) or "."
+        self.manifest_file = manifest_path_for(capture_file)
+        self.segment_dir = os.path.join(self.base_dir, SEGMENT_DIR_NAME)
+        self.segments = []
+        self.active_started_at = time.time()
+        self._sequence = 0
+        self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.segments = [segment for segment in manifest.get('segments', []) if 'file' in segment]
+        self.active_started_at = manifest.get('active_started_at', self.active_started_at)
+        self._sequence = max((segment.get('sequence', 0) for segment in self.segments), default=0)
+
+    def should_rotate(self, size: int) -> bool:
+        if size <= 0:
+            return False
+        if self.rotate_bytes > 0 and size >= self.rotate_bytes:
+            return True
+        return self.rotate_seconds > 0 and time.time() - self.active_started_at >= self.rotate_seconds
+
+    def rotate(self):
+        """封存当前活动文件（调用前写入方需关闭文件句柄）"""
+        if not os.path.exists(self.capture_file):
+            return
+        os.makedirs(self.segment_dir, exist_ok=True)
+
+        sealed_at = time.time()
+        self._sequence += 1
+        base_name = os.path.splitext(os.path.basename(self.capture_file))[0]
+        name = f"{base_name}.{time.strftime('%Y%m%d_%H%M%S', time.localtime(sealed_at))}_{self._sequence:04d}.jsonl"
+        sealed_path = os.path.join(self.segment_dir, name)
+        os.replace(self.capture_file, sealed_path)
+
+        segment = {
+            'file': os.path.relpath(sealed_path, self.base_dir),
+            'sequence': self._sequence,
+            'started_at': self.active_started_at,
+            'sealed_at': sealed_at,
+            'bytes': os.path.getsize(sealed_path),
+            'compressed': False,
+        }
+        self.segments.append(segment)
+        self.active_started_at = sealed_at
+        self.write_manifest()
+
+        # 压缩封存的分段
+        compressed_path = sealed_path + ".gz"
+        try:
+            with open(sealed_path, 'rb') as src, gzip.open(compressed_path + ".tmp", 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(compressed_path + ".tmp", compressed_path)
+            os.remove(sealed_path)
+            segment['file'] = os.path.relpath(compressed_path, self.base_dir)
+            segment['compressed'] = True
+            segment['compressed_bytes'] = os.path.getsize(compressed_path)
+        except OSError as e:
+            logger.error("capture", f"压缩抓包分段失败: {e}")
+
+        self._apply_retention()
+        self.write_manifest()
+
+    def _apply_retention(self):
+        if self.retention <= 0:
+            return
+        while len(self.segments) > self.retention:
+            segment = self.segments.pop(0)
+            try:
+                os.remove(os.path.join(self.base_dir, segment['file']))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error("capture", f"删除旧抓包分段失败: {e}")
+
+    def write_manifest(self):
+        """原子地写入清单文件，已被外部删除的分段不再列出"""
+        self.segments = [
+            segment for segment in self.segments
+            if os.path.exists(os.path.join(self.base_dir, segment['file']))
+        ]
+        manifest = {
+            'active': os.path.relpath(self.capture_file, self.base_dir),
+            'active_started_at': self.active_started_at,
+            'segments': self.segments,
+            'updated_at': time.time(),
+        }
+        temp_file = self.manifest_file + ".tmp"
+        try:
+            os.makedirs(self.base_dir, exist_ok=True)
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.manifest_file)
+        except OSError as e:
+            logger.error("capture", f"写入抓包分段清单失败: {e}")
+
+
+class CaptureWriter:
+    """后台批量写入抓包记录
+
+    代理的热路径只把记录放入有界队列，由独立线程按批次（条数或时间）
+    序列化并写入长期打开的文件句柄。队列满时按 overflow_policy 处理：
+    - drop_oldest：丢弃最旧的记录
+    - block：等待队列有空位（最多 block_timeout 秒），超时后丢弃新记录；只在事件循环
+      之外等待，代理的钩子通过 submit_async 把等待放到线程池中，只延迟当前请求，
+      在事件循环线程中直接调用 submit 时按 drop_oldest 处理
+    - sample：每 sample_rate 条溢出记录保留1条（替换最旧的），其余丢弃
+    每批写入后检查是否需要轮转活动文件（见 CaptureSegments）。
+    """
+
+    def __init__(self, capture_file: str, max_queue: int = 10000, batch_size: int = 200,
+                 flush_interval: float = 0.5, overflow_policy: str = "drop_oldest",
+                 sample_rate: int = 10, block_timeout: float = 1.0):
+        self.capture_file = capture_file
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+        self.block_timeout = block_timeout
+
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self._overflow_seen = 0
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._file_inode: Optional[int] = None
+        self.segments = CaptureSegments(capture_file)
+
+    def configure(self, max_queue: int, batch_size: int, flush_interval: float,
+                  overflow_policy: str, sample_rate: int, rotate_bytes: int,
+                  rotate_seconds: float, retention: int):
+        self.segments.rotate_bytes = rotate_bytes
+        self.segments.rotate_seconds = rotate_seconds
+        self.segments.retention = retention
+        with self._condition:
+            self.max_queue = max(1, max_queue)
+            self.batch_size = max(1, batch_size)
+            self.flush_interval = max(0.01, flush_interval)
+            self.overflow_policy = overflow_policy if overflow_policy in OVERFLOW_POLICIES else "drop_oldest"
+            self.sample_rate = max(1, sample_rate)
+            self._condition.notify_all()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, record: dict) -> bool:
+        """提交一条记录，返回是否进入队列"""
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                if not self._make_room(can_block=not _on_event_loop()):
+                    self.dropped += 1
+                    return False
+            self._queue.append(record)
+            self.queued += 1
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+            return True
+
+    async def submit_async(self, record: dict) -> bool:
+        """在事件循环中提交记录，block 策略下队列满时在线程池中等待，不阻塞事件循环"""
+        if self.overflow_policy == "block" and len(self._queue) >= self.max_queue:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.submit, record)
+        return self.submit(record)
+
+    def _make_room(self, can_block: bool = True) -> bool:
+        """队列已满时按溢出策略腾出位置（调用时已持有锁），can_block 为 False 时不等待"""
+        if self.overflow_policy == "block" and can_block:
+            deadline = time.monotonic() + self.block_timeout
+            self._condition.notify_all()
+            while len(self._queue) >= self.max_queue and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return len(self._queue) < self.max_queue
+
+        if self.overflow_policy == "sample":
+            self._overflow_seen += 1
+            if self._overflow_seen % self.sample_rate != 0:
+                return False
+
+        self._queue.popleft()
+        self.dropped += 1
+        return True
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止写入线程，写完队列中剩余的记录"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._close_file()
+
+    def _take_batch(self) -> list:
+        with self._condition:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._queue) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            # 唤醒因队列满而等待的提交方
+            self._condition.notify_all()
+            return batch
+
+    def _run(self):
+        self.segments.write_manifest()
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write_batch(batch)
+            elif self._stopping:
+                break
+            self._maybe_rotate()
+
+    def _maybe_rotate(self):
+        """活动文件达到大小或时间上限时封存为压缩分段"""
+        try:
+            size = os.path.getsize(self.capture_file)
+        except OSError:
+            return
+        if not self.segments.should_rotate(size):
+            return
+        self._close_file()
+        try:
+            self.segments.rotate()
+        except OSError as e:
+            logger.error("capture", f"轮转抓包文件失败: {e}")
+
+    def _write_batch(self, batch: list):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False))
+            except (TypeError, ValueError) as e:
+                logger.error("capture", f"序列化抓包数据失败: {e}")
+                with self._condition:
+                    self.dropped += 1
+        if not lines:
+            return
+
+        try:
+            f = self._ensure_file()
+            # 每个JSON对象一行（JSONL格式）
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            with self._condition:
+                self.written += len(lines)
+        except Exception as e:
+            logger.error("capture", f"保存抓包数据失败: {e}")
+            with self._condition:
+                self.dropped += len(lines)
+            self._close_file()
+
+    def _ensure_file(self):
+        """获取写入句柄，文件被删除或替换时重新打开"""
+        try:
+            inode = os.stat(self.capture_file).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._file is None or inode != self._file_inode:
+            self._close_file()
+            directory = os.path.dirname(self.capture_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.capture_file, 'a', encoding='utf-8')
+            self._file_inode = os.fstat(self._file.fileno()).st_ino
+        return self._file
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+            self._file_inode = None
+
+    def stats(self) -> dict:
+        return {
+            'depth': len(self._queue),
+            'queued': self.queued,
+            'written': self.written,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import secrets
+from typing import Optional
+
+from addon_logging import logger
+from config_snapshot import ConfigWatcher
+
+# 推送通道的地址和令牌，后端读取后连接（多worker模式下如 data/mock_control.w1.json）
+CONTROL_FILE = "data/mock_control.json"
+
+# 单条消息（一行JSON）的最大长度
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+
+
+class ConfigChannel:
+    """后端到插件的配置推送通道
+
+    在 127.0.0.1 的随机端口上监听，地址和随机令牌写入 CONTROL_FILE。
+    后端每次修改配置后发送一行JSON：{"token": ..., "config": {..., "version": N}}，
+    插件在线程池中构建新快照并整体替换，回复一行JSON：{"ok": ..., "version": 当前版本}。
+    配置文件只用于持久化和冷启动。
+    """
+
+    def __init__(self, watcher: ConfigWatcher, control_file: str = CONTROL_FILE):
+        self.watcher = watcher
+        self.control_file = control_file
+        self.host = "127.0.0.1"
+        self.port: Optional[int] = None
+        self.token = secrets.token_urlsafe(24)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._server is not None
+
+    async def start(self):
+        if self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, 0, limit=MAX_MESSAGE_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._write_control_file()
+
+    def _write_control_file(self):
+        data = {'host': self.host, 'port': self.port, 'token': self.token, 'pid': os.getpid()}
+        os.makedirs(os.path.dirname(self.control_file) or '.', exist_ok=True)
+        tmp_file = f"{self.control_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.control_file)
+
+    def close(self):
+        if self._server is None:
+            return
+        self._server.close()
+        self._server = None
+        self.port = None
+        try:
+            os.remove(self.control_file)
+        except OSError:
+            pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            result = await self._apply_message(line)
+            writer.write(json.dumps(result, ensure_ascii=False).encode('utf-8') + b'\n')
+            await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            logger.warning("config", f"配置推送连接异常: {e}")
+        finally:
+            writer.close()
+
+    async def _apply_message(self, line: bytes) -> dict:
+        # 解析消息（大配置可能需要几百毫秒）和构建快照都放到线程池中，不阻塞代理的事件循环
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._apply_line, line)
+
+    def _apply_line(self, line: bytes) -> dict:
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            return {'ok': False, 'error': f"无效的消息: {e}", 'version': self.watcher.version}
+        if not isinstance(message, dict) or not secrets.compare_digest(str(message.get('token', '')), self.token):
+            return {'ok': False, 'error': "令牌无效", 'version': self.watcher.version}
+        config = message.get('config')
+        if not isinstance(config, dict):
+            return {'ok': False, 'error': "缺少配置", 'version': self.watcher.version}
+
+        applied = self.watcher.apply(config)
+        if applied:
+            logger.info("config", f"已应用推送的配置: 版本 {self.watcher.version}")
+        return {'ok': True, 'applied': applied, 'version': self.watcher.version}
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional, Tuple
+
+from addon_logging import logger
+from mock_response import ResponseCache
+from network_conditions import NetworkConditions
+from route_tree import ApiRouter
+from rule_matcher import RuleMatcher
+
+
+def read_config_file(config_file: str) -> Tuple[dict, str]:
+    """读取配置文件，返回 (配置, 文件内容摘要)
+
+    .db 为后端的SQLite规则存储（按排序位置恢复规则顺序），其他为JSON。
+    """
+    if not config_file.endswith('.db'):
+        with open(config_file, 'rb') as f:
+            content = f.read()
+        return json.loads(content), hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(config_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    data = {'apis': [], 'file_downloads': [], 'request_mappings': []}
+    conn = sqlite3.connect(f"file:{config_file}?mode=ro", uri=True)
+    try:
+        for kind, item in conn.execute("SELECT kind, data FROM rules ORDER BY kind, position"):
+            if kind in data:
+                data[kind].append(json.loads(item))
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    finally:
+        conn.close()
+    if row is not None:
+        data['version'] = int(row[0])
+    return data, digest.hexdigest()
+
+
+class RuleSnapshot:
+    """一次配置加载得到的不可变规则快照
+
+    快照构建完成后不再修改，请求处理线程只读取引用，
+    配置变化时整体替换为新的快照。
+    """
+
+    __slots__ = ('api_router', 'file_downloads', 'request_mappings', 'download_matcher',
+                 'mapping_matchers', 'loaded_at')
+
+    def __init__(self, api_router: ApiRouter, file_downloads: dict, request_mappings: list):
+        object.__setattr__(self, 'api_router', api_router)
+        object.__setattr__(self, 'file_downloads', MappingProxyType(file_downloads))
+        object.__setattr__(self, 'request_mappings', tuple(request_mappings))
+
+        # 预编译文件下载规则（保持配置顺序）
+        object.__setattr__(self, 'download_matcher', RuleMatcher(list(file_downloads.items())))
+
+        # 请求映射按HTTP方法分组预编译，每组内保持配置顺序
+        mappings_by_method = {}
+        for mapping in request_mappings:
+            for method in {str(m).upper() for m in mapping.get('methods', [])}:
+                mappings_by_method.setdefault(method, []).append(
+                    (mapping.get('url_pattern', ''), mapping)
+                )
+        object.__setattr__(self, 'mapping_matchers', MappingProxyType({
+            method: RuleMatcher(entries) for method, entries in mappings_by_method.items()
+        }))
+        object.__setattr__(self, 'loaded_at', time.time())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleSnapshot是只读的")
+
+    @classmethod
+    def empty(cls) -> 'RuleSnapshot':
+        return cls(ApiRouter(), {}, [])
+
+    @classmethod
+    def from_config(cls, data: dict, response_cache: Optional[ResponseCache] = None,
+                    trust_rev: bool = True) -> 'RuleSnapshot':
+        """从配置字典构建快照，API响应在此时预先序列化
+
+        trust_rev 为False时（从文件加载，可能是手动编辑的）忽略规则的 rev，按内容哈希缓存响应。
+        """
+        if response_cache is None:
+            response_cache = ResponseCache()
+        response_cache.begin()
+
+        # 加载API配置，按 (方法, 主机) 建立路径模板树
+        api_router = ApiRouter()
+        for api in data.get('apis', []):
+            if api.get('enabled', True):
+                rule_id = api.get('id', f"{api['method']}:{api['url']}")
+                try:
+                    api_router.add(api['method'], api['url'], api.get('body_match'),
+                                   response_cache.prepare(rule_id, api['response'], api.get('network'),
+                                                          api.get('rev') if trust_rev else None))
+                except ValueError as e:
+                    logger.warning("config", f"忽略无效的API规则 {api.get('name', rule_id)}: {e}")
+
+        # 加载文件下载配置（配置字典只属于本次快照，网络条件预先解析后放入其中）
+        file_downloads = {}
+        for download in data.get('file_downloads', []):
+            if download.get('enabled', True):
+                download['network_conditions'] = NetworkConditions.from_config(download.get('network'))
+                file_downloads[download['url_pattern']] = download
+
+        # 加载请求映射配置
+        request_mappings = []
+        for mapping in data.get('request_mappings', []):
+            if mapping.get('enabled', True):
+                mapping['network_conditions'] = NetworkConditions.from_config(mapping.get('network'))
+                request_mappings.append(mapping)
+
+        snapshot = cls(api_router, file_downloads, request_mappings)
+        response_cache.commit()
+        return snapshot
+
+
+class ConfigWatcher:
+    """监听配置文件变化，仅在文件真正改变时重建规则快照
+
+    通过 (inode, mtime, size) 判断文件是否变化，检测到变化后等待文件
+    在debounce时间内保持稳定再加载，避免读到写了一半的文件。
+    加载失败时保留旧快照。
+
+    后端也会通过推送通道直接发送配置（见 config_channel.py），推送的配置
+    version 不大于当前版本时不再重建快照。从文件加载时另外比较文件内容摘要：
+    手动编辑通常不改 version，只有版本不比当前新且内容与上次加载的文件相同时才跳过；
+    当前快照来自推送时，同版本的文件是后端写入的同一份配置，只记录摘要。
+    """
+
+    def __init__(self, config_file: str, poll_interval: float = 0.5, debounce: float = 0.2):
+        self.config_file = config_file
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.snapshot = RuleSnapshot.empty()
+        self.response_cache = ResponseCache()
+        self.reload_count = 0
+        self.version = 0
+        self._file_digest: Optional[str] = None  # 上次从文件加载的内容摘要，快照来自推送时为None
+        self._apply_lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        """获取文件签名，文件不存在时返回None"""
+        try:
+            st = os.stat(self.config_file)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self) -> bool:
+        """立即加载配置文件（用于冷启动），成功时替换快照"""
+        signature = self._stat_signature()
+        if signature is None:
+            return False
+        self._signature = signature
+        try:
+            data, digest = read_config_file(self.config_file)
+        except Exception as e:
+            logger.error("config", f"加载配置失败: {e}")
+            return False
+        return self.apply(data, digest)
+
+    def apply(self, data: dict, file_digest: Optional[str] = None) -> bool:
+        """用配置字典构建新快照并替换，返回是否替换
+
+        file_digest 为从文件加载时的文件内容摘要，推送的配置为None。
+        """
+        version = data.get('version') or 0
+        with self._apply_lock:
+            if file_digest is None:
+                if version and version <= self.version:
+                    return False
+            elif file_digest == self._file_digest:
+                return False
+            elif version and version <= self.version and self._file_digest is None:
+                # 同版本的文件是后端在推送前写入的同一份配置，更旧的文件已过期
+                if version == self.version:
+                    self._file_digest = file_digest
+                return False
+            try:
+                # 手动编辑文件时 rev 可能不变，只信任后端推送的配置中的 rev
+                snapshot = RuleSnapshot.from_config(data, self.response_cache, trust_rev=file_digest is None)
+            except Exception as e:
+                logger.error("config", f"加载配置失败: {e}")
+                return False
+
+            # 引用赋值是原子的，请求处理中拿到的要么是旧快照要么是新快照
+            self.snapshot = snapshot
+            self.version = version
+            self._file_digest = file_digest
+            self.reload_count += 1
+            return True
+
+    def check(self) -> bool:
+        """检查文件是否变化，变化且稳定后重新加载"""
+        signature = self._stat_signature()
+        if signature is None or signature == self._signature:
+            return False
+
+        # 等待文件写入稳定
+        while not self._stop_event.wait(self.debounce):
+            current = self._stat_signature()
+            if current == signature:
+                break
+            if current is None:
+                return False
+            signature = current
+
+        if self._stop_event.is_set():
+            return False
+        return self.load()
+
+    def _run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                if self.check():
+                    logger.info("config", f"配置已重新加载: {self.config_file}")
+            except Exception as e:
+                logger.error("config", f"检查配置文件变化失败: {e}")
+
+    def start(self):
+        """启动后台监听线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台监听线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
@@ -0,0 +1,96 @@
+import os
+from collections import OrderedDict
+from typing import Optional
+
+
+class CachedFile:
+    """缓存的文件内容及用于校验的元数据"""
+
+    __slots__ = ('content', 'size', 'mtime_ns', 'inode')
+
+    def __init__(self, content: bytes, st: os.stat_result):
+        self.content = content
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.inode = st.st_ino
+
+    def is_valid(self, st: os.stat_result) -> bool:
+        return self.size == st.st_size and self.mtime_ns == st.st_mtime_ns and self.inode == st.st_ino
+
+
+class FileContentCache:
+    """按字节预算限制的LRU文件内容缓存
+
+    只缓存不超过 max_entry_bytes 的小文件，每次命中前用调用方传入的
+    stat结果校验mtime和大小，文件变化后自动失效。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: 'OrderedDict[str, CachedFile]' = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+
+    def configure(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self.max_entry_bytes = max(0, max_entry_bytes)
+        self._evict()
+
+    def get(self, file_path: str, st: os.stat_result) -> Optional[bytes]:
+        """获取文件内容，未命中时读取并尝试缓存；文件过大不适合缓存时返回None"""
+        entry = self._entries.get(file_path)
+        if entry is not None:
+            if entry.is_valid(st):
+                self._entries.move_to_end(file_path)
+                self.hits += 1
+                return entry.content
+            self._remove(file_path)
+
+        if st.st_size > self.max_entry_bytes or st.st_size > self.max_bytes:
+            self.skipped += 1
+            return None
+
+        self.misses += 1
+        with open(file_path, 'rb') as f:
+            content = f.read()
+
+        # 读取期间文件被修改时不缓存，直接返回读到的内容
+        if len(content) == st.st_size:
+            self._entries[file_path] = CachedFile(content, st)
+            self.current_bytes += len(content)
+            self._evict()
+        return content
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """清除指定文件或全部缓存"""
+        if file_path is None:
+            self._entries.clear()
+            self.current_bytes = 0
+        elif file_path in self._entries:
+            self._remove(file_path)
+
+    def _remove(self, file_path: str):
+        entry = self._entries.pop(file_path)
+        self.current_bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and self.current_bytes > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self.current_bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """命中统计，用于评估缓存预算"""
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'skipped': self.skipped,
+        }
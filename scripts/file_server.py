@@ -0,0 +1,313 @@
+import asyncio
+import os
+import secrets
+import time
+import uuid
+from http.client import responses as _REASONS
+from typing import Dict, List, Optional, Tuple
+
+from addon_logging import logger
+from network_conditions import Pacer, paced_write
+
+# 超过该数量的分段请求直接忽略Range头，返回完整文件（RFC 7233允许）
+MAX_RANGES = 64
+
+STREAM_PATH_PREFIX = "/__mock_stream__/"
+
+
+def parse_byte_ranges(range_header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """解析Range请求头
+
+    返回值：
+    - None：没有Range头、格式错误或分段过多，应返回完整文件
+    - []：所有范围都无法满足，应返回416
+    - [(start, end), ...]：可满足的闭区间列表
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+
+    items = [item.strip() for item in spec.split(',')]
+    if len(items) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for item in items:
+        if not item:
+            continue
+        first, sep, last = item.partition('-')
+        if not sep:
+            return None
+        first, last = first.strip(), last.strip()
+        try:
+            if not first:
+                # bytes=-N 表示最后N个字节
+                suffix_length = int(last)
+                if suffix_length < 0:
+                    return None
+                if suffix_length == 0 or file_size == 0:
+                    continue
+                ranges.append((max(0, file_size - suffix_length), file_size - 1))
+                continue
+
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start >= file_size:
+            continue
+        ranges.append((start, file_size - 1 if end is None else min(end, file_size - 1)))
+
+    return ranges
+
+
+class FileResponsePlan:
+    """文件响应的发送计划：状态码、响应头以及按顺序发送的数据段
+
+    segments 中每一项为 (前缀字节, 文件偏移, 长度)，最后再发送 trailer。
+    内存发送和流式发送共用同一份计划。
+    """
+
+    __slots__ = ('status_code', 'headers', 'segments', 'trailer', 'content_length', 'description')
+
+    def __init__(self, status_code: int, headers: Dict[str, str],
+                 segments: List[Tuple[bytes, int, int]], trailer: bytes = b'', description: str = ''):
+        self.status_code = status_code
+        self.headers = headers
+        self.segments = segments
+        self.trailer = trailer
+        self.content_length = sum(len(prefix) + length for prefix, _, length in segments) + len(trailer)
+        self.headers["Content-Length"] = str(self.content_length)
+        self.description = description
+
+    def read_content(self, file_path: str) -> bytes:
+        """把计划中的数据段读入内存（用于小文件）"""
+        chunks = []
+        with open(file_path, 'rb') as f:
+            for prefix, offset, length in self.segments:
+                chunks.append(prefix)
+                if length:
+                    f.seek(offset)
+                    chunks.append(f.read(length))
+        chunks.append(self.trailer)
+        return b''.join(chunks)
+
+    def slice_content(self, content: bytes) -> bytes:
+        """从已在内存中的文件内容生成响应体"""
+        if len(self.segments) == 1 and not self.segments[0][0] and not self.trailer:
+            _, offset, length = self.segments[0]
+            return content if offset == 0 and length == len(content) else content[offset:offset + length]
+        chunks = []
+        for prefix, offset, length in self.segments:
+            chunks.append(prefix)
+            chunks.append(content[offset:offset + length])
+        chunks.append(self.trailer)
+        return b''.join(chunks)
+
+
+def plan_file_response(file_size: int, range_header: str, base_headers: Dict[str, str]) -> FileResponsePlan:
+    """根据文件大小和Range头生成响应计划"""
+    headers = dict(base_headers)
+    ranges = parse_byte_ranges(range_header, file_size)
+
+    if ranges is None:
+        return FileResponsePlan(200, headers, [(b'', 0, file_size)], description=f"{file_size} bytes")
+
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{file_size}"
+        return FileResponsePlan(416, headers, [], description="range not satisfiable")
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        return FileResponsePlan(206, headers, [(b'', start, end - start + 1)],
+                                description=f"bytes {start}-{end}/{file_size}")
+
+    # 多个范围使用 multipart/byteranges
+    boundary = uuid.uuid4().hex
+    content_type = headers.get("Content-Type", "application/octet-stream")
+    headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    segments = []
+    for start, end in ranges:
+        prefix = (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+        ).encode('latin-1')
+        segments.append((prefix, start, end - start + 1))
+    trailer = f"\r\n--{boundary}--\r\n".encode('latin-1')
+    description = "bytes " + ",".join(f"{start}-{end}" for start, end in ranges) + f"/{file_size}"
+    return FileResponsePlan(206, headers, segments, trailer, description=description)
+
+
+class StreamSource:
+    """等待本地流式服务发送的文件或内存中的响应
+
+    content 不为None时直接发送 status_code、headers 和 content（用于限速的
+    Mock和请求映射响应），否则按Range发送 file_path。
+    bytes_per_second 大于0时按该速率分块发送。
+    """
+
+    __slots__ = ('file_path', 'headers', 'content', 'status_code', 'bytes_per_second', 'created_at')
+
+    def __init__(self, file_path: Optional[str], headers, content: Optional[bytes] = None,
+                 status_code: int = 200, bytes_per_second: float = 0):
+        self.file_path = file_path
+        self.headers = headers
+        self.content = content
+        self.status_code = status_code
+        self.bytes_per_second = bytes_per_second
+        self.created_at = time.monotonic()
+
+
+class LocalStreamServer:
+    """插件进程内的本地文件流式服务
+
+    mitmproxy只能用内存中的bytes构造插件响应，大文件因此改为把请求转到这个
+    只监听127.0.0.1的服务上，由它用 sendfile 零拷贝发送，mitmproxy再以流式
+    方式转发给客户端，内存占用与文件大小无关。
+    每个被拦截的请求注册一个一次性令牌。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", source_ttl: float = 60.0):
+        self.host = host
+        self.port: Optional[int] = None
+        self.source_ttl = source_ttl
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._sources: Dict[str, StreamSource] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self._server is not None
+
+    async def start(self):
+        if self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            self.port = None
+        self._sources.clear()
+
+    def register(self, source: StreamSource) -> str:
+        """注册一个待发送的文件，返回访问令牌"""
+        self._expire_sources()
+        token = secrets.token_urlsafe(16)
+        self._sources[token] = source
+        return token
+
+    def discard(self, token: str):
+        self._sources.pop(token, None)
+
+    def _expire_sources(self):
+        deadline = time.monotonic() - self.source_ttl
+        expired = [token for token, source in self._sources.items() if source.created_at < deadline]
+        for token in expired:
+            del self._sources[token]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or not parts[1].startswith(STREAM_PATH_PREFIX):
+                await self._write_head(writer, 404, {"Content-Length": "0"})
+                return
+            method = parts[0].upper()
+            source = self._sources.pop(parts[1][len(STREAM_PATH_PREFIX):], None)
+            if source is None:
+                await self._write_head(writer, 404, {"Content-Length": "0"})
+                return
+
+            if source.content is not None:
+                await self._send_content(writer, method, source)
+            else:
+                await self._send_file(writer, method, headers.get('range', ''), source)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error("download", f"本地文件流式发送失败: {e}")
+        finally:
+            writer.close()
+
+    async def _send_file(self, writer: asyncio.StreamWriter, method: str, range_header: str, source: StreamSource):
+        with open(source.file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            plan = plan_file_response(file_size, range_header, source.headers)
+            await self._write_head(writer, plan.status_code, plan.headers)
+            if method == 'HEAD':
+                return
+
+            if source.bytes_per_second > 0:
+                await self._send_file_paced(writer, f, plan, Pacer(source.bytes_per_second))
+                return
+
+            loop = asyncio.get_running_loop()
+            for prefix, offset, length in plan.segments:
+                if prefix:
+                    writer.write(prefix)
+                    await writer.drain()
+                if length:
+                    await loop.sendfile(writer.transport, f, offset, length)
+            if plan.trailer:
+                writer.write(plan.trailer)
+            await writer.drain()
+
+    @staticmethod
+    async def _send_file_paced(writer: asyncio.StreamWriter, f, plan: 'FileResponsePlan', pacer: Pacer):
+        """限速发送文件，每次只读取一块"""
+        for prefix, offset, length in plan.segments:
+            if prefix:
+                await paced_write(writer, prefix, pacer)
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(pacer.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await pacer.wait(len(chunk))
+                writer.write(chunk)
+                await writer.drain()
+        if plan.trailer:
+            await paced_write(writer, plan.trailer, pacer)
+
+    async def _send_content(self, writer: asyncio.StreamWriter, method: str, source: StreamSource):
+        items = source.headers.items() if isinstance(source.headers, dict) else source.headers
+        headers = [(name, value) for name, value in items
+                   if name.lower() not in ('content-length', 'transfer-encoding', 'connection')]
+        headers.append(("Content-Length", str(len(source.content))))
+        await self._write_head(writer, source.status_code, headers)
+        if method == 'HEAD' or not source.content:
+            return
+        if source.bytes_per_second > 0:
+            await paced_write(writer, source.content, Pacer(source.bytes_per_second))
+        else:
+            writer.write(source.content)
+            await writer.drain()
+
+    @staticmethod
+    async def _write_head(writer: asyncio.StreamWriter, status_code: int, headers):
+        """headers 可以是字典或 (名称, 值) 列表（保留重复的响应头）"""
+        items = headers.items() if isinstance(headers, dict) else headers
+        lines = [f"HTTP/1.1 {status_code} {_REASONS.get(status_code, 'OK')}"]
+        lines.extend(f"{name}: {value}" for name, value in items)
+        lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('utf-8', 'surrogateescape'))
+        await writer.drain()
+
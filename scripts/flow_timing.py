@@ -0,0 +1,76 @@
+import time
+from typing import Dict, Optional
+
+from mitmproxy import http
+
+# 插件在 flow.metadata 中记录自身各阶段耗时（秒）的键
+TIMINGS_KEY = "mock_timings"
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None or end < start:
+        return None
+    return round((end - start) * 1000, 3)
+
+
+def record_phase(flow: http.HTTPFlow, phase: str, seconds: float):
+    """累加插件内某个阶段的耗时"""
+    timings = flow.metadata.setdefault(TIMINGS_KEY, {})
+    timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+class PhaseTimer:
+    """计时上下文：with PhaseTimer(flow, "rule_match"): ..."""
+
+    __slots__ = ('flow', 'phase', 'started_at')
+
+    def __init__(self, flow: http.HTTPFlow, phase: str):
+        self.flow = flow
+        self.phase = phase
+        self.started_at = 0.0
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_phase(self.flow, self.phase, time.perf_counter() - self.started_at)
+        return False
+
+
+def collect_phase_timings(flow: http.HTTPFlow) -> Dict[str, float]:
+    """汇总一个请求各阶段的耗时（毫秒）
+
+    连接和传输阶段来自mitmproxy的 timestamp_* 字段，规则匹配、配置读取、
+    请求映射转发等来自插件记录在 flow.metadata 中的耗时。
+    复用已有上游连接时不计入连接和TLS耗时，并标记 upstream_reused。
+    """
+    request = flow.request
+    response = flow.response
+    client = flow.client_conn
+    server = flow.server_conn
+    timings = {}
+
+    # 客户端连接与TLS握手（同一连接上的后续请求也会带上该值）
+    timings['client_tls'] = _ms(client.timestamp_start, client.timestamp_tls_setup)
+    timings['request_receive'] = _ms(request.timestamp_start, request.timestamp_end)
+
+    # 上游连接，只有在本请求中建立的连接才计入
+    if server is not None and server.timestamp_start is not None:
+        if server.timestamp_start >= request.timestamp_start:
+            timings['upstream_connect'] = _ms(server.timestamp_start, server.timestamp_tcp_setup)
+            timings['upstream_tls'] = _ms(server.timestamp_tcp_setup, server.timestamp_tls_setup)
+        else:
+            timings['upstream_reused'] = 1
+
+    if response is not None:
+        timings['upstream_ttfb'] = _ms(request.timestamp_end, response.timestamp_start)
+        timings['response_transfer'] = _ms(response.timestamp_start, response.timestamp_end)
+        timings['total'] = _ms(request.timestamp_start, response.timestamp_end or time.time())
+    else:
+        timings['total'] = _ms(request.timestamp_start, time.time())
+
+    for phase, seconds in flow.metadata.get(TIMINGS_KEY, {}).items():
+        timings[phase] = round(seconds * 1000, 3)
+
+    return {phase: value for phase, value in timings.items() if value is not None}
@@ -1,14 +1,33 @@
-import json
+import asyncio
 import os
 import sys
 import mimetypes
-import re
 import requests
 import time
-from mitmproxy import http
-from typing import Dict, Any
+from jinja2.exceptions import SecurityError
+from mitmproxy import ctx, http
+from typing import Dict, Any, Optional, Sequence
 from urllib.parse import urlparse, parse_qs
 
+from addon_logging import LOG_PROFILES, logger
+from body_matcher import RequestBody
+from capture_policy import CapturePolicy
+from capture_writer import OVERFLOW_POLICIES, CaptureWriter
+from config_channel import CONTROL_FILE, ConfigChannel
+from config_snapshot import ConfigWatcher
+from file_cache import FileContentCache
+from file_server import STREAM_PATH_PREFIX, LocalStreamServer, StreamSource, plan_file_response
+from flow_timing import PhaseTimer, collect_phase_timings, record_phase
+from mock_response import ENCODING_ERROR_RESPONSE
+from network_conditions import NetworkConditions
+from proxy_metrics import (
+    METRICS_FILE, RULE_DOWNLOAD, RULE_MAPPING, RULE_MOCK, RULE_PASSTHROUGH, RULE_REPLAY, ProxyMetrics,
+)
+from replay_store import REPLAY_FAIL, REPLAY_UNMATCHED_POLICIES, ReplayStore
+from rule_hits import KIND_API, KIND_DOWNLOAD, KIND_MAPPING, RULE_HITS_FILE, RuleHitCounter
+from response_template import build_context
+from upstream_forwarder import UpstreamForwarder
+
 # 确保标准输出使用UTF-8编码
 if hasattr(sys.stdout, 'reconfigure'):
     sys.stdout.reconfigure(encoding='utf-8')
@@ -16,67 +35,352 @@ elif hasattr(sys.stdout, 'buffer'):
     sys.stdout = open(sys.stdout.fileno(), 'w', encoding='utf-8', buffering=1)
 
 
+CAPTURE_FILE = "data/realtime_capture.json"
+
+
+def worker_file_path(path: str, worker_id: str) -> str:
+    """多worker模式下每个worker使用带编号的文件，如 data/realtime_capture.w1.json"""
+    if not worker_id:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.w{worker_id}{ext}"
+
+
 class MockAddon:
     def __init__(self):
         self.config_file = "data/config.json"
-        self.capture_file = "data/realtime_capture.json"
-        self.apis = {}
-        self.file_downloads = {}
-        self.request_mappings = []
-        self.flow_start_times = {}  # 记录请求开始时间
-        self.request_count = 0  # 统计请求数量
-        self.response_count = 0  # 统计响应数量
+        self.worker_id = ""
+        self.capture_file = CAPTURE_FILE
+        self.config_watcher = ConfigWatcher(self.config_file)
+        self.config_channel = ConfigChannel(self.config_watcher)
+        self.forwarder = UpstreamForwarder()
+        self.stream_server = LocalStreamServer()
+        self.stream_threshold = 8 * 1024 * 1024
+        self.file_cache = FileContentCache()
+        self.capture_writer = CaptureWriter(self.capture_file)
+        self.capture_policy = CapturePolicy()
+        self.replay = ReplayStore()
+        self.rule_hits = RuleHitCounter()
+        self.metrics = ProxyMetrics()
+        self.metrics.add_gauge('capture_queue_depth', lambda: self.capture_writer.depth)
+        self.metrics.add_counter('capture_written', lambda: self.capture_writer.written)
+        self.metrics.add_counter('capture_dropped', lambda: self.capture_writer.dropped)
+        self.metrics.add_gauge('file_cache_bytes', lambda: self.file_cache.stats()['bytes'])
+        self.metrics.add_counter('log_dropped', lambda: logger.dropped)
+        self.metrics.add_counter('config_reloads', lambda: self.config_watcher.reload_count)
+        self.summary_interval = 10.0  # 汇总日志输出间隔（秒）
+        self.last_summary_at = time.monotonic()
         self.load_config()
 
     def load_config(self):
-        """加载API配置、文件下载配置和请求映射配置"""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # 加载API配置
-                    self.apis = {}
-                    for api in data.get('apis', []):
-                        if api.get('enabled', True):
-                            parsed_url = urlparse(api['url'])
-                            key = f"{api['method']}:{parsed_url.netloc}{parsed_url.path}"
-                            self.apis[key] = api['response']
-                    
-                    # 加载文件下载配置
-                    self.file_downloads = {}
-                    for download in data.get('file_downloads', []):
-                        if download.get('enabled', True):
-                            self.file_downloads[download['url_pattern']] = download
-                    
-                    # 加载请求映射配置
-                    self.request_mappings = []
-                    for mapping in data.get('request_mappings', []):
-                        if mapping.get('enabled', True):
-                            self.request_mappings.append(mapping)
-        except Exception as e:
-            print(f"加载配置失败: {e}")
+        """加载API配置、文件下载配置和请求映射配置（冷启动时同步加载）"""
+        self.config_watcher.load()
+
+    def load(self, loader):
+        """注册插件选项，可通过 --set 或 confdir 下的 config.yaml 设置"""
+        loader.add_option(
+            name="mock_worker_id",
+            typespec=str,
+            default="",
+            help="多worker模式下的worker编号，各worker使用独立的抓包文件和指标文件",
+        )
+        loader.add_option(
+            name="mock_config_file",
+            typespec=str,
+            default="data/config.json",
+            help="冷启动和监听变化使用的配置文件，后端使用SQLite存储时为 data/config.db",
+        )
+        loader.add_option(
+            name="mock_log_profile",
+            typespec=str,
+            default="production",
+            choices=LOG_PROFILES,
+            help="日志配置：production只输出汇总和错误，debug输出每个请求及响应内容",
+        )
+        loader.add_option(
+            name="mock_log_rate",
+            typespec=float,
+            default=5.0,
+            help="每种日志每秒最多输出的条数，0表示不限流",
+        )
+        loader.add_option(
+            name="mock_log_burst",
+            typespec=float,
+            default=20.0,
+            help="每种日志允许的突发条数",
+        )
+        loader.add_option(
+            name="mock_log_sample",
+            typespec=int,
+            default=1,
+            help="每种日志每N条只输出1条（警告和错误不采样）",
+        )
+        loader.add_option(
+            name="mock_log_summary_interval",
+            typespec=float,
+            default=10.0,
+            help="汇总日志的输出间隔（秒）",
+        )
+        loader.add_option(
+            name="mock_mapping_pool_size",
+            typespec=int,
+            default=10,
+            help="请求映射每个目标地址的keep-alive连接池大小",
+        )
+        loader.add_option(
+            name="mock_mapping_max_workers",
+            typespec=int,
+            default=32,
+            help="请求映射同时转发的最大请求数",
+        )
+        loader.add_option(
+            name="mock_mapping_connect_timeout",
+            typespec=float,
+            default=5.0,
+            help="请求映射连接目标服务的超时时间（秒）",
+        )
+        loader.add_option(
+            name="mock_mapping_read_timeout",
+            typespec=float,
+            default=30.0,
+            help="请求映射等待目标服务响应的超时时间（秒）",
+        )
+        loader.add_option(
+            name="mock_download_stream_threshold",
+            typespec=int,
+            default=8 * 1024 * 1024,
+            help="超过该大小（字节）的本地文件以流式方式发送",
+        )
+        loader.add_option(
+            name="mock_file_cache_max_bytes",
+            typespec=int,
+            default=64 * 1024 * 1024,
+            help="拦截文件内容缓存的总字节预算，0表示不缓存",
+        )
+        loader.add_option(
+            name="mock_file_cache_max_entry_bytes",
+            typespec=int,
+            default=4 * 1024 * 1024,
+            help="单个文件超过该大小（字节）时不进入缓存",
+        )
+        loader.add_option(
+            name="mock_capture_queue_size",
+            typespec=int,
+            default=10000,
+            help="抓包记录写入队列的最大长度",
+        )
+        loader.add_option(
+            name="mock_capture_batch_size",
+            typespec=int,
+            default=200,
+            help="抓包记录每批写入的最大条数",
+        )
+        loader.add_option(
+            name="mock_capture_flush_interval",
+            typespec=float,
+            default=0.5,
+            help="抓包记录最长等待多久（秒）写入一次",
+        )
+        loader.add_option(
+            name="mock_capture_overflow",
+            typespec=str,
+            default="drop_oldest",
+            choices=OVERFLOW_POLICIES,
+            help="抓包队列满时的处理策略",
+        )
+        loader.add_option(
+            name="mock_capture_sample_rate",
+            typespec=int,
+            default=10,
+            help="sample策略下每多少条溢出记录保留1条",
+        )
+        loader.add_option(
+            name="mock_capture_rotate_bytes",
+            typespec=int,
+            default=64 * 1024 * 1024,
+            help="抓包文件超过该大小（字节）后封存为压缩分段，0表示不按大小轮转",
+        )
+        loader.add_option(
+            name="mock_capture_rotate_seconds",
+            typespec=float,
+            default=0,
+            help="抓包文件写入超过该时间（秒）后封存为压缩分段，0表示不按时间轮转",
+        )
+        loader.add_option(
+            name="mock_capture_retention",
+            typespec=int,
+            default=20,
+            help="最多保留的已封存抓包分段数，0表示不限制",
+        )
+        loader.add_option(
+            name="mock_capture_max_body_bytes",
+            typespec=int,
+            default=1024 * 1024,
+            help="每个请求体/响应体最多记录的字节数，超出部分截断，0表示不限制",
+        )
+        loader.add_option(
+            name="mock_capture_binary_types",
+            typespec=Sequence[str],
+            default=[],
+            help="额外视为二进制、只记录大小的Content-Type前缀",
+        )
+        loader.add_option(
+            name="mock_capture_hash_only_hosts",
+            typespec=Sequence[str],
+            default=[],
+            help="只记录body哈希和大小的主机（支持 *.example.com）",
+        )
+        loader.add_option(
+            name="mock_capture_metadata_only_hosts",
+            typespec=Sequence[str],
+            default=[],
+            help="不记录body、只记录大小的主机（支持 *.example.com）",
+        )
+        loader.add_option(
+            name="mock_metrics_interval",
+            typespec=float,
+            default=1.0,
+            help="指标写入共享文件（供后端 /metrics 读取）的间隔（秒）",
+        )
+        loader.add_option(
+            name="mock_rule_hits_interval",
+            typespec=float,
+            default=10.0,
+            help="规则命中统计写入 data/rule_hits.json 的间隔（秒）",
+        )
+        loader.add_option(
+            name="mock_replay_files",
+            typespec=Sequence[str],
+            default=[],
+            help="回放模式使用的抓包文件（JSONL或gzip分段），为空时不启用回放",
+        )
+        loader.add_option(
+            name="mock_replay_unmatched",
+            typespec=str,
+            default="passthrough",
+            choices=REPLAY_UNMATCHED_POLICIES,
+            help="回放模式下未命中录制记录的请求：passthrough转发到上游，fail返回错误",
+        )
+        loader.add_option(
+            name="mock_replay_match_body",
+            typespec=bool,
+            default=True,
+            help="回放时请求体哈希是否参与匹配",
+        )
+        loader.add_option(
+            name="mock_replay_inline_bytes",
+            typespec=int,
+            default=64 * 1024,
+            help="不超过该大小的录制响应体加载到内存，更大的在命中时从文件读取",
+        )
+
+    def configure(self, updated):
+        """应用插件选项"""
+        if "mock_worker_id" in updated:
+            self.set_worker_id(ctx.options.mock_worker_id)
+        if "mock_config_file" in updated:
+            self.set_config_file(ctx.options.mock_config_file)
+        if any(name.startswith("mock_log_") for name in updated):
+            logger.configure(
+                profile=ctx.options.mock_log_profile,
+                rate=ctx.options.mock_log_rate,
+                burst=ctx.options.mock_log_burst,
+                sample=ctx.options.mock_log_sample,
+            )
+            self.summary_interval = max(1.0, ctx.options.mock_log_summary_interval)
+        if any(name.startswith("mock_mapping_") for name in updated):
+            self.forwarder.configure(
+                pool_size=max(1, ctx.options.mock_mapping_pool_size),
+                max_workers=max(1, ctx.options.mock_mapping_max_workers),
+                connect_timeout=ctx.options.mock_mapping_connect_timeout,
+                read_timeout=ctx.options.mock_mapping_read_timeout,
+            )
+        if "mock_download_stream_threshold" in updated:
+            self.stream_threshold = ctx.options.mock_download_stream_threshold
+        if any(name.startswith("mock_file_cache_") for name in updated):
+            self.file_cache.configure(
+                max_bytes=ctx.options.mock_file_cache_max_bytes,
+                max_entry_bytes=ctx.options.mock_file_cache_max_entry_bytes,
+            )
+        if any(name.startswith("mock_capture_") for name in updated):
+            self.capture_writer.configure(
+                max_queue=ctx.options.mock_capture_queue_size,
+                batch_size=ctx.options.mock_capture_batch_size,
+                flush_interval=ctx.options.mock_capture_flush_interval,
+                overflow_policy=ctx.options.mock_capture_overflow,
+                sample_rate=ctx.options.mock_capture_sample_rate,
+                rotate_bytes=ctx.options.mock_capture_rotate_bytes,
+                rotate_seconds=ctx.options.mock_capture_rotate_seconds,
+                retention=ctx.options.mock_capture_retention,
+            )
+            self.capture_policy = CapturePolicy(
+                max_body_bytes=ctx.options.mock_capture_max_body_bytes,
+                hash_only_hosts=ctx.options.mock_capture_hash_only_hosts,
+                metadata_only_hosts=ctx.options.mock_capture_metadata_only_hosts,
+                binary_content_types=ctx.options.mock_capture_binary_types,
+            )
+        if "mock_metrics_interval" in updated:
+            self.metrics.configure(interval=ctx.options.mock_metrics_interval)
+        if "mock_rule_hits_interval" in updated:
+            self.rule_hits.configure(interval=ctx.options.mock_rule_hits_interval)
+        if any(name.startswith("mock_replay_") for name in updated):
+            self.replay.configure(
+                files=ctx.options.mock_replay_files,
+                unmatched=ctx.options.mock_replay_unmatched,
+                match_body=ctx.options.mock_replay_match_body,
+                inline_bytes=ctx.options.mock_replay_inline_bytes,
+            )
 
-    def safe_json_encode(self, data):
-        """安全的JSON编码，处理特殊字符"""
+    def set_config_file(self, config_file: str):
+        """切换配置文件并立即重新加载"""
+        if config_file == self.config_file:
+            return
+        self.config_file = config_file
+        self.config_watcher.config_file = config_file
+        if self.config_watcher.load():
+            logger.info("config", f"已加载配置: {config_file}")
+
+    def set_worker_id(self, worker_id: str):
+        """切换到worker专属的抓包文件和指标文件（需在抓包写入线程启动前设置）"""
+        if worker_id == self.worker_id:
+            return
+        if self.capture_writer.is_running:
+            logger.warning("config", "mock_worker_id 需要重启代理后生效")
+            return
+        self.worker_id = worker_id
+        self.capture_file = worker_file_path(CAPTURE_FILE, worker_id)
+        self.capture_writer = CaptureWriter(self.capture_file)
+        self.metrics.metrics_file = worker_file_path(METRICS_FILE, worker_id)
+        self.rule_hits.hits_file = worker_file_path(RULE_HITS_FILE, worker_id)
+        self.config_channel.control_file = worker_file_path(CONTROL_FILE, worker_id)
+
+    async def running(self):
+        """代理启动完成后开始监听配置文件变化和配置推送，并启动抓包写入线程和本地文件流式服务"""
+        logger.start()
+        self.config_watcher.start()
+        self.capture_writer.start()
+        self.metrics.start()
+        self.rule_hits.start()
         try:
-            # 使用ensure_ascii=False来保持Unicode字符，但添加错误处理
-            json_str = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
-            # 确保字符串可以被UTF-8编码
-            json_str.encode('utf-8')
-            return json_str
-        except (UnicodeEncodeError, UnicodeDecodeError):
-            # 如果出现编码错误，使用ensure_ascii=True作为备选方案
-            return json.dumps(data, ensure_ascii=True, separators=(',', ':'))
-
-    def match_url_pattern(self, url: str, pattern: str) -> bool:
-        """检查URL是否匹配模式"""
+            await self.stream_server.start()
+        except OSError as e:
+            logger.warning("download", f"启动本地文件流式服务失败，大文件将直接读入内存发送: {e}")
         try:
-            # 支持正则表达式匹配
-            return bool(re.search(pattern, url))
-        except re.error:
-            # 如果正则表达式无效，使用简单的字符串匹配
-            return pattern in url
+            await self.config_channel.start()
+        except OSError as e:
+            logger.warning("config", f"启动配置推送通道失败，只通过监听配置文件更新配置: {e}")
+
+    def done(self):
+        """插件卸载时停止后台线程"""
+        self.config_watcher.stop()
+        self.config_channel.close()
+        self.forwarder.close()
+        self.stream_server.close()
+        self.capture_writer.stop()
+        self.replay.stop()
+        self.rule_hits.stop()
+        self.metrics.stop()
+        logger.stop()
 
     def get_content_type(self, file_path: str, configured_type: str = None) -> str:
         """获取文件的内容类型"""
@@ -92,12 +396,13 @@ class MockAddon:
             file_path = download_config['local_file_path']
             
             # 检查文件是否存在
-            if not os.path.exists(file_path):
-                print(f"本地文件不存在: {file_path}")
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
+                logger.warning("download", f"本地文件不存在: {file_path}")
+                self.metrics.count_error("download_missing")
                 return False
-            
-            # 获取文件大小
-            file_size = os.path.getsize(file_path)
+            file_size = st.st_size
             
             # 确定内容类型
             content_type = self.get_content_type(file_path, download_config.get('content_type'))
@@ -112,69 +417,93 @@ class MockAddon:
                 "ETag": f'"{file_size}-{filename}"',
                 "Server": "mitmproxy-file-server"
             }
-            
-            # 检查是否是范围请求
+
+            # 大文件和需要限速的文件交给本地流式服务发送，避免整个文件读入内存
+            conditions = download_config.get('network_conditions')
+            bytes_per_second = conditions.bytes_per_second if conditions else 0
+            if (file_size > self.stream_threshold or bytes_per_second) and self.stream_server.is_running:
+                self.redirect_to_stream_server(flow, StreamSource(file_path, headers, bytes_per_second=bytes_per_second))
+                logger.debug("download", f"文件下载拦截(流式): {flow.metadata['mock_original_url']} -> {file_path} ({file_size} bytes)")
+                return True
+
+            # 处理范围请求（支持多段范围和 bytes=-N 后缀范围）
             range_header = flow.request.headers.get("Range", "")
-            if range_header and range_header.startswith("bytes="):
-                # 处理范围请求
-                try:
-                    ranges = range_header[6:].split("-")
-                    start = int(ranges[0]) if ranges[0] else 0
-                    end = int(ranges[1]) if ranges[1] else file_size - 1
-                    
-                    # 确保范围有效
-                    start = max(0, min(start, file_size - 1))
-                    end = max(start, min(end, file_size - 1))
-                    
-                    # 读取指定范围的文件内容
-                    with open(file_path, 'rb') as f:
-                        f.seek(start)
-                        file_content = f.read(end - start + 1)
-                    
-                    headers.update({
-                        "Content-Range": f"bytes {start}-{end}/{file_size}",
-                        "Content-Length": str(len(file_content))
-                    })
-                    
-                    flow.response = http.Response.make(
-                        status_code=206,  # Partial Content
-                        content=file_content,
-                        headers=headers
-                    )
-                    
-                    print(f"文件范围请求拦截: {flow.request.url} -> {file_path} (bytes {start}-{end}/{file_size})")
-                    return True
-                    
-                except (ValueError, IndexError):
-                    # 范围请求格式错误，返回完整文件
-                    pass
-            
-            # 读取完整文件内容
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
+            plan = plan_file_response(file_size, range_header, headers)
             
+            # 小文件优先从内存缓存读取
+            cached_content = self.file_cache.get(file_path, st)
+            if cached_content is not None:
+                content = plan.slice_content(cached_content)
+            else:
+                content = plan.read_content(file_path)
+
             # 创建响应
             flow.response = http.Response.make(
-                status_code=200,
-                content=file_content,
-                headers=headers
+                status_code=plan.status_code,
+                content=content,
+                headers=plan.headers
             )
             
-            print(f"文件下载拦截: {flow.request.url} -> {file_path} ({file_size} bytes)")
+            if plan.status_code == 200:
+                logger.debug("download", f"文件下载拦截: {flow.request.url} -> {file_path} ({file_size} bytes)")
+            else:
+                logger.debug("download", f"文件范围请求拦截: {flow.request.url} -> {file_path} ({plan.description})")
             return True
             
         except Exception as e:
-            print(f"提供本地文件服务时出错: {e}")
+            logger.error("download", f"提供本地文件服务时出错: {e}")
+            self.metrics.count_error("download")
             return False
 
-    def handle_request_mapping(self, flow: http.HTTPFlow, mapping_config: dict) -> bool:
+    def redirect_to_stream_server(self, flow: http.HTTPFlow, source: StreamSource):
+        """把请求改写到本地流式服务，响应在responseheaders中设置为流式转发"""
+        token = self.stream_server.register(source)
+        flow.metadata['mock_stream_token'] = token
+        flow.metadata['mock_original_url'] = flow.request.url
+
+        original_host_header = flow.request.host_header
+        flow.request.scheme = "http"
+        flow.request.host = self.stream_server.host
+        flow.request.port = self.stream_server.port
+        flow.request.path = f"{STREAM_PATH_PREFIX}{token}"
+        # 保留原始Host头，抓包记录中仍显示原始请求
+        if original_host_header is not None:
+            flow.request.host_header = original_host_header
+
+    async def apply_network_conditions(self, flow: http.HTTPFlow, conditions: Optional[NetworkConditions]):
+        """按规则的网络条件延迟响应，并把需要限速的响应改为由本地流式服务分块发送
+
+        延迟使用 asyncio.sleep，等待期间不占用线程也不阻塞其他请求。
+        """
+        if conditions is None:
+            return
+        delay = conditions.delay()
+        if delay > 0:
+            with PhaseTimer(flow, "network_delay"):
+                await asyncio.sleep(delay)
+
+        # 文件下载在serve_local_file中已经按速率处理
+        if (conditions.bytes_per_second and flow.response is not None
+                and 'mock_stream_token' not in flow.metadata and self.stream_server.is_running):
+            response = flow.response
+            source = StreamSource(
+                None,
+                list(response.headers.items(multi=True)),
+                content=response.raw_content or b'',
+                status_code=response.status_code,
+                bytes_per_second=conditions.bytes_per_second,
+            )
+            flow.response = None
+            self.redirect_to_stream_server(flow, source)
+
+    async def handle_request_mapping(self, flow: http.HTTPFlow, mapping_config: dict) -> bool:
         """处理请求映射转发"""
         try:
             target_host = mapping_config.get('target_host', 'localhost')
             target_port = mapping_config.get('target_port')
             
             if not target_port:
-                print(f"请求映射配置错误: 缺少target_port")
+                logger.warning("mapping", "请求映射配置错误: 缺少target_port")
                 return False
             
             # 构建目标URL
@@ -193,44 +522,15 @@ class MockAddon:
             headers['Host'] = f"{target_host}:{target_port}"
             
             method = flow.request.method.upper()
-            
-            # 发送请求到目标服务器
-            response = None
-            if method == 'GET':
-                response = requests.get(target_url, headers=headers, timeout=30)
-            elif method == 'POST':
-                response = requests.post(
-                    target_url, 
-                    data=flow.request.content, 
-                    headers=headers,
-                    timeout=30
-                )
-            elif method == 'PUT':
-                response = requests.put(
-                    target_url, 
-                    data=flow.request.content, 
-                    headers=headers,
-                    timeout=30
-                )
-            elif method == 'DELETE':
-                response = requests.delete(target_url, headers=headers, timeout=30)
-            elif method == 'PATCH':
-                response = requests.patch(
-                    target_url, 
-                    data=flow.request.content, 
-                    headers=headers,
-                    timeout=30
-                )
-            else:
-                # 对于其他方法，使用requests的通用方法
-                response = requests.request(
-                    method,
-                    target_url,
-                    data=flow.request.content,
-                    headers=headers,
-                    timeout=30
-                )
-            
+
+            # GET和DELETE请求不携带请求体
+            data = None if method in ('GET', 'DELETE') else flow.request.content
+
+            # 通过连接池异步发送请求到目标服务器，等待期间不阻塞其他请求
+            response = await self.forwarder.forward(
+                method, target_host, target_port, target_url, headers, data
+            )
+
             if response:
                 # 准备响应头
                 response_headers = dict(response.headers)
@@ -245,11 +545,12 @@ class MockAddon:
                     headers=response_headers
                 )
                 
-                print(f"请求映射转发: {original_url} -> {target_url} (状态码: {response.status_code})")
+                logger.debug("mapping", f"请求映射转发: {original_url} -> {target_url} (状态码: {response.status_code})")
                 return True
             
         except requests.exceptions.ConnectionError:
-            print(f"请求映射转发失败: 无法连接到 {target_host}:{target_port}")
+            logger.warning("mapping", f"请求映射转发失败: 无法连接到 {target_host}:{target_port}")
+            self.metrics.count_error("mapping_connect")
             # 创建连接错误响应
             flow.response = http.Response.make(
                 status_code=502,
@@ -258,7 +559,8 @@ class MockAddon:
             )
             return True
         except requests.exceptions.Timeout:
-            print(f"请求映射转发超时: {target_host}:{target_port}")
+            logger.warning("mapping", f"请求映射转发超时: {target_host}:{target_port}")
+            self.metrics.count_error("mapping_timeout")
             # 创建超时响应
             flow.response = http.Response.make(
                 status_code=504,
@@ -267,42 +569,43 @@ class MockAddon:
             )
             return True
         except Exception as e:
-            print(f"请求映射转发时出错: {e}")
+            logger.error("mapping", f"请求映射转发时出错: {e}")
+            self.metrics.count_error("mapping")
             return False
         
         return False
 
-    def save_captured_flow(self, flow: http.HTTPFlow):
+    async def save_captured_flow(self, flow: http.HTTPFlow):
         """保存抓包数据到文件（JSONL格式，每行一个JSON对象）"""
         try:
-            # 记录请求开始时间
-            flow_id = id(flow)
-            start_time = self.flow_start_times.get(flow_id, time.time())
+            capture_started = time.perf_counter()
+            flow_id = flow.id
+            start_time = flow.request.timestamp_start
 
-            parsed_url = urlparse(flow.request.url)
+            request_url = flow.metadata.get('mock_original_url', flow.request.url)
+            parsed_url = urlparse(request_url)
 
-            # 准备请求数据
+            # 按抓包策略处理请求体（大小上限、二进制识别、按主机只记录哈希或元数据）
+            host_mode = self.capture_policy.body_mode_for_host(parsed_url.netloc)
             request_headers = dict(flow.request.headers)
-            request_body = ""
-            if flow.request.content:
-                try:
-                    request_body = flow.request.content.decode('utf-8', errors='replace')
-                except:
-                    request_body = f"<binary data, {len(flow.request.content)} bytes>"
+            request_body, request_body_info = self.capture_policy.capture_body(
+                flow.request.content, flow.request.headers.get("Content-Type", ""), host_mode, match_digest=True
+            )
 
             captured_data = {
-                'id': str(flow_id),
+                'id': flow_id,
                 'timestamp': time.time(),
                 'request': {
-                    'id': str(flow_id),
+                    'id': flow_id,
                     'timestamp': start_time,
                     'method': flow.request.method,
-                    'url': flow.request.url,
+                    'url': request_url,
                     'host': parsed_url.netloc,
                     'path': parsed_url.path,
                     'headers': request_headers,
                     'query_params': parsed_url.query or "",
                     'request_body': request_body,
+                    'request_body_info': request_body_info,
                     'request_size': len(flow.request.content) if flow.request.content else 0
                 }
             }
@@ -310,141 +613,210 @@ class MockAddon:
             # 如果有响应，添加响应数据
             if flow.response:
                 response_headers = dict(flow.response.headers)
-                response_body = ""
-                if flow.response.content:
-                    try:
-                        response_body = flow.response.content.decode('utf-8', errors='replace')
-                    except:
-                        response_body = f"<binary data, {len(flow.response.content)} bytes>"
+                response_body, response_body_info = self.capture_policy.capture_body(
+                    flow.response.content, flow.response.headers.get("Content-Type", ""), host_mode
+                )
 
-                duration = (time.time() - start_time) * 1000  # 转换为毫秒
+                # 从mitmproxy收到请求到响应完成的时间（毫秒）
+                duration = ((flow.response.timestamp_end or time.time()) - start_time) * 1000
 
                 captured_data['response'] = {
                     'status_code': flow.response.status_code,
                     'headers': response_headers,
                     'response_body': response_body,
+                    'response_body_info': response_body_info,
                     'response_size': len(flow.response.content) if flow.response.content else 0,
                     'duration': round(duration, 2)
                 }
 
-            # 写入文件（追加模式，JSONL格式）
-            os.makedirs(os.path.dirname(self.capture_file), exist_ok=True)
-            with open(self.capture_file, 'a', encoding='utf-8') as f:
-                json.dump(captured_data, f, ensure_ascii=False)
-                f.write('\n')  # 每个JSON对象一行
-                f.flush()  # 立即刷新到磁盘
+            if flow.error:
+                captured_data['error'] = flow.error.msg
+
+            # 各阶段耗时，capture_write为构建抓包记录的耗时
+            record_phase(flow, "capture_write", time.perf_counter() - capture_started)
+            captured_data['timings'] = collect_phase_timings(flow)
 
-            # 清理开始时间记录
-            if flow_id in self.flow_start_times:
-                del self.flow_start_times[flow_id]
+            # 交给后台线程批量写入文件（JSONL格式）
+            await self.capture_writer.submit_async(captured_data)
 
         except Exception as e:
-            print(f"保存抓包数据失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error("capture", f"保存抓包数据失败: {e}", exc_info=True)
+            self.metrics.count_error("capture")
 
-    def request(self, flow: http.HTTPFlow) -> None:
+    async def request(self, flow: http.HTTPFlow) -> None:
         """处理HTTP请求"""
-        # 记录请求开始时间
-        self.flow_start_times[id(flow)] = time.time()
+        # 统计请求数量，定期输出汇总信息
+        self.metrics.inc('requests')
+        now = time.monotonic()
+        if now - self.last_summary_at >= self.summary_interval:
+            self.last_summary_at = now
+            self.log_summary()
 
-        # 统计请求数量
-        self.request_count += 1
-        if self.request_count % 10 == 0:
-            print(f"已处理请求数: {self.request_count}, 已记录响应数: {self.response_count}")
-
-        # 重新加载配置以支持热更新
-        self.load_config()
+        # 使用当前配置快照，配置文件变化时由后台线程原子替换
+        with PhaseTimer(flow, "config_load"):
+            snapshot = self.config_watcher.snapshot
 
         request_url = flow.request.url
         method = flow.request.method
-        parsed_url = urlparse(request_url)
-        netloc = parsed_url.netloc
-        path = parsed_url.path
 
         # 首先检查请求映射（优先级最高）
-        for mapping_config in self.request_mappings:
-            url_pattern = mapping_config.get('url_pattern', '')
-            methods = mapping_config.get('methods', [])
-            
-            # 检查URL模式和HTTP方法是否匹配
-            if (self.match_url_pattern(request_url, url_pattern) and 
-                method.upper() in [m.upper() for m in methods]):
-                if self.handle_request_mapping(flow, mapping_config):
-                    return  # 成功转发请求
-                # 如果转发失败，继续处理其他配置
+        with PhaseTimer(flow, "rule_match"):
+            mapping_matcher = snapshot.mapping_matchers.get(method.upper())
+            mapping_configs = list(mapping_matcher.iter_matches(request_url)) if mapping_matcher else []
+        for mapping_config in mapping_configs:
+            with PhaseTimer(flow, "mapping_forward"):
+                handled = await self.handle_request_mapping(flow, mapping_config)
+            if handled:
+                flow.metadata['mock_rule'] = RULE_MAPPING
+                self.metrics.inc('mapping_forwards')
+                self.rule_hits.hit(KIND_MAPPING, mapping_config.get('id'))
+                await self.apply_network_conditions(flow, mapping_config.get('network_conditions'))
+                return  # 成功转发请求
+            # 如果转发失败，继续处理其他配置
 
         # 然后检查文件下载拦截
-        for pattern, download_config in self.file_downloads.items():
-            if self.match_url_pattern(request_url, pattern):
-                if self.serve_local_file(flow, download_config):
-                    return  # 成功拦截并提供了本地文件
-                # 如果文件不存在或其他错误，继续处理其他配置
+        with PhaseTimer(flow, "rule_match"):
+            download_configs = list(snapshot.download_matcher.iter_matches(request_url))
+        for download_config in download_configs:
+            with PhaseTimer(flow, "file_serve"):
+                handled = self.serve_local_file(flow, download_config)
+            if handled:
+                flow.metadata['mock_rule'] = RULE_DOWNLOAD
+                self.metrics.inc('download_hits')
+                self.rule_hits.hit(KIND_DOWNLOAD, download_config.get('id'))
+                await self.apply_network_conditions(flow, download_config.get('network_conditions'))
+                return  # 成功拦截并提供了本地文件
+            # 如果文件不存在或其他错误，继续处理其他配置
 
         # 最后查找匹配的API配置
-        key = f"{method}:{netloc}{path}"
-        if key in self.apis:
-            response_config = self.apis[key]
-
-            # 安全地处理响应内容
-            try:
-                # 获取响应体
-                response_body = response_config.get('body', {})
+        with PhaseTimer(flow, "rule_match"):
+            parsed_url = urlparse(request_url)
+            netloc = parsed_url.netloc
+            path = parsed_url.path
+            body = RequestBody(flow.request.get_content(strict=False))
+            route = snapshot.api_router.resolve(method, netloc, path, parsed_url.query, body)
+        if route is not None:
+            prepared = route.payload
+            flow.metadata['mock_rule'] = RULE_MOCK
+            self.metrics.inc('mock_hits')
+            self.rule_hits.hit(KIND_API, prepared.rule_id)
+            # 响应体和响应头已在加载配置时序列化好，模板响应只渲染其中的动态部分
+            content = prepared.content
+            if prepared.template is not None:
+                try:
+                    with PhaseTimer(flow, "template_render"):
+                        content = prepared.template.render(build_context(flow.request, body, route.params))
+                except Exception as e:
+                    reason = "（模板访问了沙箱不允许的属性）" if isinstance(e, SecurityError) else ""
+                    logger.error("mock", f"渲染响应模板失败{reason}: {method} {netloc}{path}: {e}")
+                    self.metrics.count_error("template")
+                    prepared = ENCODING_ERROR_RESPONSE
+                    content = prepared.content
+            flow.response = http.Response.make(
+                status_code=prepared.status_code,
+                content=content,
+                headers=prepared.headers
+            )
 
-                # 安全编码JSON内容
-                content = self.safe_json_encode(response_body)
+            logger.debug("mock", f"Mock响应: {method} {netloc}{path} -> {prepared.status_code}",
+                         body=prepared.preview)
+            await self.apply_network_conditions(flow, prepared.network)
+            return
 
-                # 确保内容是字节类型
-                if isinstance(content, str):
-                    content = content.encode('utf-8', errors='replace')
+        # 回放模式：用录制的响应回答请求
+        if self.replay.enabled:
+            await self.replay_recorded_response(flow, body)
 
-                # 创建响应
+    async def replay_recorded_response(self, flow: http.HTTPFlow, body: RequestBody):
+        """从回放索引中查找录制的响应，未命中时按 mock_replay_unmatched 处理"""
+        method = flow.request.method
+        request_url = flow.request.url
+        with PhaseTimer(flow, "replay_lookup"):
+            entry = self.replay.lookup(method, request_url, body)
+        if entry is None:
+            if self.replay.unmatched == REPLAY_FAIL:
+                self.metrics.count_error("replay_miss")
                 flow.response = http.Response.make(
-                    status_code=response_config.get('status', 200),
-                    content=content,
-                    headers=response_config.get('headers', {"Content-Type": "application/json; charset=utf-8"})
+                    status_code=502,
+                    content=b'{"error": "No recorded response"}',
+                    headers={"Content-Type": "application/json; charset=utf-8"}
                 )
+                logger.debug("replay", f"回放未命中: {method} {request_url}")
+            return
 
-                # 安全地输出日志信息
-                try:
-                    log_msg = f"Mock响应: {method} {netloc}{path} -> {response_config.get('status', 200)}"
-                    log_msg.encode('utf-8', errors='replace')
-                    print(log_msg)
-                    
-                    # 输出响应内容（如果包含中文）
-                    if isinstance(content, bytes):
-                        try:
-                            content_str = content.decode('utf-8', errors='replace')
-                            if len(content_str) < 1000:  # 只显示较短的响应内容
-                                print(f"响应内容: {content_str}")
-                        except:
-                            pass
-                    
-                except UnicodeEncodeError:
-                    # 如果仍有编码问题，使用ASCII安全版本
-                    print(f"Mock Response: {method} {netloc}{path} -> {response_config.get('status', 200)}")
-
-            except Exception as e:
-                print(f"创建Mock响应时出错: {e}")
-                # 创建一个简单的错误响应
+        try:
+            with PhaseTimer(flow, "replay_read"):
+                content = await self.replay.load_body(entry)
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            logger.error("replay", f"读取录制响应失败 {entry.source}: {e}")
+            self.metrics.count_error("replay")
+            if self.replay.unmatched == REPLAY_FAIL:
                 flow.response = http.Response.make(
-                    status_code=500,
-                    content=b'{"error": "Mock response encoding error"}',
+                    status_code=502,
+                    content=b'{"error": "Recorded response unavailable"}',
                     headers={"Content-Type": "application/json; charset=utf-8"}
                 )
-
-    def response(self, flow: http.HTTPFlow) -> None:
+            return
+
+        flow.metadata['mock_rule'] = RULE_REPLAY
+        self.metrics.inc('replay_hits')
+        flow.response = http.Response.make(
+            status_code=entry.status_code,
+            content=content,
+            headers=entry.headers
+        )
+        logger.debug("replay", f"回放响应: {method} {request_url} -> {entry.status_code}")
+
+    def log_summary(self):
+        """输出处理汇总（请求数、文件缓存和抓包队列状态）"""
+        cache_stats = self.file_cache.stats()
+        logger.info(
+            "summary",
+            f"已处理请求数: {self.metrics.counters['requests']}, "
+            f"已记录响应数: {self.metrics.counters['responses']}, "
+            f"文件缓存命中/未命中: {cache_stats['hits']}/{cache_stats['misses']} "
+            f"({cache_stats['bytes']}/{cache_stats['max_bytes']} bytes), "
+            f"抓包队列: {self.capture_writer.depth} (已写入 {self.capture_writer.written}, "
+            f"已丢弃 {self.capture_writer.dropped})"
+        )
+
+    def observe_flow_latency(self, flow: http.HTTPFlow):
+        """按处理方式和原始主机记录请求总延迟"""
+        original_url = flow.metadata.get('mock_original_url')
+        host = urlparse(original_url).hostname if original_url else flow.request.pretty_host
+        end = flow.response.timestamp_end if flow.response is not None else None
+        latency_ms = ((end or time.time()) - flow.request.timestamp_start) * 1000
+        self.metrics.observe_latency(flow.metadata.get('mock_rule', RULE_PASSTHROUGH), host or "", latency_ms)
+
+    def responseheaders(self, flow: http.HTTPFlow) -> None:
+        """本地流式服务返回的响应不缓存响应体，直接流式转发"""
+        if flow.metadata.get('mock_stream_token'):
+            flow.response.stream = True
+
+    async def response(self, flow: http.HTTPFlow) -> None:
         """处理HTTP响应，记录抓包数据"""
         try:
-            # 统计响应数量
-            self.response_count += 1
+            # 统计响应数量和延迟
+            self.metrics.inc('responses')
+            self.observe_flow_latency(flow)
 
             # 保存完整的请求和响应数据
-            self.save_captured_flow(flow)
+            await self.save_captured_flow(flow)
         except Exception as e:
-            print(f"记录响应时出错: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error("capture", f"记录响应时出错: {e}", exc_info=True)
+
+
+    async def error(self, flow: http.HTTPFlow) -> None:
+        """请求失败时释放未使用的流式发送令牌，并记录失败的请求"""
+        token = flow.metadata.pop('mock_stream_token', None)
+        if token:
+            self.stream_server.discard(token)
+
+        # 已有响应的请求在response中已经记录过
+        if flow.response is None:
+            self.metrics.count_error("upstream")
+            self.observe_flow_latency(flow)
+            await self.save_captured_flow(flow)
 
 
 addons = [MockAddon()]
\ No newline at end of file
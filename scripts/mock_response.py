@@ -0,0 +1,150 @@
+import hashlib
+import json
+from typing import Dict, Optional, Tuple
+
+from addon_logging import logger
+from network_conditions import NetworkConditions
+from response_template import CompiledBody
+
+DEFAULT_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+
+# 日志中只显示较短的响应内容
+LOG_PREVIEW_LIMIT = 1000
+
+
+def safe_json_encode(data) -> str:
+    """安全的JSON编码，处理特殊字符"""
+    try:
+        # 使用ensure_ascii=False来保持Unicode字符，但添加错误处理
+        json_str = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        # 确保字符串可以被UTF-8编码
+        json_str.encode('utf-8')
+        return json_str
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        # 如果出现编码错误，使用ensure_ascii=True作为备选方案
+        return json.dumps(data, ensure_ascii=True, separators=(',', ':'))
+
+
+def encode_headers(headers: Dict[str, str]) -> Tuple[Tuple[bytes, bytes], ...]:
+    """把响应头转换为 http.Response.make 可直接使用的字节对"""
+    return tuple(
+        (str(name).encode('utf-8', 'surrogateescape'), str(value).encode('utf-8', 'surrogateescape'))
+        for name, value in headers.items()
+    )
+
+
+class PreparedResponse:
+    """已序列化好的Mock响应，命中时直接交给 http.Response.make
+
+    模板响应的 template 为预编译的响应体，content 为空，请求时再渲染。
+    """
+
+    __slots__ = ('status_code', 'headers', 'content', 'body_hash', 'preview', 'template', 'network', 'rule_id')
+
+    def __init__(self, status_code: int, headers: Tuple[Tuple[bytes, bytes], ...],
+                 content: bytes, body_hash: str, preview: Optional[str] = None,
+                 template: Optional[CompiledBody] = None, network: Optional[NetworkConditions] = None,
+                 rule_id: Optional[str] = None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.body_hash = body_hash
+        self.preview = preview
+        self.template = template
+        self.network = network
+        self.rule_id = rule_id
+
+
+ENCODING_ERROR_RESPONSE = PreparedResponse(
+    500,
+    encode_headers(DEFAULT_HEADERS),
+    b'{"error": "Mock response encoding error"}',
+    'encoding-error',
+)
+
+
+class ResponseCache:
+    """缓存预序列化的Mock响应
+
+    后端推送的规则带有 rev（最后修改该规则的配置版本），按 (规则ID, rev) 查找，
+    配置重新加载时未修改的规则不再序列化响应体；没有 rev 的规则（包括从配置文件
+    加载的规则，文件可能被手动编辑而 rev 不变）按 (规则ID, 内容哈希) 缓存。
+    每次加载后清理已不存在的条目。
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, object], PreparedResponse] = {}
+        self._live = set()
+
+    def prepare(self, rule_id: str, response_config: dict, network_config: Optional[dict] = None,
+                rev: Optional[int] = None) -> PreparedResponse:
+        """序列化一条API配置的响应，network_config为规则的网络条件，rev为规则的修改版本"""
+        if rev is not None:
+            key = (rule_id, ('rev', rev))
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._live.add(key)
+                return prepared
+        prepared = self._prepare(rule_id, response_config, network_config)
+        if rev is not None and prepared is not ENCODING_ERROR_RESPONSE:
+            key = (rule_id, ('rev', rev))
+            self._live.add(key)
+            self._entries[key] = prepared
+        return prepared
+
+    def _prepare(self, rule_id: str, response_config: dict, network_config: Optional[dict]) -> PreparedResponse:
+        try:
+            status_code = response_config.get('status', 200)
+            headers = response_config.get('headers', DEFAULT_HEADERS)
+
+            body = response_config.get('body', {})
+            is_template = bool(response_config.get('template'))
+            content = safe_json_encode(body).encode('utf-8', errors='replace')
+            header_bytes = encode_headers(headers)
+
+            digest = hashlib.blake2b(content, digest_size=16)
+            digest.update(b'template' if is_template else b'static')
+            digest.update(str(status_code).encode())
+            network = NetworkConditions.from_config(network_config)
+            digest.update(repr(network).encode())
+            for name, value in header_bytes:
+                digest.update(b'\0' + name + b'\0' + value)
+            body_hash = digest.hexdigest()
+        except Exception as e:
+            logger.error("mock", f"创建Mock响应时出错: {e}")
+            return ENCODING_ERROR_RESPONSE
+
+        key = (rule_id, body_hash)
+        self._live.add(key)
+        prepared = self._entries.get(key)
+        if prepared is None:
+            preview = None
+            if len(content) < LOG_PREVIEW_LIMIT * 4:
+                text = content.decode('utf-8', errors='replace')
+                if len(text) < LOG_PREVIEW_LIMIT:
+                    preview = text
+
+            # 模板只在内容变化时编译一次，之后随缓存条目复用
+            template = None
+            if is_template:
+                try:
+                    template = CompiledBody.compile(body)
+                except Exception as e:
+                    logger.error("mock", f"编译响应模板 {rule_id} 失败: {e}")
+                    return ENCODING_ERROR_RESPONSE
+                content = b''
+            prepared = PreparedResponse(status_code, header_bytes, content, body_hash, preview, template, network,
+                                        rule_id)
+            self._entries[key] = prepared
+        return prepared
+
+    def begin(self):
+        """开始一次快照构建"""
+        self._live = set()
+
+    def commit(self):
+        """快照构建完成，丢弃本次未使用的条目"""
+        self._entries = {key: value for key, value in self._entries.items() if key in self._live}
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,87 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+# 限速发送时每块数据对应的时长（秒），块越小速率越平滑
+PACING_INTERVAL = 0.05
+MIN_CHUNK_SIZE = 1024
+
+
+class NetworkConditions:
+    """规则上配置的网络条件：固定延迟、随机抖动和带宽上限
+
+    - latency_ms：返回响应前等待的时间
+    - jitter_ms：在latency_ms基础上增减的随机范围
+    - bandwidth_kbps：响应体发送速率上限（千比特/秒），0表示不限速
+    """
+
+    __slots__ = ('latency_ms', 'jitter_ms', 'bandwidth_kbps')
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, bandwidth_kbps: float = 0):
+        self.latency_ms = max(0.0, float(latency_ms))
+        self.jitter_ms = max(0.0, float(jitter_ms))
+        self.bandwidth_kbps = max(0.0, float(bandwidth_kbps))
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> Optional['NetworkConditions']:
+        """从规则的network配置创建，未配置或全部为0时返回None"""
+        if not config:
+            return None
+        conditions = cls(
+            latency_ms=config.get('latency_ms') or 0,
+            jitter_ms=config.get('jitter_ms') or 0,
+            bandwidth_kbps=config.get('bandwidth_kbps') or 0,
+        )
+        if not (conditions.latency_ms or conditions.jitter_ms or conditions.bandwidth_kbps):
+            return None
+        return conditions
+
+    def delay(self) -> float:
+        """本次请求的延迟（秒）"""
+        delay_ms = self.latency_ms
+        if self.jitter_ms:
+            delay_ms += random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, delay_ms) / 1000
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bandwidth_kbps * 1000 / 8
+
+    def __repr__(self) -> str:
+        return (f"NetworkConditions(latency_ms={self.latency_ms}, jitter_ms={self.jitter_ms}, "
+                f"bandwidth_kbps={self.bandwidth_kbps})")
+
+
+class Pacer:
+    """按目标速率安排发送时间
+
+    按累计发送量计算每块数据最早的发送时间，用 asyncio.sleep 等待，
+    不占用线程；sleep本身的误差不会累积。
+    """
+
+    __slots__ = ('bytes_per_second', 'chunk_size', 'started_at', 'sent')
+
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self.chunk_size = max(MIN_CHUNK_SIZE, int(bytes_per_second * PACING_INTERVAL))
+        self.started_at = time.monotonic()
+        self.sent = 0
+
+    async def wait(self, size: int):
+        """在发送size字节之前调用"""
+        due = self.started_at + self.sent / self.bytes_per_second
+        self.sent += size
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def paced_write(writer: asyncio.StreamWriter, data: bytes, pacer: Pacer):
+    """按速率分块写入数据"""
+    view = memoryview(data)
+    for start in range(0, len(view), pacer.chunk_size):
+        chunk = view[start:start + pacer.chunk_size]
+        await pacer.wait(len(chunk))
+        writer.write(chunk)
+        await writer.drain()
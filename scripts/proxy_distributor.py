@@ -0,0 +1,129 @@
+"""多worker模式的前端分发器
+
+在代理端口上接受客户端连接，按当前连接数最少的原则转发到各个mitmdump worker，
+连接建立后只做双向字节转发。某个worker无法连接时尝试下一个。
+
+用法：python proxy_distributor.py --listen 0.0.0.0:8080 --backend 127.0.0.1:18081 --backend 127.0.0.1:18082
+"""
+import argparse
+import asyncio
+import signal
+import sys
+from typing import List, Optional, Tuple
+
+BUFFER_SIZE = 64 * 1024
+CONNECT_TIMEOUT = 3.0
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+
+class Backend:
+    __slots__ = ('host', 'port', 'active', 'failures')
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.active = 0
+        self.failures = 0
+
+    def __repr__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class Distributor:
+    def __init__(self, backends: List[Backend]):
+        self.backends = backends
+        self._next = 0
+
+    def _candidates(self) -> List[Backend]:
+        """连接数最少的优先，连接数相同时轮流选择"""
+        start = self._next
+        self._next = (self._next + 1) % len(self.backends)
+        rotated = self.backends[start:] + self.backends[:start]
+        return sorted(rotated, key=lambda backend: (backend.failures > 0, backend.active))
+
+    async def _connect(self) -> Optional[Tuple[Backend, asyncio.StreamReader, asyncio.StreamWriter]]:
+        for backend in self._candidates():
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(backend.host, backend.port), CONNECT_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                backend.failures += 1
+                print(f"连接worker {backend} 失败: {e}", flush=True)
+                continue
+            backend.failures = 0
+            return backend, reader, writer
+        return None
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                if writer.can_write_eof():
+                    writer.write_eof()
+            except (OSError, RuntimeError):
+                pass
+
+    async def handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        connected = await self._connect()
+        if connected is None:
+            client_writer.close()
+            return
+        backend, upstream_reader, upstream_writer = connected
+        backend.active += 1
+        try:
+            await asyncio.gather(
+                self._pipe(client_reader, upstream_writer),
+                self._pipe(upstream_reader, client_writer),
+            )
+        finally:
+            backend.active -= 1
+            upstream_writer.close()
+            client_writer.close()
+
+
+async def serve(listen: Tuple[str, int], backends: List[Backend]):
+    distributor = Distributor(backends)
+    server = await asyncio.start_server(distributor.handle, listen[0], listen[1], reuse_address=True)
+    print(f"分发器已启动: {listen[0]}:{listen[1]} -> {', '.join(map(str, backends))}", flush=True)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async with server:
+        await stop_event.wait()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="mitmdump worker分发器")
+    parser.add_argument('--listen', required=True, help="监听地址，如 0.0.0.0:8080")
+    parser.add_argument('--backend', action='append', required=True, help="worker地址，可重复指定")
+    args = parser.parse_args(argv)
+
+    backends = [Backend(*parse_address(value)) for value in args.backend]
+    try:
+        asyncio.run(serve(parse_address(args.listen), backends))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional
+
+from addon_logging import logger
+
+# 插件与后端共享的指标文件，后端 /metrics 读取后转换为Prometheus文本格式
+# （多worker模式下每个worker一个文件，如 data/proxy_metrics.w1.json）
+METRICS_FILE = "data/proxy_metrics.json"
+
+# 延迟直方图的桶上界（毫秒），最后隐含一个 +Inf 桶
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 按主机统计延迟时最多记录的主机数，超出的归入 OTHER_HOST
+MAX_TRACKED_HOSTS = 200
+OTHER_HOST = "__other__"
+
+# 请求的处理方式，作为延迟直方图的 rule 标签
+RULE_MOCK = "mock"
+RULE_DOWNLOAD = "download"
+RULE_MAPPING = "mapping"
+RULE_REPLAY = "replay"
+RULE_PASSTHROUGH = "passthrough"
+
+
+class _Histogram:
+    """固定桶的累计直方图"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {'counts': list(self.counts), 'sum': round(self.sum, 3), 'count': self.count}
+
+
+class ProxyMetrics:
+    """代理进程的计数器和延迟直方图
+
+    在mitmproxy的事件循环中更新，由后台线程每隔 interval 秒把快照原子写入
+    共享文件，后端按需读取，不在请求路径上做任何I/O。
+    """
+
+    def __init__(self, metrics_file: str = METRICS_FILE, interval: float = 1.0):
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self.started_at = time.time()
+        self.counters: Dict[str, int] = {
+            'requests': 0,
+            'responses': 0,
+            'mock_hits': 0,
+            'download_hits': 0,
+            'mapping_forwards': 0,
+            'replay_hits': 0,
+        }
+        self.errors: Dict[str, int] = {}
+        self.latency_by_rule: Dict[str, _Histogram] = {}
+        self.latency_by_host: Dict[str, _Histogram] = {}
+        # 采集时读取的即时值，如抓包队列长度
+        self.gauge_sources: Dict[str, Callable[[], float]] = {}
+        # 采集时读取、由其他组件维护的累计值，如已写入的抓包记录数，作为计数器导出
+        self.counter_sources: Dict[str, Callable[[], int]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def inc(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_error(self, kind: str):
+        with self._lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def observe_latency(self, rule: str, host: str, latency_ms: float):
+        """记录一个请求的总延迟（毫秒）"""
+        with self._lock:
+            histogram = self.latency_by_rule.get(rule)
+            if histogram is None:
+                histogram = self.latency_by_rule[rule] = _Histogram()
+            histogram.observe(latency_ms)
+
+            histogram = self.latency_by_host.get(host)
+            if histogram is None:
+                if len(self.latency_by_host) >= MAX_TRACKED_HOSTS:
+                    host = OTHER_HOST
+                    histogram = self.latency_by_host.get(host)
+                if histogram is None:
+                    histogram = self.latency_by_host[host] = _Histogram()
+            histogram.observe(latency_ms)
+
+    def add_gauge(self, name: str, source: Callable[[], float]):
+        self.gauge_sources[name] = source
+
+    def add_counter(self, name: str, source: Callable[[], int]):
+        """注册只增不减的累计值，与 inc 维护的计数器一起导出"""
+        self.counter_sources[name] = source
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = {
+                'pid': os.getpid(),
+                'started_at': self.started_at,
+                'updated_at': time.time(),
+                'counters': dict(self.counters),
+                'errors': dict(self.errors),
+                'buckets': list(LATENCY_BUCKETS_MS),
+                'latency_by_rule': {rule: h.to_dict() for rule, h in self.latency_by_rule.items()},
+                'latency_by_host': {host: h.to_dict() for host, h in self.latency_by_host.items()},
+            }
+
+        for name, source in list(self.counter_sources.items()):
+            try:
+                data['counters'][name] = source()
+            except Exception:
+                continue
+
+        gauges = {}
+        for name, source in list(self.gauge_sources.items()):
+            try:
+                gauges[name] = source()
+            except Exception:
+                continue
+        data['gauges'] = gauges
+        return data
+
+    def publish(self):
+        """把当前快照原子写入共享文件"""
+        data = self.snapshot()
+        os.makedirs(os.path.dirname(self.metrics_file) or '.', exist_ok=True)
+        tmp_file = f"{self.metrics_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, self.metrics_file)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error("metrics", f"写入指标文件失败: {e}")
+
+    def start(self):
+        """启动后台发布线程"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="mock-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台发布线程，并写入最后一次快照"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        try:
+            self.publish()
+        except Exception as e:
+            logger.error("metrics", f"写入指标文件失败: {e}")
+
+    def configure(self, interval: float):
+        self.interval = max(0.1, interval)
+
@@ -0,0 +1,307 @@
+import asyncio
+import gzip
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from addon_logging import logger
+from body_matcher import RequestBody
+from capture_policy import BODY_FULL, BODY_HASH
+
+# 未命中录制记录的请求：passthrough 转发到上游，fail 直接返回错误响应
+REPLAY_PASSTHROUGH = "passthrough"
+REPLAY_FAIL = "fail"
+REPLAY_UNMATCHED_POLICIES = (REPLAY_PASSTHROUGH, REPLAY_FAIL)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# 录制的响应体是解码后的内容，这些头由mitmproxy按实际发送的内容重新生成
+_DROPPED_HEADERS = frozenset({'content-length', 'content-encoding', 'transfer-encoding', 'connection'})
+
+# gzip分段中的响应体每次读取都要从头解压，解压出的响应体按该字节预算缓存
+BODY_CACHE_BYTES = 32 * 1024 * 1024
+
+ReplayKey = Tuple[str, str, Optional[str]]
+
+
+def normalize_url(url: str) -> str:
+    """规范化URL：协议和主机小写、去掉默认端口、查询参数排序"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{scheme}://{netloc}{parts.path or '/'}" + (f"?{query}" if query else "")
+
+
+def _open_recording(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_recording(path: str) -> Iterator[Tuple[int, bytes]]:
+    """逐行读取抓包文件（JSONL，支持gzip分段），返回 (行偏移, 行内容)"""
+    offset = 0
+    with _open_recording(path) as f:
+        for line in f:
+            yield offset, line
+            offset += len(line)
+
+
+def _recorded_body(text: str, info: Optional[dict]) -> Optional[bytes]:
+    """抓包时完整记录的body，截断、二进制或只记录哈希的返回None"""
+    if info is None:
+        return (text or "").encode('utf-8')
+    if info.get('size', 0) == 0:
+        return b""
+    if info.get('mode') == BODY_FULL:
+        return text.encode('utf-8')
+    return None
+
+
+class ReplayEntry:
+    """一条可回放的录制响应
+
+    响应体不超过 inline_bytes 时直接保存在内存中，否则只记录所在文件和行偏移，
+    命中时再读取。
+    """
+
+    __slots__ = ('status_code', 'headers', 'body', 'source', 'offset')
+
+    def __init__(self, status_code: int, headers: Tuple[Tuple[bytes, bytes], ...],
+                 body: Optional[bytes], source: str, offset: int):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.source = source
+        self.offset = offset
+
+    def load_body(self) -> bytes:
+        """从录制文件读取响应体（gzip分段需要从头解压到该位置）"""
+        if self.body is not None:
+            return self.body
+        with _open_recording(self.source) as f:
+            f.seek(self.offset)
+            record = json.loads(f.readline())
+        return record['response']['response_body'].encode('utf-8')
+
+
+class BodyCache:
+    """按字节预算限制的LRU响应体缓存，键为 (文件, 行偏移)，线程池中读取时并发访问"""
+
+    def __init__(self, max_bytes: int = BODY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: 'OrderedDict[Tuple[str, int], bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int]) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple[str, int], body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._entries[key] = body
+            self.current_bytes += len(body)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+class ReplayIndex:
+    """按 (方法, 规范化URL, 请求体哈希) 索引的录制响应
+
+    同一个键录制了多次时按录制顺序轮流返回。
+    match_body 关闭时键中不包含请求体哈希。
+    """
+
+    def __init__(self, match_body: bool = True):
+        self.match_body = match_body
+        self.entries: Dict[ReplayKey, List[ReplayEntry]] = {}
+        self.size = 0
+        self.skipped = 0
+        self._cursors: Dict[ReplayKey, int] = {}
+
+    def key_for(self, method: str, url: str, body: RequestBody) -> ReplayKey:
+        digest = body.digest if self.match_body and body.content else None
+        return method.upper(), normalize_url(url), digest
+
+    def add_record(self, record: dict, source: str, offset: int, inline_bytes: int):
+        request = record.get('request') or {}
+        response = record.get('response')
+        if not response or not request.get('url'):
+            self.skipped += 1
+            return
+
+        body = _recorded_body(response.get('response_body', ""), response.get('response_body_info'))
+        if body is None:
+            self.skipped += 1
+            return
+
+        digest = None
+        if self.match_body:
+            request_info = request.get('request_body_info')
+            request_body = _recorded_body(request.get('request_body', ""), request_info)
+            if request_body is not None:
+                digest = RequestBody(request_body).digest if request_body else None
+            elif request_info.get('mode') == BODY_HASH:
+                # 旧的录制只有原始字节的sha256，非JSON请求体与匹配摘要相同，JSON请求体无法匹配
+                digest = request_info.get('match_digest') or request_info.get('sha256')
+            else:
+                self.skipped += 1
+                return
+
+        headers = tuple(
+            (str(name).encode('utf-8', 'surrogateescape'), str(value).encode('utf-8', 'surrogateescape'))
+            for name, value in (response.get('headers') or {}).items()
+            if name.lower() not in _DROPPED_HEADERS
+        )
+        entry = ReplayEntry(
+            response.get('status_code', 200), headers,
+            body if len(body) <= inline_bytes else None, source, offset,
+        )
+        key = (request.get('method', 'GET').upper(), normalize_url(request['url']), digest)
+        self.entries.setdefault(key, []).append(entry)
+        self.size += 1
+
+    def load_file(self, path: str, inline_bytes: int, stop_event: Optional[threading.Event] = None):
+        for offset, line in iter_recording(path):
+            if stop_event is not None and stop_event.is_set():
+                return
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.skipped += 1
+                continue
+            self.add_record(record, path, offset, inline_bytes)
+
+    def lookup(self, method: str, url: str, body: RequestBody) -> Optional[ReplayEntry]:
+        key = self.key_for(method, url, body)
+        entries = self.entries.get(key)
+        if not entries:
+            return None
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = cursor + 1
+        return entries[cursor % len(entries)]
+
+
+class ReplayStore:
+    """回放模式：后台线程加载录制文件，完成后整体替换索引
+
+    加载期间请求按未命中处理；索引只读，请求处理中拿到的要么是旧索引要么是新索引。
+    """
+
+    def __init__(self):
+        self.files: Tuple[str, ...] = ()
+        self.unmatched = REPLAY_PASSTHROUGH
+        self.match_body = True
+        self.inline_bytes = 64 * 1024
+        self.index: Optional[ReplayIndex] = None
+        self.body_cache = BodyCache()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.files)
+
+    def configure(self, files: Sequence[str], unmatched: str, match_body: bool, inline_bytes: int):
+        if unmatched not in REPLAY_UNMATCHED_POLICIES:
+            logger.warning("replay", f"未知的未命中策略 {unmatched}，使用 {REPLAY_PASSTHROUGH}")
+            unmatched = REPLAY_PASSTHROUGH
+        self.unmatched = unmatched
+
+        files = tuple(files)
+        inline_bytes = max(0, inline_bytes)
+        if (files, match_body, inline_bytes) == (self.files, self.match_body, self.inline_bytes):
+            return
+        self.files = files
+        self.match_body = match_body
+        self.inline_bytes = inline_bytes
+        self.reload()
+
+    def reload(self):
+        """重新加载录制文件"""
+        self.stop()
+        self.index = None
+        self.body_cache.clear()
+        if not self.files:
+            return
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._load, args=(self.files, self.match_body, self.inline_bytes, self._stop_event),
+            name="replay-loader", daemon=True,
+        )
+        self._thread.start()
+
+    def _load(self, files: Tuple[str, ...], match_body: bool, inline_bytes: int, stop_event: threading.Event):
+        started = time.perf_counter()
+        index = ReplayIndex(match_body)
+        for path in files:
+            try:
+                index.load_file(path, inline_bytes, stop_event)
+            except (OSError, EOFError) as e:
+                logger.error("replay", f"读取录制文件失败 {path}: {e}")
+            if stop_event.is_set():
+                return
+        self.index = index
+        logger.info(
+            "replay",
+            f"回放索引已加载: {index.size} 条响应, {len(index.entries)} 个请求键, "
+            f"跳过 {index.skipped} 条, 耗时 {time.perf_counter() - started:.2f}s"
+        )
+
+    def lookup(self, method: str, url: str, body: RequestBody) -> Optional[ReplayEntry]:
+        index = self.index
+        if index is None:
+            return None
+        return index.lookup(method, url, body)
+
+    async def load_body(self, entry: ReplayEntry) -> bytes:
+        """读取响应体，未缓存在内存中的在线程池中读取，不阻塞事件循环"""
+        if entry.body is not None:
+            return entry.body
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._read_body, entry)
+
+    def _read_body(self, entry: ReplayEntry) -> bytes:
+        """普通文件按偏移直接读取；gzip分段需要从头解压，读到的响应体放入缓存"""
+        if not entry.source.endswith('.gz'):
+            return entry.load_body()
+        key = (entry.source, entry.offset)
+        body = self.body_cache.get(key)
+        if body is None:
+            body = entry.load_body()
+            self.body_cache.put(key, body)
+        return body
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
@@ -0,0 +1,198 @@
+import json
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from jinja2 import Environment
+from jinja2.sandbox import SandboxedEnvironment
+
+from body_matcher import RequestBody
+
+# 整个字符串只有一个表达式时按原始类型输出（数字、布尔、对象等），否则渲染为字符串
+_EXPRESSION_ONLY_RE = re.compile(r'^\{\{(?P<expr>(?:(?!\}\}|\{\{|\{%|\{#).)*)\}\}$', re.S)
+
+# 除 build_context 提供的变量外，模板只能使用这些全局函数
+TEMPLATE_GLOBALS = ('range', 'dict', 'namespace')
+
+_environment: Optional[Environment] = None
+
+
+def get_environment() -> Environment:
+    """模板来自任何人都能通过接口写入的规则配置，在沙箱中渲染，不能访问下划线属性和不安全的方法"""
+    global _environment
+    if _environment is None:
+        environment = SandboxedEnvironment(autoescape=False, keep_trailing_newline=True)
+        environment.globals = {name: environment.globals[name] for name in TEMPLATE_GLOBALS}
+        _environment = environment
+    return _environment
+
+
+def is_template_string(value: Any) -> bool:
+    return isinstance(value, str) and ('{{' in value or '{%' in value)
+
+
+def _json_default(value: Any) -> Any:
+    return str(value)
+
+
+class TemplateRequest:
+    """模板中的 request 对象，各字段在首次访问时计算"""
+
+    __slots__ = ('_request', '_body', '_cache')
+
+    def __init__(self, request, body: RequestBody):
+        self._request = request
+        self._body = body
+        self._cache: Dict[str, Any] = {}
+
+    @property
+    def method(self) -> str:
+        return self._request.method
+
+    @property
+    def url(self) -> str:
+        return self._request.url
+
+    @property
+    def host(self) -> str:
+        return self._request.pretty_host
+
+    @property
+    def path(self) -> str:
+        return self._request.path.split('?', 1)[0]
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """请求头（名称为小写）"""
+        if 'headers' not in self._cache:
+            self._cache['headers'] = {name.lower(): value for name, value in self._request.headers.items()}
+        return self._cache['headers']
+
+    @property
+    def query(self) -> Dict[str, str]:
+        """查询参数，同名参数取第一个值"""
+        if 'query' not in self._cache:
+            query = {}
+            for name, value in self._request.query.items(multi=True):
+                query.setdefault(name, value)
+            self._cache['query'] = query
+        return self._cache['query']
+
+    @property
+    def body(self) -> str:
+        if 'body' not in self._cache:
+            self._cache['body'] = self._body.content.decode('utf-8', errors='replace')
+        return self._cache['body']
+
+    @property
+    def json(self) -> Any:
+        """请求体JSON，不是JSON时为None"""
+        return self._body.json_or_none
+
+
+def build_context(request, body: RequestBody, params: Dict[str, str]) -> Dict[str, Any]:
+    """模板可用的变量"""
+    template_request = TemplateRequest(request, body)
+    now = time.time()
+    return {
+        'request': template_request,
+        'params': params,
+        'query': template_request.query,
+        'headers': template_request.headers,
+        'now': now,
+        'timestamp_ms': int(now * 1000),
+        'uuid4': lambda: str(uuid.uuid4()),
+    }
+
+
+Part = Union[bytes, Callable[[Dict[str, Any]], bytes]]
+
+
+class CompiledBody:
+    """预编译的响应体模板
+
+    JSON响应体中不含模板语法的部分在加载配置时就序列化为字节，
+    请求时只渲染各模板字符串并拼接。
+    """
+
+    __slots__ = ('parts',)
+
+    def __init__(self, parts: List[Part]):
+        self.parts = tuple(parts)
+
+    def render(self, context: Dict[str, Any]) -> bytes:
+        return b''.join(part if type(part) is bytes else part(context) for part in self.parts)
+
+    @classmethod
+    def compile(cls, body: Any) -> 'CompiledBody':
+        """body为字符串时整体作为文本模板；为JSON对象/数组时其中的字符串值可以是模板"""
+        environment = get_environment()
+        if isinstance(body, str):
+            template = environment.from_string(body)
+            return cls([lambda context: template.render(context).encode('utf-8')])
+
+        builder = _PartsBuilder(environment)
+        builder.add_value(body)
+        return cls(builder.finish())
+
+
+class _PartsBuilder:
+    def __init__(self, environment: Environment):
+        self.environment = environment
+        self.parts: List[Part] = []
+        self.static: List[str] = []
+
+    def emit(self, text: str):
+        self.static.append(text)
+
+    def emit_dynamic(self, renderer: Callable[[Dict[str, Any]], bytes]):
+        self.flush()
+        self.parts.append(renderer)
+
+    def flush(self):
+        if self.static:
+            self.parts.append(''.join(self.static).encode('utf-8'))
+            self.static = []
+
+    def finish(self) -> List[Part]:
+        self.flush()
+        return self.parts
+
+    def add_value(self, value: Any):
+        if isinstance(value, dict):
+            self.emit('{')
+            for i, (key, item) in enumerate(value.items()):
+                if i:
+                    self.emit(',')
+                self.emit(json.dumps(str(key), ensure_ascii=False))
+                self.emit(':')
+                self.add_value(item)
+            self.emit('}')
+        elif isinstance(value, list):
+            self.emit('[')
+            for i, item in enumerate(value):
+                if i:
+                    self.emit(',')
+                self.add_value(item)
+            self.emit(']')
+        elif is_template_string(value):
+            self.emit_dynamic(self.compile_string(value))
+        else:
+            self.emit(json.dumps(value, ensure_ascii=False))
+
+    def compile_string(self, source: str) -> Callable[[Dict[str, Any]], bytes]:
+        expression = _EXPRESSION_ONLY_RE.match(source.strip())
+        if expression:
+            evaluate = self.environment.compile_expression(expression.group('expr'))
+
+            def render_expression(context: Dict[str, Any]) -> bytes:
+                value = evaluate(**context)
+                return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+            return render_expression
+
+        template = self.environment.from_string(source)
+
+        def render_template(context: Dict[str, Any]) -> bytes:
+            return json.dumps(template.render(context), ensure_ascii=False).encode('utf-8')
+        return render_template
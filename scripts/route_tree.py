@@ -0,0 +1,252 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote
+
+from body_matcher import BodyIndex, RequestBody
+
+# 路径模板语法：
+#   /users/{id}       {name} 匹配一个非空路径段并记为参数 name
+#   /users/*/avatar   *      匹配一个非空路径段（不记录）
+#   /static/{path*}   {name*} 匹配剩余的全部路径（可以为空），只能出现在最后
+#   /static/**        **     同上（不记录）
+# 查询参数条件写在URL的 ?? 之后（需要显式声明，普通的 ?query 和以前一样在匹配时忽略）：
+#   ??type=admin  参数type必须等于admin
+#   ??debug       参数debug必须存在（值任意）
+#   ??debug=*     同上
+# 不带主机的规则（以 / 开头）匹配任意主机。
+
+ANY_HOST = ""
+
+
+def _is_param(segment: str) -> bool:
+    return len(segment) > 2 and segment[0] == '{' and segment[-1] == '}'
+
+
+def split_api_url(url: str) -> Tuple[str, str, str]:
+    """把API配置的url拆成 (主机, 路径, 查询条件)
+
+    兼容 "https://host/path"、"host/path" 和 "/path" 三种写法。只有 ?? 之后的部分
+    作为查询条件，普通的 ?query 不参与匹配，已有的规则行为不变。
+    """
+    if '://' in url:
+        url = url.split('://', 1)[1]
+    url = url.split('#', 1)[0]
+    url, _, query = url.partition('?')
+    query = query[1:] if query.startswith('?') else ""
+    slash = url.find('/')
+    if slash == -1:
+        return url.lower(), '/', query
+    return url[:slash].lower(), url[slash:], query
+
+
+def parse_query_predicates(query: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """解析查询参数条件，值为None表示只要求参数存在"""
+    predicates = []
+    for part in query.split('&'):
+        if not part:
+            continue
+        name, has_value, value = part.partition('=')
+        name = unquote(name.replace('+', ' '))
+        if not has_value or value == '*':
+            predicates.append((name, None))
+        else:
+            predicates.append((name, unquote(value.replace('+', ' '))))
+    return tuple(sorted(predicates, key=lambda p: (p[0], p[1] or '')))
+
+
+class RouteMatch:
+    """一次路由匹配的结果"""
+
+    __slots__ = ('payload', 'params')
+
+    def __init__(self, payload: Any, params: Dict[str, str]):
+        self.payload = payload
+        self.params = params
+
+
+class _Route:
+    __slots__ = ('payload', 'param_names', 'tail_name', 'query', 'template')
+
+    def __init__(self, payload: Any, param_names: Tuple[Optional[str], ...],
+                 tail_name: Optional[str], query: Tuple[Tuple[str, Optional[str]], ...], template: str):
+        self.payload = payload
+        self.param_names = param_names
+        self.tail_name = tail_name
+        self.query = query
+        self.template = template
+
+    def query_matches(self, query_args: Dict[str, List[str]]) -> bool:
+        for name, value in self.query:
+            values = query_args.get(name)
+            if values is None:
+                return False
+            if value is not None and value not in values:
+                return False
+        return True
+
+    def build_params(self, captured: List[str], tail: Optional[str]) -> Dict[str, str]:
+        params = {}
+        for name, value in zip(self.param_names, captured):
+            if name is not None:
+                params[name] = unquote(value)
+        if self.tail_name is not None and tail is not None:
+            params[self.tail_name] = unquote(tail)
+        return params
+
+
+class _Node:
+    __slots__ = ('literals', 'param', 'routes', 'tail_routes')
+
+    def __init__(self):
+        self.literals: Dict[str, '_Node'] = {}
+        self.param: Optional['_Node'] = None
+        self.routes: List[_Route] = []  # 路径在此结束的规则
+        self.tail_routes: List[_Route] = []  # 在此匹配剩余全部路径的规则
+
+
+def _find_route(routes: List[_Route], template: str, query: Tuple[Tuple[str, Optional[str]], ...]) -> Optional[_Route]:
+    for route in routes:
+        if route.template == template and route.query == query:
+            return route
+    return None
+
+
+class RouteTree:
+    """按路径段组织的前缀树，查找耗时取决于路径段数而不是规则数量
+
+    匹配优先级（逐段比较）：字面量 > 单段参数/* > 剩余路径通配；
+    同一位置有多条规则时，查询条件多的优先，其次按配置顺序。
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.size = 0
+
+    def setdefault(self, path: str, query: str, factory: Callable[[], Any]) -> Any:
+        """返回模板和查询条件完全相同的规则的payload，不存在时用factory创建"""
+        segments = path.split('/')[1:] if path.startswith('/') else path.split('/')
+        node = self.root
+        param_names: List[Optional[str]] = []
+        tail_name = None
+        is_tail = False
+
+        for index, segment in enumerate(segments):
+            if segment == '**' or (_is_param(segment) and segment.endswith('*}')):
+                if index != len(segments) - 1:
+                    raise ValueError(f"剩余路径通配只能出现在最后: {path}")
+                tail_name = segment[1:-2] if segment != '**' else None
+                is_tail = True
+                break
+            if segment == '*' or _is_param(segment):
+                param_names.append(segment[1:-1] if segment != '*' else None)
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                child = node.literals.get(segment)
+                if child is None:
+                    child = node.literals[segment] = _Node()
+                node = child
+
+        routes = node.tail_routes if is_tail else node.routes
+        predicates = parse_query_predicates(query)
+        route = _find_route(routes, path, predicates)
+        if route is None:
+            route = _Route(factory(), tuple(param_names), tail_name, predicates, path)
+            routes.append(route)
+            # 稳定排序，条件更具体的规则优先，条件数相同时保持配置顺序
+            routes.sort(key=lambda r: -len(r.query))
+            self.size += 1
+        return route.payload
+
+    def resolve(self, path: str, query: str = "",
+                select: Optional[Callable[[Any], Any]] = None) -> Optional[RouteMatch]:
+        """查找匹配的规则
+
+        select 用于在路径和查询条件匹配后进一步筛选payload，返回None时继续尝试
+        优先级更低的规则；匹配结果中的payload为select的返回值。
+        """
+        segments = path.split('/')[1:] if path.startswith('/') else path.split('/')
+        query_cache: List[Optional[Dict[str, List[str]]]] = [None]
+
+        def query_args() -> Dict[str, List[str]]:
+            if query_cache[0] is None:
+                query_cache[0] = parse_qs(query, keep_blank_values=True)
+            return query_cache[0]
+
+        def pick(routes: List[_Route]) -> Optional[Tuple[_Route, Any]]:
+            for route in routes:
+                if route.query and not route.query_matches(query_args()):
+                    continue
+                payload = route.payload if select is None else select(route.payload)
+                if payload is not None:
+                    return route, payload
+            return None
+
+        captured: List[str] = []
+
+        def search(node: _Node, index: int) -> Optional[RouteMatch]:
+            if index == len(segments):
+                picked = pick(node.routes)
+                if picked is not None:
+                    route, payload = picked
+                    return RouteMatch(payload, route.build_params(captured, None))
+            else:
+                segment = segments[index]
+                child = node.literals.get(segment)
+                if child is not None:
+                    found = search(child, index + 1)
+                    if found is not None:
+                        return found
+                if node.param is not None and segment:
+                    captured.append(segment)
+                    found = search(node.param, index + 1)
+                    captured.pop()
+                    if found is not None:
+                        return found
+            if node.tail_routes:
+                picked = pick(node.tail_routes)
+                if picked is not None:
+                    route, payload = picked
+                    tail = '/'.join(segments[index:])
+                    return RouteMatch(payload, route.build_params(captured, tail))
+            return None
+
+        return search(self.root, 0)
+
+
+class ApiRouter:
+    """API Mock规则路由：按 (方法, 主机) 分别建树，主机专属规则优先于不带主机的规则
+
+    树中每个 (模板, 查询条件) 对应一个 BodyIndex，同一URL下按请求体区分的
+    多条规则（GraphQL操作名、JSON指针、请求体哈希）在其中用哈希索引查找。
+    """
+
+    def __init__(self):
+        self.trees: Dict[Tuple[str, str], RouteTree] = {}
+
+    def add(self, method: str, url: str, body_match: Optional[dict], payload: Any):
+        host, path, query = split_api_url(url)
+        key = (method.upper(), host)
+        tree = self.trees.get(key)
+        if tree is None:
+            tree = self.trees[key] = RouteTree()
+        tree.setdefault(path, query, BodyIndex).add(body_match, payload)
+
+    def resolve(self, method: str, netloc: str, path: str, query: str = "",
+                body: Optional[RequestBody] = None) -> Optional[RouteMatch]:
+        if body is None:
+            body = RequestBody(b"")
+        select = body.select
+        method = method.upper()
+        tree = self.trees.get((method, netloc.lower()))
+        if tree is not None:
+            found = tree.resolve(path, query, select)
+            if found is not None:
+                return found
+        tree = self.trees.get((method, ANY_HOST))
+        if tree is not None:
+            return tree.resolve(path, query, select)
+        return None
+
+    def __len__(self) -> int:
+        return sum(tree.size for tree in self.trees.values())
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from addon_logging import logger
+
+# 规则命中统计的旁路文件，不写入 config.json
+# （多worker模式下每个worker一个文件，如 data/rule_hits.w1.json）
+RULE_HITS_FILE = "data/rule_hits.json"
+
+# 规则类型，与 config.json 中的列表名一致
+KIND_API = "apis"
+KIND_DOWNLOAD = "file_downloads"
+KIND_MAPPING = "request_mappings"
+RULE_KINDS = (KIND_API, KIND_DOWNLOAD, KIND_MAPPING)
+
+
+class RuleHitCounter:
+    """按规则ID统计命中次数和最后命中时间
+
+    请求处理中只更新内存中的计数，后台线程每隔 interval 秒在有变化时
+    把累计值原子写入旁路文件。启动时读取文件中已有的累计值，重启后继续累加。
+    """
+
+    def __init__(self, hits_file: str = RULE_HITS_FILE, interval: float = 10.0):
+        self.hits_file = hits_file
+        self.interval = interval
+        # 规则类型 -> 规则ID -> [命中次数, 最后命中时间]
+        self._hits: Dict[str, Dict[str, List[float]]] = {kind: {} for kind in RULE_KINDS}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def hit(self, kind: str, rule_id: Optional[str]):
+        if not rule_id:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._hits[kind].get(rule_id)
+            if entry is None:
+                self._hits[kind][rule_id] = [1, now]
+            else:
+                entry[0] += 1
+                entry[1] = now
+            self._dirty = True
+
+    def load(self):
+        """读取旁路文件中已有的累计值"""
+        try:
+            with open(self.hits_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("rule_hits", f"读取规则命中统计失败，重新开始统计: {e}")
+            return
+
+        with self._lock:
+            for kind in RULE_KINDS:
+                hits = self._hits[kind]
+                for rule_id, stats in (data.get(kind) or {}).items():
+                    entry = hits.setdefault(rule_id, [0, None])
+                    entry[0] += stats.get('hits', 0)
+                    last_hit = stats.get('last_hit')
+                    if last_hit is not None and (entry[1] is None or last_hit > entry[1]):
+                        entry[1] = last_hit
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = {
+                kind: {rule_id: {'hits': entry[0], 'last_hit': entry[1]} for rule_id, entry in hits.items()}
+                for kind, hits in self._hits.items()
+            }
+            self._dirty = False
+        data['updated_at'] = time.time()
+        return data
+
+    def flush(self):
+        """有新的命中时把累计值原子写入旁路文件"""
+        if not self._dirty:
+            return
+        data = self.snapshot()
+        os.makedirs(os.path.dirname(self.hits_file) or '.', exist_ok=True)
+        tmp_file = f"{self.hits_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, self.hits_file)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("rule_hits", f"写入规则命中统计失败: {e}")
+
+    def start(self):
+        """读取已有统计并启动后台写入线程"""
+        if self._thread is not None:
+            return
+        self.load()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="rule-hits", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台写入线程，并写入最后一次统计"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("rule_hits", f"写入规则命中统计失败: {e}")
+
+    def configure(self, interval: float):
+        self.interval = max(1.0, interval)
@@ -0,0 +1,268 @@
+import re
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+# 默认编译标志（str模式下为re.UNICODE），带有其他全局标志的模式不能安全地合并
+_DEFAULT_FLAGS = re.compile('').flags
+_BACKREF_RE = re.compile(r'\\[1-9]|\(\?P[=<]')
+_QUANTIFIER_RE = re.compile(r'\{\d*,?\d*\}')
+# \x \u \U 转义之后的十六进制位数
+_HEX_ESCAPE_LENGTHS = {'x': 2, 'u': 4, 'U': 8}
+
+
+def extract_required_literal(pattern: str) -> str:
+    """提取正则表达式任意匹配都必须包含的最长字面量子串
+
+    只做保守分析：遇到分支、字符类、分组、转义类等一律截断，
+    无法确定时返回空字符串（表示不能用字面量过滤）。
+    """
+    if '|' in pattern:
+        return ''
+
+    runs = []
+    current = []
+    i = 0
+    length = len(pattern)
+
+    def cut():
+        if current:
+            runs.append(''.join(current))
+            current.clear()
+
+    while i < length:
+        char = pattern[i]
+        if char == '\\':
+            if i + 1 >= length:
+                break
+            escaped = pattern[i + 1]
+            i += 2
+            if escaped.isalnum():
+                # \d \w \b \1 \x41 等都不是普通字面量，多字符的转义整体跳过
+                cut()
+                if escaped in _HEX_ESCAPE_LENGTHS:
+                    i += _HEX_ESCAPE_LENGTHS[escaped]
+                elif escaped == 'N':
+                    end = pattern.find('}', i)
+                    i = length if end == -1 else end + 1
+                elif escaped.isdigit():
+                    # 八进制转义和分组引用，多跳过的数字只会让字面量变短
+                    while i < length and pattern[i].isdigit():
+                        i += 1
+            else:
+                current.append(escaped)
+        elif char == '[':
+            cut()
+            i += 1
+            if i < length and pattern[i] == '^':
+                i += 1
+            if i < length and pattern[i] == ']':
+                i += 1
+            while i < length and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif char == '(':
+            # 分组内容可能是可选的，整体跳过
+            cut()
+            depth = 0
+            while i < length:
+                if pattern[i] == '\\':
+                    i += 2
+                    continue
+                if pattern[i] == '(':
+                    depth += 1
+                elif pattern[i] == ')':
+                    depth -= 1
+                    if depth == 0:
+                        i += 1
+                        break
+                i += 1
+        elif char in '*?{':
+            # 量词使前一个字符变为可选
+            if current:
+                current.pop()
+            cut()
+            if char == '{':
+                quantifier = _QUANTIFIER_RE.match(pattern, i)
+                i = quantifier.end() if quantifier else i + 1
+            else:
+                i += 1
+        elif char == '+':
+            # 前一个字符至少出现一次，但之后不再连续
+            cut()
+            i += 1
+        elif char in '.^$)':
+            cut()
+            i += 1
+        else:
+            current.append(char)
+            i += 1
+    cut()
+
+    return max(runs, key=len) if runs else ''
+
+
+class CompiledPattern:
+    """预编译的URL匹配模式
+
+    与原先的 match_url_pattern 语义一致：合法的正则表达式用 re.search 匹配，
+    不合法的模式退化为子串匹配。
+    """
+
+    __slots__ = ('pattern', 'regex', 'required')
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.regex: Optional[re.Pattern] = None
+        try:
+            regex = re.compile(pattern)
+        except re.error:
+            # 无效的正则表达式按普通字符串匹配
+            self.required = pattern
+            return
+
+        if not any(char in pattern for char in '.^$*+?{}[]\\|()'):
+            # 不含元字符的模式，子串匹配与正则匹配等价
+            self.required = pattern
+        elif regex.flags != _DEFAULT_FLAGS:
+            self.regex = regex
+            self.required = ''
+        else:
+            self.regex = regex
+            self.required = extract_required_literal(pattern)
+
+    @property
+    def is_literal(self) -> bool:
+        return self.regex is None
+
+    def matches(self, url: str) -> bool:
+        if self.regex is None:
+            return self.pattern in url
+        return self.regex.search(url) is not None
+
+    def alternation_source(self) -> Optional[str]:
+        """返回可以合并进组合正则的子表达式，不能安全合并时返回None"""
+        if self.regex is None:
+            return re.escape(self.pattern)
+        if self.regex.flags != _DEFAULT_FLAGS or _BACKREF_RE.search(self.pattern):
+            return None
+        return f"(?:{self.pattern})"
+
+
+class LiteralAutomaton:
+    """Aho-Corasick自动机，一次扫描找出文本中出现的全部字面量"""
+
+    def __init__(self, literals: Sequence[str]):
+        self._goto: List[dict] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+
+        for index, literal in enumerate(literals):
+            node = 0
+            for char in literal:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                node = next_node
+            self._output[node] = self._output[node] + (index,)
+
+        # 广度优先构建失败指针
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def search(self, text: str) -> set:
+        """返回文本中出现的字面量下标集合"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+class RuleMatcher:
+    """按配置快照预编译的规则匹配器
+
+    - 所有模式合并成一个组合正则，未命中任何规则的请求只需一次扫描即可返回
+    - 每条规则提取必需的字面量，用Aho-Corasick自动机一次找出候选规则
+    - 候选规则按原配置顺序逐条确认，保证与逐条 re.search 的结果和优先级一致
+    """
+
+    def __init__(self, entries: Sequence[Tuple[str, Any]]):
+        self.entries: List[Tuple[CompiledPattern, Any]] = [
+            (CompiledPattern(pattern), payload) for pattern, payload in entries
+        ]
+
+        # 建立字面量索引
+        literal_ids = {}
+        self._rules_by_literal: List[List[int]] = []
+        self._always: List[int] = []
+        for index, (compiled, _) in enumerate(self.entries):
+            if not compiled.required:
+                self._always.append(index)
+                continue
+            literal_id = literal_ids.get(compiled.required)
+            if literal_id is None:
+                literal_id = len(self._rules_by_literal)
+                literal_ids[compiled.required] = literal_id
+                self._rules_by_literal.append([])
+            self._rules_by_literal[literal_id].append(index)
+        self._automaton = LiteralAutomaton(list(literal_ids)) if literal_ids else None
+
+        self._prefilter = self._build_prefilter()
+
+    def _build_prefilter(self) -> Optional[re.Pattern]:
+        if not self.entries:
+            return None
+        sources = []
+        for compiled, _ in self.entries:
+            source = compiled.alternation_source()
+            if source is None:
+                return None
+            sources.append(source)
+        try:
+            return re.compile('|'.join(sources))
+        except (re.error, RecursionError, OverflowError):
+            return None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def iter_matches(self, url: str) -> Iterator[Any]:
+        """按配置顺序依次返回匹配URL的规则"""
+        if not self.entries:
+            return
+        if self._prefilter is not None and self._prefilter.search(url) is None:
+            return
+
+        if self._automaton is not None:
+            candidates = list(self._always)
+            for literal_id in self._automaton.search(url):
+                candidates.extend(self._rules_by_literal[literal_id])
+            candidates.sort()
+        else:
+            candidates = self._always
+
+        for index in candidates:
+            compiled, payload = self.entries[index]
+            if compiled.is_literal or compiled.matches(url):
+                yield payload
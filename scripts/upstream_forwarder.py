@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UpstreamForwarder:
+    """请求映射的上游转发器
+
+    每个 target_host:target_port 维护一个带keep-alive连接池的Session，
+    阻塞的HTTP调用放到独立线程池中执行，mitmproxy的事件循环只需await结果，
+    某个后端变慢时不会拖住其他设备的请求。
+    """
+
+    def __init__(self, pool_size: int = 10, max_workers: int = 32,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0):
+        self.pool_size = pool_size
+        self.max_workers = max_workers
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def configure(self, pool_size: int, max_workers: int, connect_timeout: float, read_timeout: float):
+        """更新连接池和超时设置，连接池大小或线程数变化时重建"""
+        rebuild = pool_size != self.pool_size or max_workers != self.max_workers
+        self.pool_size = pool_size
+        self.max_workers = max_workers
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        if rebuild:
+            self.close()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="mapping-forward"
+                )
+            return self._executor
+
+    def _get_session(self, target: str) -> requests.Session:
+        """获取目标地址对应的Session（连接池）"""
+        session = self._sessions.get(target)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(target)
+            if session is None:
+                session = requests.Session()
+                # 转发的请求之间不能共享Cookie，保持与逐个请求时相同的行为
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                self._sessions[target] = session
+            return session
+
+    def send(self, method: str, target_host: str, target_port: int, target_url: str,
+             headers: dict, data: Optional[bytes]) -> requests.Response:
+        """同步发送请求（在线程池中执行）"""
+        session = self._get_session(f"{target_host}:{target_port}")
+        return session.request(
+            method,
+            target_url,
+            data=data,
+            headers=headers,
+            timeout=(self.connect_timeout, self.read_timeout)
+        )
+
+    async def forward(self, method: str, target_host: str, target_port: int, target_url: str,
+                      headers: dict, data: Optional[bytes]) -> requests.Response:
+        """异步转发请求，等待期间事件循环继续处理其他请求"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            self.send, method, target_host, target_port, target_url, headers, data
+        )
+
+    def close(self):
+        """关闭所有连接池和线程池"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            executor = self._executor
+            self._executor = None
+        for session in sessions:
+            session.close()
+        if executor is not None:
+            executor.shutdown(wait=False)